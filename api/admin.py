@@ -3,7 +3,7 @@ from django.contrib.admin import display
 from django.contrib.admin.models import LogEntry
 from django.contrib.auth.models import Permission
 
-from .models import FlouciApp
+from .models import FlouciApp, ImageUpload
 
 
 class FlouciAppAdmin(admin.ModelAdmin):
@@ -27,6 +27,31 @@ class FlouciAppAdmin(admin.ModelAdmin):
     )
     list_filter = ("test", "status", "active", "deleted", "date_created")
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        obj.invalidate_credentials_cache(
+            public_token=form.initial.get("public_token"), private_token=form.initial.get("private_token")
+        )
+
+    def delete_model(self, request, obj):
+        obj.invalidate_credentials_cache()
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            obj.invalidate_credentials_cache()
+        super().delete_queryset(request, queryset)
+
+
+class ImageUploadAdmin(admin.ModelAdmin):
+    list_display = ("id", "app", "status", "attempts", "next_attempt_at", "time_created", "time_modified")
+    raw_id_fields = ["app"]
+    exclude = ["image_data"]
+    search_fields = ("app__app_id", "app__name")
+    list_filter = ("status", "time_created")
+    readonly_fields = ("time_created", "time_modified")
+    ordering = ("-time_created",)
+
 
 class LogEntryAdmin(admin.ModelAdmin):
     date_hierarchy = "action_time"
@@ -56,3 +81,4 @@ admin.site.site_header = "Django Developer Api"
 admin.site.register(LogEntry, LogEntryAdmin)
 
 admin.site.register(FlouciApp, FlouciAppAdmin)
+admin.site.register(ImageUpload, ImageUploadAdmin)
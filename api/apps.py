@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        from rest_framework_api_key.models import APIKey
+
+        from utils.api_keys_manager import invalidate_api_key_cache
+
+        post_save.connect(invalidate_api_key_cache, sender=APIKey, dispatch_uid="api_key_cache_save")
+        post_delete.connect(invalidate_api_key_cache, sender=APIKey, dispatch_uid="api_key_cache_delete")
+
+        if settings.METRICS_ENABLED:
+            from utils.metrics import install_query_counter
+
+            connection_created.connect(install_query_counter, dispatch_uid="metrics_query_counter")
@@ -0,0 +1,152 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from api.models import FlouciApp, ImageUpload
+from settings.settings import (
+    IMAGE_UPLOAD_BACKOFF_BASE,
+    IMAGE_UPLOAD_MAX_ATTEMPTS,
+    IMAGE_VARIANT_SIZES,
+)
+from utils.gcs_client import GCSClient
+from utils.image_helper import render_image_variants
+
+logger = logging.getLogger(__name__)
+
+Status = ImageUpload.UploadStatus
+
+
+class LeaseLost(Exception):
+    """The upload outlived its lease and may have been claimed again, its worker must leave it."""
+
+
+class ImageUploadWorker:
+    """
+    Resizes the pending app images to IMAGE_VARIANT_SIZES and uploads every variant to GCS, the largest one becomes
+    the image_url of the app. Resizing is CPU bound: run more worker processes rather than threads, the claimed
+    rows are skipped by the other workers.
+
+    The variants of an app always have the same object names, so the uploads of an app are processed one at a time
+    and only the latest one: an older image can not overwrite a newer one.
+    """
+
+    def __init__(
+        self,
+        sizes=IMAGE_VARIANT_SIZES,
+        max_attempts=IMAGE_UPLOAD_MAX_ATTEMPTS,
+        backoff_base=IMAGE_UPLOAD_BACKOFF_BASE,
+        lease=60,
+    ):
+        self.sizes = sizes
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        # Claimed rows are hidden from other workers for this long, a crashed worker's rows are retried after
+        self.lease = timedelta(seconds=lease)
+
+    def claim(self):
+        """
+        Lease the next due upload, PENDING or PROCESSING with an expired lease (its worker died). The apps with an
+        upload under a live lease are skipped, the older uploads of the claimed app are superseded.
+        """
+        now = timezone.now()
+        statuses = (Status.PENDING, Status.PROCESSING)
+        leased = ImageUpload.objects.filter(app=OuterRef("app"), status=Status.PROCESSING, next_attempt_at__gt=now)
+        newer = ImageUpload.objects.filter(app=OuterRef("app"), id__gt=OuterRef("id"))
+        with transaction.atomic():
+            upload = (
+                ImageUpload.objects.select_for_update(skip_locked=True)
+                .select_related("app")
+                .filter(status__in=statuses, next_attempt_at__lte=now)
+                .exclude(Exists(leased))
+                .exclude(Exists(newer))
+                .order_by("next_attempt_at")
+                .first()
+            )
+            if upload is not None:
+                ImageUpload.objects.filter(app_id=upload.app_id, id__lt=upload.id, status__in=statuses).update(
+                    status=Status.SUPERSEDED, image_data=b"", time_modified=now
+                )
+                upload.status, upload.next_attempt_at = Status.PROCESSING, now + self.lease
+                ImageUpload.objects.filter(id=upload.id).update(
+                    status=upload.status, next_attempt_at=upload.next_attempt_at
+                )
+        return upload
+
+    @staticmethod
+    def leased(upload):
+        """The upload row, as long as the lease taken by claim() holds."""
+        return ImageUpload.objects.filter(
+            id=upload.id, status=Status.PROCESSING, next_attempt_at=upload.next_attempt_at
+        )
+
+    def process(self, upload):
+        variants = render_image_variants(bytes(upload.image_data), self.sizes)
+        urls = {}
+        for size in self.sizes:
+            if not self.leased(upload).exists():
+                raise LeaseLost(f"Image upload {upload.id} of app {upload.app.app_id} outlived its lease")
+            urls[size] = GCSClient.upload_image(
+                variants[size], upload.app.image_variant_name(size), upload.extension, upload.content_type
+            )
+        return urls[max(self.sizes)]
+
+    def record_success(self, upload, image_url):
+        with transaction.atomic():
+            updated = self.leased(upload).update(
+                status=Status.DONE,
+                attempts=upload.attempts + 1,
+                image_data=b"",
+                last_error=None,
+                time_modified=timezone.now(),
+            )
+            if not updated:
+                logger.warning(f"Image upload {upload.id} of app {upload.app.app_id} outlived its lease")
+                return
+            FlouciApp.objects.filter(id=upload.app_id).update(image_url=image_url)
+        upload.app.invalidate_credentials_cache()
+
+    def record_failure(self, upload, error):
+        attempts = upload.attempts + 1
+        if ImageUpload.objects.filter(app_id=upload.app_id, id__gt=upload.id).exists():
+            logger.warning(f"Image upload {upload.id} of app {upload.app.app_id} failed and was superseded: {error}")
+            fields = {"status": Status.SUPERSEDED, "image_data": b""}
+        elif attempts >= self.max_attempts:
+            logger.error(
+                f"Image upload {upload.id} of app {upload.app.app_id} failed after {attempts} attempts: {error}"
+            )
+            fields = {"status": Status.FAILED, "image_data": b""}
+        else:
+            logger.warning(f"Image upload {upload.id} of app {upload.app.app_id} failed (attempt {attempts}): {error}")
+            delay = timedelta(seconds=self.backoff_base * 2 ** (attempts - 1))
+            fields = {"status": Status.PENDING, "next_attempt_at": timezone.now() + delay}
+        self.leased(upload).update(
+            attempts=attempts, last_error=str(error)[:2000], time_modified=timezone.now(), **fields
+        )
+
+    def run(self, poll_interval=1.0, once=False, should_stop=lambda: False):
+        """
+        Process the pending uploads until `should_stop()` is true, or until none is due when `once` is set.
+        Returns the number of processed uploads.
+        """
+        processed = 0
+        while not should_stop():
+            upload = self.claim()
+            if upload is None:
+                if once:
+                    break
+                time.sleep(poll_interval)
+                continue
+            try:
+                image_url = self.process(upload)
+            except LeaseLost as e:
+                logger.warning(str(e))
+            except Exception as e:
+                self.record_failure(upload, e)
+            else:
+                self.record_success(upload, image_url)
+            processed += 1
+        return processed
@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, override_settings
+from django.urls import reverse
+
+
+class Command(BaseCommand):
+    help = "Compare the per request cost of the full middleware stack and of the lean API stack under ASGI"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Requests per round")
+        parser.add_argument("--rounds", type=int, default=5)
+        parser.add_argument("--url", default=None, help="Path to request, the partner balance route by default")
+
+    def handle(self, *args, **options):
+        url = options["url"] or reverse("partner_balance")
+        count = options["requests"]
+        routed = settings.MIDDLEWARE.index("utils.middleware.PathRoutedMiddleware")
+        full_stack = settings.MIDDLEWARE[:routed] + settings.BROWSER_MIDDLEWARE + settings.MIDDLEWARE[routed + 1 :]
+
+        full_costs, lean_costs = [], []
+        # Alternate the stacks and keep the best round of each, so that neither pays for a slower machine phase
+        for _ in range(options["rounds"]):
+            with override_settings(MIDDLEWARE=full_stack, ALLOWED_HOSTS=["*"]):
+                full_costs.append(asyncio.run(self.measure(url, count)))
+            with override_settings(ALLOWED_HOSTS=["*"]):
+                lean_costs.append(asyncio.run(self.measure(url, count)))
+        full_cost, lean_cost = min(full_costs), min(lean_costs)
+
+        self.stdout.write(f"{url}, best of {options['rounds']} rounds of {count} requests")
+        self.stdout.write(f"  full middleware stack: {full_cost:.1f} us/request")
+        self.stdout.write(f"  lean API stack:        {lean_cost:.1f} us/request")
+        self.stdout.write(
+            self.style.SUCCESS(f"  saved {full_cost - lean_cost:.1f} us/request ({1 - lean_cost / full_cost:.0%})")
+        )
+
+    async def measure(self, url, count):
+        await cache.aclear()  # the throttle histories would otherwise grow from one round to the next
+        client = AsyncClient()
+        for _ in range(10):  # warm up the url resolver and the imports
+            await client.get(url)
+        start = time.perf_counter()
+        for _ in range(count):
+            await client.get(url)
+        return (time.perf_counter() - start) / count * 1_000_000
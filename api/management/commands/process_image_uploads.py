@@ -0,0 +1,28 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from api.image_upload_worker import ImageUploadWorker
+
+
+class Command(BaseCommand):
+    help = "Resize and upload the pending app images"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit once no upload is due")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between two queue polls")
+
+    def handle(self, *args, **options):
+        stopping = []
+
+        def stop(signum, frame):
+            self.stdout.write("Stopping after the upload in progress...")
+            stopping.append(signum)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        processed = ImageUploadWorker().run(
+            poll_interval=options["poll_interval"], once=options["once"], should_stop=lambda: bool(stopping)
+        )
+        self.stdout.write(f"Processed {processed} image uploads")
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.20 on 2026-10-18 01:47
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_alter_flouciapp_tracking_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImageUpload",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("image_data", models.BinaryField(blank=True, default=b"")),
+                ("extension", models.CharField(max_length=10)),
+                ("content_type", models.CharField(max_length=50)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "Pending"),
+                            ("DONE", "Done"),
+                            ("FAILED", "Failed"),
+                        ],
+                        default="PENDING",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("last_error", models.TextField(blank=True, null=True)),
+                ("time_created", models.DateTimeField(auto_now_add=True)),
+                ("time_modified", models.DateTimeField(auto_now=True)),
+                (
+                    "app",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="image_uploads",
+                        to="api.flouciapp",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "image_upload",
+                "indexes": [
+                    models.Index(
+                        fields=["status", "next_attempt_at"],
+                        name="image_upload_status_next",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.20 on 2026-10-18 02:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_imageupload"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="imageupload",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("PROCESSING", "Processing"),
+                    ("DONE", "Done"),
+                    ("FAILED", "Failed"),
+                    ("SUPERSEDED", "Superseded"),
+                ],
+                default="PENDING",
+                max_length=20,
+            ),
+        ),
+    ]
@@ -2,12 +2,36 @@ import logging
 import uuid
 from datetime import datetime
 
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 
+from settings.settings import (
+    APP_CREDENTIALS_CACHE_TIMEOUT,
+    APP_CREDENTIALS_LOCAL_CACHE_SIZE,
+    APP_CREDENTIALS_LOCAL_CACHE_TIMEOUT,
+    APP_CREDENTIALS_NEGATIVE_CACHE_TIMEOUT,
+    IMAGE_VARIANT_SIZES,
+)
+from utils.cache_helper import TwoTierCache
 from utils.gcs_client import GCSClient
 
 logger = logging.getLogger(__name__)
 
+app_credentials_cache = TwoTierCache(
+    "app_credentials",
+    timeout=APP_CREDENTIALS_CACHE_TIMEOUT,
+    local_timeout=APP_CREDENTIALS_LOCAL_CACHE_TIMEOUT,
+    local_maxsize=APP_CREDENTIALS_LOCAL_CACHE_SIZE,
+    negative_timeout=APP_CREDENTIALS_NEGATIVE_CACHE_TIMEOUT,
+)
+app_public_token_cache = TwoTierCache(
+    "app_public_token",
+    timeout=APP_CREDENTIALS_CACHE_TIMEOUT,
+    local_timeout=APP_CREDENTIALS_LOCAL_CACHE_TIMEOUT,
+    local_maxsize=APP_CREDENTIALS_LOCAL_CACHE_SIZE,
+    negative_timeout=APP_CREDENTIALS_NEGATIVE_CACHE_TIMEOUT,
+)
+
 
 class App(models.Model):
     class AppStatus(models.TextChoices):
@@ -103,6 +127,38 @@ class FlouciApp(models.Model):
     def __str__(self):
         return f"{self.name} - {self.merchant_id}"
 
+    @classmethod
+    def get_active_app_by_credentials(cls, public_token, private_token):
+        """Cached lookup of an active app by its public/private token pair, None if there is no match."""
+        public_token, private_token = str(uuid.UUID(str(public_token))), str(uuid.UUID(str(private_token)))
+        return app_credentials_cache.get_or_load(
+            (public_token, private_token),
+            lambda: cls.objects.filter(public_token=public_token, private_token=private_token, active=True).first(),
+        )
+
+    @classmethod
+    def get_app_by_public_token(cls, public_token):
+        """Cached lookup of an app (active or not) by its public token, None if there is no match."""
+        public_token = str(uuid.UUID(str(public_token)))
+        return app_public_token_cache.get_or_load(
+            (public_token,), lambda: cls.objects.filter(public_token=public_token).first()
+        )
+
+    def invalidate_credentials_cache(self, public_token=None, private_token=None):
+        """
+        Drop the cached lookups of this app, call it after any change to the app.
+        Pass the previous tokens when they have just been changed so the old pair stops resolving as well.
+        """
+        for public, private in {
+            (self.public_token, self.private_token),
+            (public_token or self.public_token, private_token or self.private_token),
+        }:
+            if public is None:
+                continue
+            app_public_token_cache.invalidate(str(public))
+            if private is not None:
+                app_credentials_cache.invalidate(str(public), str(private))
+
     def get_app_details(self):
         return {
             "id": self.id,
@@ -137,23 +193,75 @@ class FlouciApp(models.Model):
         }
 
     def revoke_keys(self):
+        previous_private_token = self.private_token
         self.private_token = uuid.uuid4()
         self.revoke_number += 1
         self.last_revoke_date = datetime.now()
         self.save(update_fields=["private_token", "revoke_number", "last_revoke_date"])
+        self.invalidate_credentials_cache(private_token=previous_private_token)
 
     def update_image(self, image_info):
+        """
+        Schedule the resizing and upload of a new image, returns the pending ImageUpload.
+        image_url is updated by the process_image_uploads command once the upload is done.
+        """
         if not isinstance(image_info, dict):
             logger.warning(f"Invalid image_info format: expected dict, got {type(image_info)}")
-            return
-        image_url = GCSClient().save_image(
-            image_b64=image_info["image_data"],
-            image_name=str(self.app_id),
-            extension=image_info["extension"],
-            content_type=image_info["content_type"],
-        )
-        if not image_url:
-            logger.warning(f"Failed to upload image for app {self.app_id}")
-            return
-        self.image_url = image_url
-        self.save(update_fields=["image_url"])
+            return None
+        return ImageUpload.enqueue(self, image_info)
+
+    def image_variant_name(self, size):
+        return f"{self.app_id}_{size}"
+
+
+class ImageUpload(models.Model):
+    """
+    Queue of the app images to resize and upload to GCS, processed out of the request thread
+    by the `process_image_uploads` management command.
+    """
+
+    class UploadStatus(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        PROCESSING = "PROCESSING", "Processing"  # leased by a worker until next_attempt_at
+        DONE = "DONE", "Done"
+        FAILED = "FAILED", "Failed"
+        SUPERSEDED = "SUPERSEDED", "Superseded"  # a newer image of the app was sent before it was uploaded
+
+    id = models.BigAutoField(primary_key=True, serialize=False)
+    app = models.ForeignKey(FlouciApp, on_delete=models.CASCADE, related_name="image_uploads")
+    image_data = models.BinaryField(blank=True, default=b"")  # decoded original, emptied once processed
+    extension = models.CharField(max_length=10)
+    content_type = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=UploadStatus.choices, default=UploadStatus.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+    time_created = models.DateTimeField(auto_now_add=True)
+    time_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "image_upload"
+        indexes = [models.Index(fields=["status", "next_attempt_at"], name="image_upload_status_next")]
+
+    def __str__(self):
+        return f"{self.app_id} ({self.status})"
+
+    @classmethod
+    def enqueue(cls, app, image_info):
+        with transaction.atomic():
+            # Only the last image sent for an app is worth uploading. An upload already leased by a worker is left
+            # to it, the workers only take the new one once it is over
+            cls.objects.filter(app=app, status=cls.UploadStatus.PENDING).update(
+                status=cls.UploadStatus.SUPERSEDED, image_data=b"", time_modified=timezone.now()
+            )
+            return cls.objects.create(
+                app=app,
+                image_data=image_info["image_bytes"],
+                extension=image_info["extension"],
+                content_type=image_info["content_type"],
+            )
+
+    @property
+    def image_url(self):
+        """Url the image of the app will have once uploaded."""
+        return GCSClient.image_url(self.app.image_variant_name(max(IMAGE_VARIANT_SIZES)), self.extension)
@@ -3,7 +3,7 @@ import logging
 import uuid
 from hashlib import sha256
 
-from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
+from django.core.exceptions import PermissionDenied
 from rest_framework.permissions import BasePermission
 
 from api.models import FlouciApp
@@ -54,9 +54,8 @@ class HasValidAppCredentials(BasePermission):
             uuid.UUID(app_secret)
         except ValueError:
             return False
-        try:
-            application = FlouciApp.objects.get(public_token=app_token, private_token=app_secret, active=True)
-        except ObjectDoesNotExist:
+        application = FlouciApp.get_active_app_by_credentials(public_token=app_token, private_token=app_secret)
+        if application is None:
             return False
         request.application = application
         return True
@@ -82,16 +81,10 @@ class BaseAppCredentialPermission(BasePermission):
         except (ValueError, IndexError):
             return False
 
-        try:
-
-            application = FlouciApp.objects.get(
-                public_token=public_token,
-                private_token=private_token,
-                active=True,
-            )
-            if self.requires_partner_access and not application.has_partner_access:
-                return False
-        except ObjectDoesNotExist:
+        application = FlouciApp.get_active_app_by_credentials(public_token=public_token, private_token=private_token)
+        if application is None:
+            return False
+        if self.requires_partner_access and not application.has_partner_access:
             return False
         request.application = application
         return True
@@ -123,14 +116,8 @@ class IsValidPartnerUser(BasePermission):
             phone_number = request.data.get("phone_number")
 
         merchant_id = request.application.merchant_id
-        try:
-            account = LinkedAccount.objects.get(
-                phone_number=phone_number,
-                partner_tracking_id=application_tracking_id,
-                merchant_id=merchant_id,
-                is_active=True,
-            )
-        except LinkedAccount.DoesNotExist:
+        account = LinkedAccount.get_by_partner_tracking_id(application_tracking_id, merchant_id)
+        if account is None or not account.is_active or account.phone_number != phone_number:
             raise PermissionDenied({"success": False, "message": "Invalid credentials"})
         request.account = account
         return True
@@ -152,11 +139,8 @@ class IsPartnerAuthenticated(BasePermission):
         verified, data = verify_backend_token(token, is_token_partner=True)
         if not verified:
             return False
-        try:
-            linked_account = LinkedAccount.objects.get(
-                partner_tracking_id=data.get("partner_tracking_id"), merchant_id=data.get("mid")
-            )
-        except LinkedAccount.DoesNotExist:
+        linked_account = LinkedAccount.get_by_partner_tracking_id(data.get("partner_tracking_id"), data.get("mid"))
+        if linked_account is None:
             return False
         request.account = linked_account
         request.partner_tracking_id = data.get("partner_tracking_id")
@@ -210,9 +194,8 @@ class TokenPermission(BasePermission):
             uuid.UUID(token)
         except ValueError:
             return False
-        try:
-            app = FlouciApp.objects.get(public_token=token)
-        except FlouciApp.DoesNotExist:
+        app = FlouciApp.get_app_by_public_token(token)
+        if app is None:
             return False
         request.application = app
         return True
@@ -2,7 +2,7 @@ from rest_framework import serializers
 
 from api.enum import Currency
 from api.models import FlouciApp
-from utils.image_helper import extract_base64_image_data
+from utils.image_helper import InvalidImage, decode_base64_image
 from utils.validators import validate_base64_image
 
 
@@ -28,9 +28,14 @@ class Base64ImageField(serializers.CharField):
 
     def to_internal_value(self, value):
         validate_base64_image(value)
-        image_data, extension, content_type = extract_base64_image_data(value)
+        # The declared type is not trusted, the image bytes tell what the image really is
+        bare_img64 = value.split(",")[1]
+        try:
+            image_bytes, extension, content_type = decode_base64_image(bare_img64)
+        except InvalidImage as e:
+            raise serializers.ValidationError(str(e))
         return {
-            "image_data": image_data,
+            "image_bytes": image_bytes,
             "extension": extension,
             "content_type": content_type,
         }
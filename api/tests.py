@@ -1,15 +1,61 @@
+import asyncio
+import base64
+import datetime
+import io
 import json
 import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
 import uuid
-from unittest.mock import patch
-
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock, patch
+from urllib.parse import urlsplit
+
+import httpx
+import jwt
+import requests
+from asgiref.sync import async_to_sync
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from PIL import Image
+from prometheus_client import REGISTRY
 from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient, APITestCase, RequestsClient
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework_api_key.models import APIKey
 
-from api.models import FlouciApp
-from utils.api_keys_manager import ApiKeyServicesNames
+from api.image_upload_worker import ImageUploadWorker
+from api.models import FlouciApp, ImageUpload
+from api.views_public import (
+    CheckSendMoneyStatusView,
+    GeneratePaymentView,
+    VerifyPaymentView,
+    payment_status_cache,
+    payment_status_cache_timeout,
+)
+from utils.api_keys_manager import ApiKeyServicesNames, api_key_cache
+from utils.backend_client import (
+    AsyncFlouciBackendClient,
+    FlouciBackendClient,
+    endpoint_guards,
+)
+from utils.circuit_breaker import Bulkhead, BulkheadFullError
+from utils.http_session import PooledSession
+from utils.json_helper import ORJSONParser, ORJSONRenderer, dumps, loads
+from utils.jwt_helpers import verified_tokens_cache, verify_backend_token
+from utils.token_based_requests_manager import TokenBasedRequests
 
 client = RequestsClient()
 
@@ -184,6 +230,45 @@ class RevokeDeveloperAppViewTest(BaseCreateDeveloperApp):
         self.assertEqual(response.status_code, 404)
         self.assertEqual(data["detail"], "App not found.")
 
+    @patch("utils.backend_client.AsyncFlouciBackendClient.check_payment")
+    def test_revoked_credentials_are_rejected(self, mock_check_payment):
+        mock_check_payment.return_value = {"success": True, "status_code": 200}
+        verify_url = reverse("verify_payment", kwargs={"payment_id": "payment"})
+        app_headers = {"Authorization": f"Bearer {self.app.public_token}:{self.app.private_token}"}
+        self.assertEqual(self.client.get(verify_url, headers=app_headers).status_code, 200)
+
+        self.client.get(
+            reverse("revoke_developer_app", kwargs={"id": self.app.id}),
+            headers={"AUTHORIZATION": f"Api-Key {self.api_key}"},
+        )
+
+        self.assertEqual(self.client.get(verify_url, headers=app_headers).status_code, 403)
+
+
+class TestAppCredentialsCache(BaseCreateDeveloperApp):
+    def test_lookup_is_served_from_cache(self):
+        app = FlouciApp.get_active_app_by_credentials(self.app.public_token, self.app.private_token)
+        self.assertEqual(app.id, self.app.id)
+        with self.assertNumQueries(0):
+            cached_app = FlouciApp.get_active_app_by_credentials(self.app.public_token, self.app.private_token)
+        self.assertEqual(cached_app.id, self.app.id)
+        self.assertIsNot(cached_app, app)
+
+    def test_unknown_credentials_are_negatively_cached(self):
+        public_token, private_token = uuid.uuid4(), uuid.uuid4()
+        self.assertIsNone(FlouciApp.get_active_app_by_credentials(public_token, private_token))
+        with self.assertNumQueries(0):
+            self.assertIsNone(FlouciApp.get_active_app_by_credentials(public_token, private_token))
+
+    def test_disabled_app_is_invalidated(self):
+        FlouciApp.get_active_app_by_credentials(self.app.public_token, self.app.private_token)
+        response = self.client.get(
+            reverse("enable_developer_app", kwargs={"id": self.app.id}),
+            headers={"AUTHORIZATION": f"Api-Key {self.api_key}"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(FlouciApp.get_active_app_by_credentials(self.app.public_token, self.app.private_token))
+
 
 class TestV2GeneratePaymentView(BaseCreateDeveloperApp):
     def setUp(self):
@@ -206,7 +291,7 @@ class TestV2GeneratePaymentView(BaseCreateDeveloperApp):
             "status_code": 200,
         }
 
-    @patch("utils.backend_client.FlouciBackendClient.generate_payment_page")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.generate_payment_page")
     def test_generate_payment_success(self, mock_generate_payment):
         mock_generate_payment.return_value = self.mock_generate_payment
         response = self.client.post(
@@ -252,7 +337,7 @@ class TestV2GeneratePaymentView(BaseCreateDeveloperApp):
         self.assertEqual(response.status_code, 400)
         self.assertIn("amount", response.json())
 
-    @patch("utils.backend_client.FlouciBackendClient.generate_payment_page")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.generate_payment_page")
     def test_backend_failure(self, mock_generate_payment):
         mock_generate_payment.return_value = {
             "success": False,
@@ -273,7 +358,7 @@ class TestV2GeneratePaymentView(BaseCreateDeveloperApp):
         self.assertEqual(response.status_code, 400)
         self.assertIn("success_link", response.json())
 
-    @patch("utils.backend_client.FlouciBackendClient.generate_payment_page")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.generate_payment_page")
     def test_with_destination(self, mock_generate_payment):
         mock_generate_payment.return_value = self.mock_generate_payment
 
@@ -299,7 +384,7 @@ class TestV2GeneratePaymentView(BaseCreateDeveloperApp):
         self.assertTrue(response.json()["result"]["success"])
         self.assertEqual(response.json()["result"]["payment_id"], "jvdqMbFKTAWQSrkeqlL1Rg")
 
-    @patch("utils.backend_client.FlouciBackendClient.generate_payment_page")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.generate_payment_page")
     def test_pre_authorization(self, mock_generate_payment):
         mock_generate_payment.return_value = self.mock_generate_payment
 
@@ -320,10 +405,12 @@ class TestV2GeneratePaymentView(BaseCreateDeveloperApp):
 class TestV2VerifyPaymentView(BaseCreateDeveloperApp):
     def setUp(self):
         super().setUp()
+        cache.clear()
+        payment_status_cache.local_cache.clear()
         self.valid_headers = {"Authorization": f"Bearer {self.app.public_token}:{self.app.private_token}"}
         self.payment_id = "jvdqMbFKTAWQSrkeqlL1Rg"
 
-    @patch("utils.backend_client.FlouciBackendClient.check_payment")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.check_payment")
     def test_verify_payment_success(self, mock_check_payment):
         mock_check_payment.return_value = {
             "success": True,
@@ -361,7 +448,7 @@ class TestV2VerifyPaymentView(BaseCreateDeveloperApp):
         self.assertTrue(data["success"])
         self.assertEqual(data["result"]["status"], "SUCCESS")
 
-    @patch("utils.backend_client.FlouciBackendClient.check_payment")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.check_payment")
     def test_verify_payment_failure(self, mock_check_payment):
         mock_check_payment.return_value = {"success": False, "result": "Invalid Transaction ID", "status_code": 200}
         url = reverse("verify_payment", kwargs={"payment_id": self.payment_id})
@@ -375,6 +462,45 @@ class TestV2VerifyPaymentView(BaseCreateDeveloperApp):
         self.assertFalse(data["success"])
         self.assertIn("Invalid Transaction ID", data["result"])
 
+    @patch("utils.backend_client.AsyncFlouciBackendClient.check_payment")
+    def test_verify_payment_final_status_served_from_cache(self, mock_check_payment):
+        mock_check_payment.return_value = {"success": True, "result": {"status": "SUCCESS"}, "status_code": 200}
+        url = reverse("verify_payment", kwargs={"payment_id": self.payment_id})
+        labels = {"cache": "check_payment", "result": "local_hit"}
+        hits = REGISTRY.get_sample_value("cache_lookups_total", labels) or 0
+        for _ in range(3):
+            response = self.client.get(url, headers=self.valid_headers)
+            self.assertEqual(response.json()["result"]["status"], "SUCCESS")
+        self.assertEqual(mock_check_payment.call_count, 1)
+        self.assertEqual(REGISTRY.get_sample_value("cache_lookups_total", labels), hits + 2)
+        self.assertEqual(payment_status_cache_timeout(mock_check_payment.return_value), 24 * 3600)
+
+    @patch("utils.backend_client.AsyncFlouciBackendClient.check_payment")
+    def test_verify_payment_pending_status_cached_briefly(self, mock_check_payment):
+        mock_check_payment.return_value = {"success": True, "result": {"status": "PENDING"}, "status_code": 200}
+        url = reverse("verify_payment", kwargs={"payment_id": self.payment_id})
+        self.client.get(url, headers=self.valid_headers)
+        self.client.get(url, headers=self.valid_headers)
+        self.assertEqual(mock_check_payment.call_count, 1)
+        with patch("utils.cache_helper.time.monotonic", return_value=time.monotonic() + 3600), patch(
+            "utils.cache_helper.time.time", return_value=time.time() + 3600
+        ):
+            self.client.get(url, headers=self.valid_headers)
+        self.assertEqual(mock_check_payment.call_count, 2)
+
+    @patch("utils.backend_client.AsyncFlouciBackendClient.check_payment")
+    def test_verify_payment_errors_not_cached(self, mock_check_payment):
+        mock_check_payment.return_value = {
+            "success": False,
+            "code": 5,
+            "message": "Service indisponible",
+            "status_code": 503,
+        }
+        url = reverse("verify_payment", kwargs={"payment_id": self.payment_id})
+        self.client.get(url, headers=self.valid_headers)
+        self.client.get(url, headers=self.valid_headers)
+        self.assertEqual(mock_check_payment.call_count, 2)
+
     def test_verify_payment_invalid_token_format(self):
         url = reverse("verify_payment", kwargs={"payment_id": self.payment_id})
         response = self.client.get(
@@ -401,7 +527,7 @@ class TestV2SendMoneyView(BaseCreateDeveloperApp):
             "webhook": "https://example.com/webhook",
         }
 
-    @patch("utils.backend_client.FlouciBackendClient.developer_send_money_status")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.developer_send_money_status")
     def test_send_money_success(self, mock_send_money):
         mock_send_money.return_value = {
             "success": True,
@@ -426,7 +552,7 @@ class TestV2SendMoneyView(BaseCreateDeveloperApp):
             "Operation initiated successfully. You will receive a webhook with final confirmation.",
         )
 
-    @patch("utils.backend_client.FlouciBackendClient.developer_send_money_status")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.developer_send_money_status")
     def test_send_money_failure(self, mock_send_money):
         mock_send_money.return_value = {
             "success": False,
@@ -447,7 +573,7 @@ class TestV2SendMoneyView(BaseCreateDeveloperApp):
         self.assertEqual(data["result"]["error"], "Insufficient funds.")
         self.assertEqual(data["result"]["code"], 4)
 
-    @patch("utils.backend_client.FlouciBackendClient.developer_send_money_status")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.developer_send_money_status")
     def test_send_money_missing_required_field(self, mock_send_money):
         invalid_data = self.valid_data.copy()
         del invalid_data["amount"]
@@ -461,7 +587,7 @@ class TestV2SendMoneyView(BaseCreateDeveloperApp):
         self.assertEqual(response.status_code, 400)
         self.assertIn("amount", response.json())
 
-    @patch("utils.backend_client.FlouciBackendClient.developer_send_money_status")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.developer_send_money_status")
     def test_send_money_invalid_amount(self, mock_send_money):
         invalid_data = self.valid_data.copy()
         invalid_data["amount"] = 50
@@ -480,7 +606,7 @@ class TestV2SendMoneyView(BaseCreateDeveloperApp):
 
         self.assertEqual(response.status_code, 403)
 
-    @patch("utils.backend_client.FlouciBackendClient.developer_send_money_status")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.developer_send_money_status")
     def test_send_money_without_webhook(self, mock_send_money):
         data_without_webhook = {
             "amount": 1000,
@@ -508,7 +634,7 @@ class TestV2SendMoneyView(BaseCreateDeveloperApp):
 
         self.assertEqual(response.status_code, 403)
 
-    @patch("utils.backend_client.FlouciBackendClient.developer_send_money_status")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.developer_send_money_status")
     def test_send_money_invalid_reciver(self, mock_send_money):
         mock_send_money.return_value = {
             "success": False,
@@ -531,6 +657,64 @@ class TestV2SendMoneyView(BaseCreateDeveloperApp):
         self.assertEqual(data["result"]["error"], "User does not exist.")
         self.assertEqual(data["result"]["code"], 1)
 
+    @patch("utils.backend_client.AsyncFlouciBackendClient.developer_send_money_status")
+    def test_send_money_retry_with_idempotency_key_is_replayed(self, mock_send_money):
+        mock_send_money.return_value = {
+            "success": True,
+            "code": 0,
+            "payment_id": "47fbe6be-9b9a-4060-84ad-cb69500d1865",
+            "message": "Operation initiated successfully. You will receive a webhook with final confirmation.",
+            "status_code": 200,
+        }
+        headers = {**self.valid_headers, "Idempotency-Key": str(uuid.uuid4())}
+
+        first = self.client.post(self.url, data=self.valid_data, headers=headers)
+        retry = self.client.post(self.url, data=self.valid_data, headers=headers)
+        other = self.client.post(self.url, data=self.valid_data, headers={**headers, "Idempotency-Key": "other"})
+
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(other.status_code, 200)
+        self.assertEqual(mock_send_money.call_count, 2)
+
+    @patch("requests.Session.request", side_effect=requests.exceptions.Timeout)
+    def test_timed_out_send_money_is_not_sent_again(self, mock_request):
+        headers = {**self.valid_headers, "Idempotency-Key": str(uuid.uuid4())}
+
+        self.assertEqual(self.client.post(self.url, data=self.valid_data, headers=headers).status_code, 408)
+        retry = self.client.post(self.url, data=self.valid_data, headers=headers)
+
+        self.assertEqual(retry.status_code, 409)
+        mock_request.assert_called_once()
+
+    def test_send_money_waits_for_the_request_in_progress(self):
+        calls = []
+
+        async def slow_send_money(**kwargs):
+            calls.append(kwargs)
+            await asyncio.sleep(0.2)
+            return {"success": True, "code": 0, "payment_id": "47fbe6be", "message": "ok", "status_code": 200}
+
+        async def send_twice():
+            client = AsyncClient()
+            headers = {**self.valid_headers, "Idempotency-Key": str(uuid.uuid4())}
+            return await asyncio.gather(
+                *(
+                    client.post(self.url, self.valid_data, content_type="application/json", headers=headers)
+                    for _ in range(2)
+                )
+            )
+
+        with patch(
+            "utils.backend_client.AsyncFlouciBackendClient.developer_send_money_status", side_effect=slow_send_money
+        ):
+            responses = async_to_sync(send_twice)()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        self.assertEqual(responses[0].json(), responses[1].json())
+
 
 class TestV2CheckSendMoneyStatusView(BaseCreateDeveloperApp):
     def setUp(self):
@@ -540,7 +724,7 @@ class TestV2CheckSendMoneyStatusView(BaseCreateDeveloperApp):
         self.operation_id = uuid.uuid4()
         self.url = reverse("check_payment_status", kwargs={"operation_id": self.operation_id})
 
-    @patch("utils.backend_client.FlouciBackendClient.developer_check_send_money_status")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.developer_check_send_money_status")
     def test_check_payment_status_success(self, mock_backend):
         mock_backend.return_value = {
             "success": True,
@@ -569,7 +753,7 @@ class TestV2CheckSendMoneyStatusView(BaseCreateDeveloperApp):
         self.assertEqual(data["result"]["status"], "SUCCESS")
         self.assertEqual(data["result"]["details"]["payment_id"], str(self.operation_id))
 
-    @patch("utils.backend_client.FlouciBackendClient.developer_check_send_money_status")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.developer_check_send_money_status")
     def test_check_payment_status_backend_failure(self, mock_backend):
         mock_backend.return_value = {
             "success": False,
@@ -594,7 +778,7 @@ class TestV2CheckSendMoneyStatusView(BaseCreateDeveloperApp):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, 403)
 
-    @patch("utils.backend_client.FlouciBackendClient.developer_check_send_money_status")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.developer_check_send_money_status")
     def test_check_payment_status_user_not_allowed(self, mock_backend):
         mock_backend.return_value = {"success": False, "result": "Not allowed.", "status_code": 406}
         response = self.client.get(self.url, **self.valid_headers)
@@ -807,7 +991,7 @@ class TestV2GeneratePaymentWordpressView(BaseCreateDeveloperApp):
 
         self.url = reverse("generate_payment_wordpress")
 
-    @patch("utils.backend_client.FlouciBackendClient.generate_payment_page")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.generate_payment_page")
     def test_generate_payment_success(self, mock_generate_payment):
         mock_generate_payment.return_value = {
             "success": True,
@@ -823,7 +1007,7 @@ class TestV2GeneratePaymentWordpressView(BaseCreateDeveloperApp):
         self.assertEqual(response.data["result"]["link"], "https://flouci.test/pay/jvdqMbFKTAWQSrkeqlL1Rg")
         self.assertEqual(response.data["code"], 0)
 
-    @patch("utils.backend_client.FlouciBackendClient.generate_payment_page")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.generate_payment_page")
     def test_generate_payment_failure(self, mock_generate_payment):
         mock_generate_payment.return_value = {
             "success": False,
@@ -922,7 +1106,7 @@ class TestGeneratePaymentView(BaseCreateDeveloperApp):
             "status_code": 200,
         }
 
-    @patch("utils.backend_client.FlouciBackendClient.generate_payment_page")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.generate_payment_page")
     def test_generate_payment_success(self, mock_generate_payment):
         mock_generate_payment.return_value = self.mock_generate_payment
         response = self.client.post(
@@ -958,7 +1142,7 @@ class TestGeneratePaymentView(BaseCreateDeveloperApp):
         self.assertEqual(response.status_code, 400)
         self.assertIn("amount", response.json())
 
-    @patch("utils.backend_client.FlouciBackendClient.generate_payment_page")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.generate_payment_page")
     def test_backend_failure(self, mock_generate_payment):
         mock_generate_payment.return_value = {
             "success": False,
@@ -979,7 +1163,7 @@ class TestGeneratePaymentView(BaseCreateDeveloperApp):
         self.assertEqual(response.status_code, 400)
         self.assertIn("success_link", response.json())
 
-    @patch("utils.backend_client.FlouciBackendClient.generate_payment_page")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.generate_payment_page")
     def test_with_destination(self, mock_generate_payment):
         mock_generate_payment.return_value = self.mock_generate_payment
 
@@ -1005,7 +1189,7 @@ class TestGeneratePaymentView(BaseCreateDeveloperApp):
         self.assertTrue(response.json()["result"]["success"])
         self.assertEqual(response.json()["result"]["payment_id"], "jvdqMbFKTAWQSrkeqlL1Rg")
 
-    @patch("utils.backend_client.FlouciBackendClient.generate_payment_page")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.generate_payment_page")
     def test_pre_authorization(self, mock_generate_payment):
         mock_generate_payment.return_value = self.mock_generate_payment
 
@@ -1047,7 +1231,7 @@ class TestGeneratePaymentWordpressView(BaseCreateDeveloperApp):
 
         self.url = reverse("old_generate_payment_wordpress")
 
-    @patch("utils.backend_client.FlouciBackendClient.generate_payment_page")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.generate_payment_page")
     def test_generate_payment_success(self, mock_generate_payment):
         mock_generate_payment.return_value = {
             "success": True,
@@ -1063,7 +1247,7 @@ class TestGeneratePaymentWordpressView(BaseCreateDeveloperApp):
         self.assertEqual(response.data["result"]["link"], "https://flouci.test/pay/jvdqMbFKTAWQSrkeqlL1Rg")
         self.assertEqual(response.data["code"], 0)
 
-    @patch("utils.backend_client.FlouciBackendClient.generate_payment_page")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.generate_payment_page")
     def test_generate_payment_failure(self, mock_generate_payment):
         mock_generate_payment.return_value = {
             "success": False,
@@ -1087,13 +1271,15 @@ class TestGeneratePaymentWordpressView(BaseCreateDeveloperApp):
 class TestVerifyPaymentView(BaseCreateDeveloperApp):
     def setUp(self):
         super().setUp()
+        cache.clear()
+        payment_status_cache.local_cache.clear()
         self.payment_id = "jvdqMbFKTAWQSrkeqlL1Rg"
         self.valid_payload = {
             "app_secret": str(self.app.private_token),
             "app_token": str(self.app.public_token),
         }
 
-    @patch("utils.backend_client.FlouciBackendClient.check_payment")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.check_payment")
     def test_verify_payment_success(self, mock_check_payment):
         mock_check_payment.return_value = {
             "success": True,
@@ -1128,7 +1314,7 @@ class TestVerifyPaymentView(BaseCreateDeveloperApp):
         self.assertTrue(data["success"])
         self.assertEqual(data["result"]["status"], "SUCCESS")
 
-    @patch("utils.backend_client.FlouciBackendClient.check_payment")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.check_payment")
     def test_verify_payment_failure(self, mock_check_payment):
         mock_check_payment.return_value = {"success": False, "result": "Invalid Transaction ID", "status_code": 200}
         url = reverse("old_verify_payment", kwargs={"payment_id": self.payment_id})
@@ -1169,7 +1355,7 @@ class TestSendMoneyView(BaseCreateDeveloperApp):
             "app_token": str(self.app.public_token),
         }
 
-    @patch("utils.backend_client.FlouciBackendClient.developer_send_money_status")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.developer_send_money_status")
     def test_send_money_success(self, mock_send_money):
         mock_send_money.return_value = {
             "success": True,
@@ -1194,7 +1380,7 @@ class TestSendMoneyView(BaseCreateDeveloperApp):
             "Operation initiated successfully. You will receive a webhook with final confirmation.",
         )
 
-    @patch("utils.backend_client.FlouciBackendClient.developer_send_money_status")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.developer_send_money_status")
     def test_send_money_failure(self, mock_send_money):
         mock_send_money.return_value = {
             "success": False,
@@ -1215,7 +1401,7 @@ class TestSendMoneyView(BaseCreateDeveloperApp):
         self.assertEqual(data["result"]["error"], "Insufficient funds.")
         self.assertEqual(data["result"]["code"], 4)
 
-    @patch("utils.backend_client.FlouciBackendClient.developer_send_money_status")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.developer_send_money_status")
     def test_send_money_missing_required_field(self, mock_send_money):
         invalid_data = self.valid_data.copy()
         del invalid_data["amount"]
@@ -1240,7 +1426,7 @@ class TestSendMoneyView(BaseCreateDeveloperApp):
         self.assertEqual(response.status_code, 400)
         self.assertIn("amount", response.json())
 
-    @patch("utils.backend_client.FlouciBackendClient.developer_send_money_status")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.developer_send_money_status")
     def test_send_money_without_webhook(self, mock_send_money):
         del self.valid_data["webhook"]
         mock_send_money.return_value = {
@@ -1262,7 +1448,7 @@ class TestSendMoneyView(BaseCreateDeveloperApp):
 
         self.assertEqual(response.status_code, 403)
 
-    @patch("utils.backend_client.FlouciBackendClient.developer_send_money_status")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.developer_send_money_status")
     def test_send_money_invalid_reciver(self, mock_send_money):
         mock_send_money.return_value = {
             "success": False,
@@ -1297,7 +1483,7 @@ class TestCheckSendMoneyStatusView(BaseCreateDeveloperApp):
             "app_token": str(self.app.public_token),
         }
 
-    @patch("utils.backend_client.FlouciBackendClient.developer_check_send_money_status")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.developer_check_send_money_status")
     def test_check_payment_status_success(self, mock_backend):
         mock_backend.return_value = {
             "success": True,
@@ -1326,7 +1512,7 @@ class TestCheckSendMoneyStatusView(BaseCreateDeveloperApp):
         self.assertEqual(data["result"]["status"], "SUCCESS")
         self.assertEqual(data["result"]["details"]["payment_id"], str(self.operation_id))
 
-    @patch("utils.backend_client.FlouciBackendClient.developer_check_send_money_status")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.developer_check_send_money_status")
     def test_check_payment_status_backend_failure(self, mock_backend):
         mock_backend.return_value = {
             "success": False,
@@ -1352,7 +1538,7 @@ class TestCheckSendMoneyStatusView(BaseCreateDeveloperApp):
         response = self.client.get(self.url, self.valid_payload)
         self.assertEqual(response.status_code, 403)
 
-    @patch("utils.backend_client.FlouciBackendClient.developer_check_send_money_status")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.developer_check_send_money_status")
     def test_check_payment_status_user_not_allowed(self, mock_backend):
         mock_backend.return_value = {"success": False, "result": "Not allowed.", "status_code": 406}
         response = self.client.get(self.url, self.valid_payload)
@@ -1361,3 +1547,585 @@ class TestCheckSendMoneyStatusView(BaseCreateDeveloperApp):
         data = response.json()
         self.assertFalse(data["success"])
         self.assertEqual(data["result"], "Not allowed.")
+
+
+class TestFlouciBackendClientSession(APITestCase):
+    @patch("requests.Session.request")
+    def test_calls_reuse_pooled_session(self, mock_request):
+        mock_request.return_value.status_code = 200
+        mock_request.return_value.content = b'{"result": {"status": "SUCCESS"}}'
+
+        first = FlouciBackendClient.check_payment(payment_id="id", wallet="wallet", merchant_id=1)
+        session = FlouciBackendClient._session()
+        second = FlouciBackendClient.check_payment(payment_id="id", wallet="wallet", merchant_id=1)
+
+        self.assertTrue(first["success"])
+        self.assertTrue(second["success"])
+        self.assertEqual(mock_request.call_count, 2)
+        self.assertIs(FlouciBackendClient._session(), session)
+
+    def test_session_rebuilt_in_forked_process(self):
+        pooled_session = PooledSession(pool_maxsize=2)
+        parent_session = pooled_session.get()
+        with patch("utils.http_session.os.getpid", return_value=-1):
+            child_session = pooled_session.get()
+        self.assertIsNot(parent_session, child_session)
+        self.assertEqual(child_session.get_adapter("https://").poolmanager.connection_pool_kw["maxsize"], 2)
+
+
+@patch("utils.backend_client.ASGI_ENABLED", True)
+class TestAsyncFlouciBackendClient(APITestCase):
+    @patch("httpx.AsyncClient.request", new_callable=AsyncMock)
+    def test_async_call_uses_same_request(self, mock_request):
+        mock_request.return_value = MagicMock(status_code=200)
+        mock_request.return_value.content = b'{"result": {"status": "SUCCESS"}}'
+
+        response = async_to_sync(AsyncFlouciBackendClient.check_payment)(
+            payment_id="id", wallet="wallet", merchant_id=1
+        )
+
+        self.assertTrue(response["success"])
+        method, url = mock_request.call_args.args
+        self.assertEqual((method, url), ("get", FlouciBackendClient.CHECK_PAYMENT_URL))
+        self.assertEqual(mock_request.call_args.kwargs["params"], {"slug": "id", "wallet": "wallet", "merchant_id": 1})
+
+    @patch("httpx.AsyncClient.request", new_callable=AsyncMock)
+    def test_async_call_sends_json_body(self, mock_request):
+        mock_request.return_value = MagicMock(status_code=200, content=b'{"result": {}}')
+        tracking_id = uuid.uuid4()
+        async_to_sync(AsyncFlouciBackendClient.get_user_balance)(tracking_id=tracking_id)
+        self.assertEqual(
+            json.loads(mock_request.call_args.kwargs["content"]), {"account_tracking_id": str(tracking_id)}
+        )
+
+    @patch("httpx.AsyncClient.request", new_callable=AsyncMock)
+    def test_async_call_timeout(self, mock_request):
+        mock_request.side_effect = httpx.ReadTimeout("timeout")
+        response = async_to_sync(AsyncFlouciBackendClient.get_user_balance)(tracking_id=uuid.uuid4())
+        self.assertEqual(response["status_code"], 408)
+
+    @patch("utils.backend_client.FlouciBackendClient._session")
+    def test_wsgi_calls_reuse_the_pooled_session(self, mock_session):
+        mock_session.return_value.request.return_value = MagicMock(status_code=200, content=b'{"result": {}}')
+        AsyncFlouciBackendClient._clients.clear()
+
+        with patch("utils.backend_client.ASGI_ENABLED", False):
+            for _ in range(3):
+                response = async_to_sync(AsyncFlouciBackendClient.get_user_balance)(tracking_id=uuid.uuid4())
+
+        self.assertTrue(response["success"])
+        self.assertEqual(mock_session.return_value.request.call_count, 3)
+        self.assertEqual(len(AsyncFlouciBackendClient._clients), 0)
+
+    def test_client_closed_on_shutdown(self):
+        async def build_and_close():
+            client = AsyncFlouciBackendClient._client()
+            await AsyncFlouciBackendClient.aclose()
+            return client
+
+        self.assertTrue(async_to_sync(build_and_close)().is_closed)
+
+    def test_proxy_views_are_async(self):
+        for view in (GeneratePaymentView, VerifyPaymentView, CheckSendMoneyStatusView):
+            self.assertTrue(view.view_is_async, view.__name__)
+
+
+class TestORJSONRenderer(APITestCase):
+    def test_same_bytes_as_json_renderer(self):
+        data = {
+            "gross": Decimal("12.500"),
+            "id": uuid.uuid4(),
+            "time_created": datetime.datetime(2024, 5, 1, 10, 30, 15, tzinfo=datetime.timezone.utc),
+            "date": datetime.date(2024, 5, 1),
+            "name": "Café \u2028 \x00",
+            "amounts": [1.1, 0.1 + 0.2, 1e20, 2**70],
+            1: None,
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            ORJSONRenderer().render(data, "application/json; indent=4"),
+            JSONRenderer().render(data, "application/json; indent=4"),
+        )
+
+    def test_datetimes_keep_their_microseconds(self):
+        data = {"time_created": datetime.datetime(2024, 5, 1, 10, 30, 15, 123456, tzinfo=datetime.timezone.utc)}
+        self.assertEqual(ORJSONRenderer().render(data), b'{"time_created":"2024-05-01T10:30:15.123456Z"}')
+
+    @patch("utils.json_helper.json.dumps")
+    def test_common_payload_not_left_to_json(self, mock_dumps):
+        data = {
+            "results": [
+                {"id": str(uuid.uuid4()), "reference": "3e10-1e5", "amount": 12.5, "rate": 0.1 + 0.2, "note": None}
+                for _ in range(50)
+            ],
+            "total": 1e15,
+        }
+        self.assertEqual(json.loads(ORJSONRenderer().render(data)), data)
+        self.assertEqual(json.loads(dumps(data)), data)
+        mock_dumps.assert_not_called()
+
+    def test_floats_formatted_like_json(self):
+        for value in (1e16, -1.5e16, 1e-5, 2.5e-5, -1.5e-7, 5e-324, 1.7976931348623157e308, 1e-4, 123.0, 0.0, -0.0):
+            data = {"id": str(uuid.uuid4()), "amount": value, "amounts": [value], "note": None}
+            self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data), value)
+            expected = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":")).encode()
+            self.assertEqual(dumps(data), expected, value)
+
+    def test_non_finite_numbers_refused_like_json_renderer(self):
+        for value in (Decimal("NaN"), Decimal("Infinity"), Decimal("-Infinity")):
+            data = {"amount": 1.5, "results": [{"fees": value, "note": None}]}
+            with self.assertRaises(ValueError):
+                JSONRenderer().render(data)
+            with self.assertRaises(ValueError):
+                ORJSONRenderer().render(data)
+            with self.assertRaises(ValueError):
+                dumps(data)
+        for body in (b'{"fees": NaN}', b'{"fees": [-Infinity]}', '{"fees": Infinity}'):
+            with self.assertRaisesMessage(ValueError, "Out of range float values are not JSON compliant"):
+                loads(body)
+
+    def test_parser_matches_json_parser(self):
+        for body in (
+            b'{"amount": 1.5, "name": "Caf\\u00e9"}',
+            b'{"id": 123456789012345678901234567890}',
+            b'{"id": -9999999999999999999}',
+        ):
+            self.assertEqual(ORJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+        for body in (b'{"amount": NaN}', b"{bad"):
+            with self.assertRaises(ParseError) as expected:
+                JSONParser().parse(io.BytesIO(body))
+            with self.assertRaises(ParseError) as parsed:
+                ORJSONParser().parse(io.BytesIO(body))
+            self.assertEqual(str(parsed.exception), str(expected.exception))
+
+    def test_loads_keeps_integers_beyond_64_bits(self):
+        for number in (-(2**63), -(2**63) - 1, -9999999999999999999, 2**64 - 1, 2**64):
+            self.assertEqual(loads(str(number).encode()), number)
+            self.assertEqual(loads(str(number)), number)
+
+
+class TestBackendCircuitBreaker(APITestCase):
+    def setUp(self):
+        cache.clear()
+        endpoint_guards.cache_clear()
+        self.addCleanup(endpoint_guards.cache_clear)
+
+    def backend_response(self, status_code):
+        response = MagicMock(status_code=status_code)
+        response.content = b'{"result": {}}'
+        return response
+
+    @patch("utils.backend_client.FlouciBackendClient._session")
+    def test_circuit_opens_after_failures_and_fails_fast(self, mock_session):
+        mock_session.return_value.request.return_value = self.backend_response(502)
+        for _ in range(5):
+            FlouciBackendClient.get_user_balance(tracking_id=uuid.uuid4())
+        response = FlouciBackendClient.get_user_balance(tracking_id=uuid.uuid4())
+        self.assertEqual(mock_session.return_value.request.call_count, 5)
+        self.assertEqual(response, {"success": False, "code": 5, "message": "Service indisponible", "status_code": 503})
+        # The other endpoints are not affected
+        mock_session.return_value.request.return_value = self.backend_response(200)
+        self.assertTrue(FlouciBackendClient.check_payment(payment_id="id", wallet="wallet", merchant_id=1)["success"])
+
+    @patch("utils.backend_client.FlouciBackendClient._session")
+    def test_half_open_probe_closes_circuit(self, mock_session):
+        mock_session.return_value.request.return_value = self.backend_response(502)
+        for _ in range(5):
+            FlouciBackendClient.get_user_balance(tracking_id=uuid.uuid4())
+        mock_session.return_value.request.return_value = self.backend_response(200)
+        with patch("utils.circuit_breaker.time.time", return_value=time.time() + 31):
+            self.assertTrue(FlouciBackendClient.get_user_balance(tracking_id=uuid.uuid4())["success"])
+        self.assertTrue(FlouciBackendClient.get_user_balance(tracking_id=uuid.uuid4())["success"])
+        self.assertEqual(mock_session.return_value.request.call_count, 7)
+
+    @patch("utils.backend_client.FlouciBackendClient._session")
+    def test_client_errors_do_not_open_circuit(self, mock_session):
+        mock_session.return_value.request.return_value = self.backend_response(400)
+        for _ in range(10):
+            FlouciBackendClient.get_user_balance(tracking_id=uuid.uuid4())
+        self.assertEqual(mock_session.return_value.request.call_count, 10)
+
+    @patch("utils.backend_client.ASGI_ENABLED", True)
+    @patch("httpx.AsyncClient.request", new_callable=AsyncMock)
+    def test_async_circuit_opens_after_failures(self, mock_request):
+        mock_request.return_value = self.backend_response(502)
+
+        async def call_balance(times):
+            return [await AsyncFlouciBackendClient.get_user_balance(tracking_id=uuid.uuid4()) for _ in range(times)]
+
+        responses = async_to_sync(call_balance)(6)
+        self.assertEqual(mock_request.call_count, 5)
+        self.assertEqual(responses[-1]["status_code"], 503)
+
+    @patch("utils.backend_client.FLOUCI_BACKEND_BULKHEAD_TIMEOUT", 0.01)
+    @patch("utils.backend_client.FLOUCI_BACKEND_BULKHEAD_SIZE", 1)
+    @patch("utils.backend_client.FlouciBackendClient._session")
+    def test_bulkhead_is_shared_by_sync_workers(self, mock_session):
+        mock_session.return_value.request.return_value = self.backend_response(200)
+        # Another worker process holds the only get_balance slot
+        other_worker_bulkhead = Bulkhead(urlsplit(FlouciBackendClient.GET_BALANCE).path, size=1, timeout=0.01)
+        with other_worker_bulkhead.slot():
+            balance_response = FlouciBackendClient.get_user_balance(tracking_id=uuid.uuid4())
+            payment_response = FlouciBackendClient.check_payment(payment_id="id", wallet="wallet", merchant_id=1)
+        self.assertEqual(balance_response["status_code"], 503)
+        self.assertTrue(payment_response["success"])
+        self.assertTrue(FlouciBackendClient.get_user_balance(tracking_id=uuid.uuid4())["success"])
+
+    def test_slot_of_a_killed_worker_is_freed_under_load(self):
+        bulkhead = Bulkhead("crashing endpoint", size=2, timeout=0, lease=30)
+        now = time.time()
+        with patch("django.core.cache.backends.locmem.time.time", return_value=now):
+            self.assertTrue(bulkhead._try_acquire())  # its worker is killed during the call, never released
+        # Calls keep coming during the lease, they only get the other slot
+        for elapsed in range(0, 30, 5):
+            with patch("django.core.cache.backends.locmem.time.time", return_value=now + elapsed):
+                with bulkhead.slot():
+                    with self.assertRaises(BulkheadFullError):
+                        with bulkhead.slot():
+                            pass
+        with patch("django.core.cache.backends.locmem.time.time", return_value=now + 31):
+            with bulkhead.slot():
+                with bulkhead.slot():
+                    pass
+
+    @patch("utils.backend_client.ASGI_ENABLED", True)
+    @patch("utils.backend_client.FLOUCI_BACKEND_BULKHEAD_TIMEOUT", 0.01)
+    @patch("utils.backend_client.FLOUCI_BACKEND_BULKHEAD_SIZE", 1)
+    @patch("httpx.AsyncClient.request", new_callable=AsyncMock)
+    def test_full_bulkhead_does_not_starve_other_endpoints(self, mock_request):
+        mock_request.return_value = self.backend_response(200)
+
+        async def call_while_get_balance_is_stuck():
+            _, bulkhead = endpoint_guards(FlouciBackendClient.GET_BALANCE)
+            async with bulkhead.async_slot():
+                return await asyncio.gather(
+                    AsyncFlouciBackendClient.get_user_balance(tracking_id=uuid.uuid4()),
+                    AsyncFlouciBackendClient.check_payment(payment_id="id", wallet="wallet", merchant_id=1),
+                )
+
+        balance_response, payment_response = async_to_sync(call_while_get_balance_is_stuck)()
+        self.assertEqual(balance_response["status_code"], 503)
+        self.assertTrue(payment_response["success"])
+
+
+class TestTokenBasedRequests(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def make_client(self):
+        return TokenBasedRequests("https://data.api/api/authenticate", {"username": "user", "password": "pass"})
+
+    def authentication_response(self, lifetime=3600):
+        token = jwt.encode({"exp": int(time.time()) + lifetime}, "secret", algorithm="HS256")
+        response = MagicMock(status_code=200)
+        response.json.return_value = {"id_token": token}
+        return response
+
+    @patch("utils.token_based_requests_manager.requests.post")
+    def test_concurrent_refreshes_authenticate_once(self, mock_post):
+        def authenticate(*args, **kwargs):
+            time.sleep(0.05)
+            return self.authentication_response()
+
+        mock_post.side_effect = authenticate
+        client = self.make_client()
+        threads = [threading.Thread(target=client.check_token) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertIsNotNone(client.token)
+
+    @patch("utils.token_based_requests_manager.requests.post")
+    def test_token_shared_between_workers(self, mock_post):
+        mock_post.return_value = self.authentication_response()
+        first_worker, second_worker = self.make_client(), self.make_client()
+        first_worker.check_token()
+        second_worker.check_token()
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(first_worker.token, second_worker.token)
+
+    @patch("utils.token_based_requests_manager.requests.post")
+    def test_token_refreshed_ahead_of_expiration(self, mock_post):
+        mock_post.return_value = self.authentication_response(lifetime=30)
+        client = self.make_client()
+        client.check_token()
+        expiring_token = client.token
+
+        release_authentication = threading.Event()
+
+        def slow_authenticate(*args, **kwargs):
+            release_authentication.wait(5)
+            return self.authentication_response(lifetime=3600)
+
+        mock_post.side_effect = slow_authenticate
+        client.check_token()
+        # The expiring token is still used while the new one is fetched in the background
+        self.assertEqual(client.token, expiring_token)
+        release_authentication.set()
+        with client._lock:
+            pass
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertNotEqual(client.token, expiring_token)
+
+
+class TestHasBackendApiKey(BaseCreateDeveloperApp):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("internal_check_user_exists", kwargs={"tracking_id": self.username})
+
+    def get_with_key(self, key):
+        return self.client.get(self.url, HTTP_AUTHORIZATION=f"Api-Key {key}")
+
+    def test_verified_key_served_from_cache(self):
+        self.assertEqual(self.get_with_key(self.api_key).status_code, 200)
+        with patch("rest_framework_api_key.crypto.KeyGenerator.verify") as mock_verify, CaptureQueriesContext(
+            connection
+        ) as queries:
+            self.assertEqual(self.get_with_key(self.api_key).status_code, 200)
+        mock_verify.assert_not_called()
+        self.assertFalse([query for query in queries if "apikey" in query["sql"]])
+
+    def test_wrong_secret_rejected(self):
+        self.assertEqual(self.get_with_key(self.api_key).status_code, 200)
+        prefix = self.api_key.partition(".")[0]
+        self.assertEqual(self.get_with_key(f"{prefix}.wrongsecret").status_code, 403)
+        # The valid key is still accepted once a wrong secret was tried first
+        api_key_cache.invalidate(prefix)
+        self.assertEqual(self.get_with_key(f"{prefix}.wrongsecret").status_code, 403)
+        self.assertEqual(self.get_with_key(self.api_key).status_code, 200)
+
+    def test_revoked_key_rejected(self):
+        self.assertEqual(self.get_with_key(self.api_key).status_code, 200)
+        api_key = APIKey.objects.get(prefix=self.api_key.partition(".")[0])
+        api_key.revoked = True
+        api_key.save()
+        self.assertEqual(self.get_with_key(self.api_key).status_code, 403)
+
+
+class TestImageUpload(BaseCreateDeveloperApp):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("image_update")
+
+    def base64_image(self, size=(1000, 600), image_format="PNG"):
+        output = io.BytesIO()
+        Image.new("RGB", size, "red").save(output, image_format)
+        return base64.b64encode(output.getvalue()).decode()
+
+    def post_image(self, new_image):
+        return self.client.post(
+            self.url,
+            {"app_id": str(self.app.app_id), "new_image": new_image},
+            format="json",
+            HTTP_AUTHORIZATION=f"Api-Key {self.api_key}",
+        )
+
+    @patch("utils.gcs_client.GCSClient.upload_image")
+    def test_upload_is_queued_out_of_the_request(self, mock_upload):
+        response = self.post_image(f"data:image/png;base64,{self.base64_image()}")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["result"].endswith(f"{self.app.app_id}_512.png"))
+        mock_upload.assert_not_called()
+        self.assertEqual(ImageUpload.objects.get(app=self.app).status, ImageUpload.UploadStatus.PENDING)
+        self.app.refresh_from_db()
+        self.assertIsNone(self.app.image_url)
+
+    @patch("utils.gcs_client.GCSClient.upload_image", side_effect=lambda data, name, ext, content_type: name)
+    def test_worker_uploads_resized_variants(self, mock_upload):
+        self.post_image(f"data:image/jpeg;base64,{self.base64_image(image_format='JPEG')}")
+        self.post_image(f"data:image/png;base64,{self.base64_image()}")  # replaces the pending jpeg
+        self.assertEqual(ImageUploadWorker().run(once=True), 1)
+
+        sizes = {}
+        for data, name, extension, content_type in (call.args for call in mock_upload.call_args_list):
+            self.assertEqual((extension, content_type), ("png", "image/png"))
+            sizes[name] = Image.open(io.BytesIO(data)).size
+        self.assertEqual(sizes, {f"{self.app.app_id}_512": (512, 307), f"{self.app.app_id}_128": (128, 77)})
+        self.app.refresh_from_db()
+        self.assertEqual(self.app.image_url, f"{self.app.app_id}_512")
+        uploads = [(upload.status, bytes(upload.image_data)) for upload in ImageUpload.objects.order_by("id")]
+        self.assertEqual(uploads, [(ImageUpload.UploadStatus.SUPERSEDED, b""), (ImageUpload.UploadStatus.DONE, b"")])
+
+    @patch("utils.gcs_client.GCSClient.upload_image", side_effect=lambda data, name, ext, content_type: name)
+    def test_uploads_of_an_app_are_processed_in_order(self, mock_upload):
+        worker = ImageUploadWorker(sizes=(128, 512))
+        self.post_image(f"data:image/jpeg;base64,{self.base64_image(image_format='JPEG')}")
+        first = worker.claim()
+        self.post_image(f"data:image/png;base64,{self.base64_image()}")  # sent while the jpeg is processed
+        self.assertIsNone(worker.claim())
+
+        worker.record_success(first, worker.process(first))
+        self.app.refresh_from_db()
+        self.assertEqual(self.app.image_url, f"{self.app.app_id}_512")
+        self.assertEqual(worker.run(once=True), 1)
+        self.assertEqual(mock_upload.call_args_list[-1].args[2], "png")
+        statuses = list(ImageUpload.objects.order_by("id").values_list("status", flat=True))
+        self.assertEqual(statuses, [ImageUpload.UploadStatus.DONE, ImageUpload.UploadStatus.DONE])
+
+    @patch("utils.gcs_client.GCSClient.upload_image", side_effect=lambda data, name, ext, content_type: name)
+    def test_upload_outliving_its_lease_is_left(self, mock_upload):
+        self.post_image(f"data:image/png;base64,{self.base64_image()}")
+        worker = ImageUploadWorker(lease=0)
+        upload = worker.claim()
+        self.assertEqual(ImageUploadWorker().claim().id, upload.id)  # the lease expired, claimed again
+
+        self.assertEqual(worker.run(once=True), 0)
+        with self.assertLogs("api.image_upload_worker", "WARNING"):
+            worker.record_success(upload, "stale")
+        self.app.refresh_from_db()
+        self.assertIsNone(self.app.image_url)
+        self.assertEqual(ImageUpload.objects.get(app=self.app).status, ImageUpload.UploadStatus.PROCESSING)
+
+    def test_invalid_images_are_rejected(self):
+        gif = base64.b64encode(b"GIF89a" + b"\x00" * 32).decode()
+        for new_image in (f"data:image/png;base64,{gif}", "data:image/png;base64,not base64!"):
+            self.assertEqual(self.post_image(new_image).status_code, 400)
+        with patch("utils.image_helper.IMAGE_UPLOAD_MAX_PIXELS", 1000):
+            self.assertEqual(self.post_image(f"data:image/png;base64,{self.base64_image()}").status_code, 400)
+        self.assertFalse(ImageUpload.objects.exists())
+
+
+class TestStartupImports(APITestCase):
+    # Seconds spent importing modules in django.setup() and the url configuration, as reported by -X importtime,
+    # at most this many times the seconds spent importing django's ORM alone on the same machine
+    IMPORT_TIME_RATIO = 5
+    # Costly clients that must only be loaded on their first use
+    LAZY_MODULES = ("google.cloud.storage",)
+    APP_IMPORTS = "import sys, django; django.setup(); import settings.urls; print(' '.join(sys.modules))"
+
+    def import_time(self, code):
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "settings.settings")}
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, env=env, check=True
+        )
+        # Only the top level imports, their cumulative time includes the nested ones
+        import_time = sum(
+            int(match.group(1)) for match in re.finditer(r"^import time:\s+\d+ \|\s+(\d+) \| \S", result.stderr, re.M)
+        )
+        return result.stdout, import_time / 1_000_000
+
+    def test_lazy_modules_not_imported_on_startup(self):
+        modules, _ = self.import_time(self.APP_IMPORTS)
+        self.assertFalse(set(modules.split()).intersection(self.LAZY_MODULES))
+
+    def test_startup_import_time(self):
+        # The fastest of a few runs, the first one may compile the bytecode and any may be slowed down by the load
+        django_time = min(self.import_time("import django.db.models")[1] for _ in range(3))
+        app_time = min(self.import_time(self.APP_IMPORTS)[1] for _ in range(3))
+        self.assertLess(app_time, django_time * self.IMPORT_TIME_RATIO)
+
+
+class TestMetrics(BaseCreateDeveloperApp):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        endpoint_guards.cache_clear()
+        self.addCleanup(endpoint_guards.cache_clear)
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_latency_status_and_queries_are_recorded(self):
+        labels = {"view": "create_developer_app", "method": "POST"}
+        requests_before = self.sample("http_requests_total", status="201", **labels)
+        latency_before = self.sample("http_request_duration_seconds_count", **labels)
+        queries_before = self.sample("http_request_db_queries_sum", view="create_developer_app")
+        data = {
+            "name": "metrics app",
+            "description": "metrics app",
+            "merchant_id": self.merchant_id,
+            "username": str(self.username),
+            "wallet": self.wallet,
+        }
+        response = self.client.post(
+            reverse("create_developer_app"), data, format="json", HTTP_AUTHORIZATION=f"Api-Key {self.api_key}"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.sample("http_requests_total", status="201", **labels), requests_before + 1)
+        self.assertEqual(self.sample("http_request_duration_seconds_count", **labels), latency_before + 1)
+        self.assertGreater(self.sample("http_request_db_queries_sum", view="create_developer_app"), queries_before)
+
+    @patch("utils.backend_client.FlouciBackendClient._session")
+    def test_backend_calls_are_recorded(self, mock_session):
+        timeouts_before = self.sample("backend_timeouts_total", call="get_user_balance")
+        responses_before = self.sample("backend_responses_total", call="get_user_balance", status="408")
+        mock_session.return_value.request.side_effect = requests.exceptions.ReadTimeout()
+        FlouciBackendClient.get_user_balance(tracking_id=uuid.uuid4())
+        self.assertEqual(self.sample("backend_timeouts_total", call="get_user_balance"), timeouts_before + 1)
+        self.assertEqual(
+            self.sample("backend_responses_total", call="get_user_balance", status="408"), responses_before + 1
+        )
+        self.assertGreater(self.sample("backend_request_duration_seconds_count", call="get_user_balance"), 0)
+
+    def test_metrics_endpoint(self):
+        with patch("utils.metrics.METRICS_AUTH_TOKEN", "secret"):
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+            response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"http_request_duration_seconds_bucket", response.content)
+
+    @patch("utils.metrics.METRICS_AUTH_TOKEN", "")
+    def test_metrics_endpoint_without_token_only_served_in_debug(self):
+        with patch("utils.metrics.DEBUG", False):
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+        with patch("utils.metrics.DEBUG", True):
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 200)
+
+
+class TestPathRoutedMiddleware(APITestCase):
+    def test_api_routes_skip_browser_middleware(self):
+        response = self.client.get(reverse("partner_balance"))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()["detail"], "Authentication credentials were not provided.")
+        self.assertNotIn("X-Frame-Options", response.headers)
+        self.assertFalse(hasattr(response.wsgi_request, "session"))
+
+    def test_other_routes_keep_browser_middleware(self):
+        response = self.client.get(reverse("home"))
+        self.assertEqual(response.headers["X-Frame-Options"], "DENY")
+        self.assertTrue(hasattr(response.wsgi_request, "session"))
+        self.assertTrue(hasattr(response.wsgi_request, "user"))
+
+    def test_other_routes_keep_browser_middleware_under_asgi(self):
+        response = async_to_sync(AsyncClient().get)(reverse("home"))
+        self.assertEqual(response.headers["X-Frame-Options"], "DENY")
+        self.assertTrue(hasattr(response.asgi_request, "session"))
+
+
+class TestVerifyBackendToken(APITestCase):
+    def setUp(self):
+        verified_tokens_cache.clear()
+        private_key = ec.generate_private_key(ec.SECP256R1())
+        self.private_key = private_key
+        self.public_key = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+
+    def make_token(self, lifetime=3600, **claims):
+        return jwt.encode({"exp": int(time.time()) + lifetime, **claims}, self.private_key, algorithm="ES256")
+
+    def test_token_signature_verified_once(self):
+        token = self.make_token(type="partner", tracking_id="tracking")
+        with patch("utils.jwt_helpers.jwt.decode", wraps=jwt.decode) as mock_decode:
+            for _ in range(3):
+                verified, data = verify_backend_token(token, is_token_partner=True, public_key=self.public_key)
+                self.assertTrue(verified)
+                self.assertEqual(data, {"tracking_id": "tracking"})
+        self.assertEqual(mock_decode.call_count, 1)
+
+    def test_cached_token_expires_with_its_exp(self):
+        token = self.make_token(lifetime=60)
+        self.assertTrue(verify_backend_token(token, public_key=self.public_key)[0])
+        with patch("utils.jwt_helpers.time.time", return_value=time.time() + 120):
+            self.assertEqual(verify_backend_token(token, public_key=self.public_key), (False, None))
+
+    def test_cached_token_still_checked_for_partner_type(self):
+        token = self.make_token(type="user")
+        self.assertTrue(verify_backend_token(token, public_key=self.public_key)[0])
+        self.assertEqual(verify_backend_token(token, is_token_partner=True, public_key=self.public_key), (False, None))
+
+    def test_token_signed_by_another_key_rejected(self):
+        token = jwt.encode({"exp": int(time.time()) + 60}, ec.generate_private_key(ec.SECP256R1()), algorithm="ES256")
+        self.assertEqual(verify_backend_token(token, public_key=self.public_key), (False, None))
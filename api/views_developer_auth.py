@@ -126,6 +126,7 @@ class CreateDeveloperAppView(GenericAPIView):
             app.update_image(serializer.validated_data.get("image_url"))
         if updated_fields:
             app.save(update_fields=updated_fields)
+            app.invalidate_credentials_cache()
         data = app.get_app_details()
         data["success"] = True
         return Response(data, status=status.HTTP_200_OK)
@@ -168,15 +169,15 @@ class ImageUpdate(GenericAPIView):
     def post(self, request, serializer):
         image_info = serializer.validated_data["image_info"]
         app: FlouciApp = serializer.validated_data["app"]
-        app.update_image(image_info)
-        image_url = app.image_url
-        if not image_url:
+        upload = app.update_image(image_info)
+        if upload is None:
             return Response(
                 {"code": 1, "message": "Failed to upload image", "result": None},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        # Resized and uploaded in the background, the url serves the new image within seconds
         response_data = {
-            "result": image_url,
+            "result": upload.image_url,
             "code": 0,
             "message": "Image successfully updated",
             "name": "developers",
@@ -243,6 +244,7 @@ class EnableOrDisableDeveloperAppView(GenericAPIView):
             return Response({"detail": "App not found."}, status=status.HTTP_404_NOT_FOUND)
         app.active = self.enable_or_disable
         app.save(update_fields=["active"])
+        app.invalidate_credentials_cache()
         response_data = {
             "result": app.get_app_details(),
             "code": 0,
@@ -418,4 +420,5 @@ class PartnerConnectedApps(GenericAPIView):
             return Response({"success": False, "message": "Invalid reference."}, status=status.HTTP_400_BAD_REQUEST)
         linked_account.is_active = not linked_account.is_active
         linked_account.save(update_fields=["is_active"])
+        linked_account.invalidate_cache()
         return Response({"success": True, "is_active": linked_account.is_active}, status=status.HTTP_200_OK)
@@ -1,6 +1,7 @@
 from http import HTTPStatus
 
-from drf_spectacular.utils import extend_schema, extend_schema_view
+from adrf.generics import GenericAPIView as AsyncGenericAPIView
+from drf_spectacular.utils import extend_schema
 from rest_framework import status
 from rest_framework.generics import GenericAPIView
 from rest_framework.response import Response
@@ -20,17 +21,49 @@ from api.serializers import (
     SendMoneySerializer,
     VerifyPaymentSerializer,
 )
-from settings.settings import DJANGO_SERVICE_VERSION
-from utils.backend_client import FlouciBackendClient
+from settings.settings import (
+    DJANGO_SERVICE_VERSION,
+    PAYMENT_STATUS_FINAL_CACHE_TIMEOUT,
+    PAYMENT_STATUS_LOCAL_CACHE_SIZE,
+    PAYMENT_STATUS_LOCAL_CACHE_TIMEOUT,
+    PAYMENT_STATUS_PENDING_CACHE_TIMEOUT,
+    SINGLE_FLIGHT_RESULT_TIMEOUT,
+    SINGLE_FLIGHT_WAIT_TIMEOUT,
+)
+from utils.backend_client import AsyncFlouciBackendClient
+from utils.cache_helper import ResponseCache
 from utils.dataapi_client import DataApiClient
-from utils.decorators import IsValidGenericApi
+from utils.decorators import Idempotent, IsValidGenericApi
+from utils.docs_helper import IDEMPOTENCY_KEY
+from utils.single_flight import SingleFlight
+
+payment_status_cache = ResponseCache(
+    "check_payment", local_timeout=PAYMENT_STATUS_LOCAL_CACHE_TIMEOUT, local_maxsize=PAYMENT_STATUS_LOCAL_CACHE_SIZE
+)
+FINAL_PAYMENT_STATUSES = ("SUCCESS", "FAILED", "EXPIRED")
+send_money_status_flight = SingleFlight(
+    "send_money_status", result_timeout=SINGLE_FLIGHT_RESULT_TIMEOUT, wait_timeout=SINGLE_FLIGHT_WAIT_TIMEOUT
+)
+
+
+def payment_status_cache_timeout(response):
+    """Seconds the check_payment response can be served from the cache, 0 if it must not be."""
+    if not response.get("success") or response.get("status_code") != status.HTTP_200_OK:
+        return 0
+    result = response.get("result")
+    payment_status = result.get("status") if isinstance(result, dict) else None
+    if payment_status in FINAL_PAYMENT_STATUSES:
+        return PAYMENT_STATUS_FINAL_CACHE_TIMEOUT
+    if payment_status == "PENDING":
+        return PAYMENT_STATUS_PENDING_CACHE_TIMEOUT
+    return 0
 
 
 @IsValidGenericApi()
-class BaseGeneratePaymentView(GenericAPIView):
+class BaseGeneratePaymentView(AsyncGenericAPIView):
     depricated = True
 
-    def post(self, request, serializer):
+    async def post(self, request, serializer):
         """Handles both V1 (deprecated) and V2 dynamically."""
         if self.depricated:
             app_token = serializer.validated_data.get("app_token")
@@ -60,7 +93,7 @@ class BaseGeneratePaymentView(GenericAPIView):
         destination = serializer.validated_data.get("destination")
         pre_authorization = serializer.validated_data["pre_authorization"]
 
-        response = FlouciBackendClient.generate_payment_page(
+        response = await AsyncFlouciBackendClient.generate_payment_page(
             test_account=test_account,
             accept_card=accept_card,
             accept_edinar=accept_edinar,
@@ -103,46 +136,44 @@ class BaseGeneratePaymentView(GenericAPIView):
         return Response(data=data, status=response.get("status_code"))
 
 
-@extend_schema_view(
-    post=extend_schema(
-        tags=["Accept-Payments"],
-        summary="Generate Payment Page (V1)",
-        description=(
-            "This endpoint generates a payment page for the user (Version 1). "
-            "It requires `app_token` and `app_secret` in the request body."
-        ),
-        request=OldGeneratePaymentSerializer,
-        responses={
-            200: {
-                "description": "Payment page generated successfully",
-                "examples": {
-                    "application/json": {
-                        "result": {
-                            "link": "https://payment.page.url",
-                            "payment_id": "123456789",
-                            "developer_tracking_id": "dev_track_id",
-                            "success": True,
-                        },
-                        "name": "developers",
-                        "code": 0,
-                        "version": "5.0.0",
-                    }
-                },
+@extend_schema(
+    tags=["Accept-Payments"],
+    summary="Generate Payment Page (V1)",
+    description=(
+        "This endpoint generates a payment page for the user (Version 1). "
+        "It requires `app_token` and `app_secret` in the request body."
+    ),
+    request=OldGeneratePaymentSerializer,
+    responses={
+        200: {
+            "description": "Payment page generated successfully",
+            "examples": {
+                "application/json": {
+                    "result": {
+                        "link": "https://payment.page.url",
+                        "payment_id": "123456789",
+                        "developer_tracking_id": "dev_track_id",
+                        "success": True,
+                    },
+                    "name": "developers",
+                    "code": 0,
+                    "version": "5.0.0",
+                }
             },
-            400: {
-                "description": "Invalid request data",
-                "examples": {
-                    "application/json": {
-                        "result": {"success": False, "error": "Invalid data", "details": "Detailed error message"},
-                        "name": "developers",
-                        "code": 1,
-                        "version": "5.0.0",
-                    }
-                },
+        },
+        400: {
+            "description": "Invalid request data",
+            "examples": {
+                "application/json": {
+                    "result": {"success": False, "error": "Invalid data", "details": "Detailed error message"},
+                    "name": "developers",
+                    "code": 1,
+                    "version": "5.0.0",
+                }
             },
         },
-        deprecated=True,  # Marking it as deprecated
-    )
+    },
+    deprecated=True,  # Marking it as deprecated
 )
 class OldGeneratePaymentView(BaseGeneratePaymentView):
     serializer_class = OldGeneratePaymentSerializer
@@ -154,46 +185,46 @@ class OldGeneratePaymentWordpressView(OldGeneratePaymentView):
     pass
 
 
-@extend_schema_view(
-    post=extend_schema(
-        tags=["Accept-Payments"],
-        summary="Generate Payment Page",
-        description=(
-            "This endpoint generates a payment page for the user. "
-            "The user can specify various parameters such as the amount, currency, and payment methods accepted. "
-            "Upon success, a URL to the payment page is returned along with a payment ID."
-        ),
-        request=GeneratePaymentSerializer,
-        responses={
-            200: {
-                "description": "Payment page generated successfully",
-                "examples": {
-                    "application/json": {
-                        "result": {
-                            "link": "https://payment.page.url",
-                            "payment_id": "123456789",
-                            "developer_tracking_id": "dev_track_id",
-                            "success": True,
-                        },
-                        "name": "developers",
-                        "code": 0,
-                        "version": "5.0.0",
-                    }
-                },
+@Idempotent()
+@extend_schema(
+    tags=["Accept-Payments"],
+    summary="Generate Payment Page",
+    description=(
+        "This endpoint generates a payment page for the user. "
+        "The user can specify various parameters such as the amount, currency, and payment methods accepted. "
+        "Upon success, a URL to the payment page is returned along with a payment ID."
+    ),
+    request=GeneratePaymentSerializer,
+    parameters=[IDEMPOTENCY_KEY],
+    responses={
+        200: {
+            "description": "Payment page generated successfully",
+            "examples": {
+                "application/json": {
+                    "result": {
+                        "link": "https://payment.page.url",
+                        "payment_id": "123456789",
+                        "developer_tracking_id": "dev_track_id",
+                        "success": True,
+                    },
+                    "name": "developers",
+                    "code": 0,
+                    "version": "5.0.0",
+                }
             },
-            400: {
-                "description": "Invalid request data",
-                "examples": {
-                    "application/json": {
-                        "result": {"success": False, "error": "Invalid data", "details": "Detailed error message"},
-                        "name": "developers",
-                        "code": 1,
-                        "version": "5.0.0",
-                    }
-                },
+        },
+        400: {
+            "description": "Invalid request data",
+            "examples": {
+                "application/json": {
+                    "result": {"success": False, "error": "Invalid data", "details": "Detailed error message"},
+                    "name": "developers",
+                    "code": 1,
+                    "version": "5.0.0",
+                }
             },
         },
-    )
+    },
 )
 class GeneratePaymentView(BaseGeneratePaymentView):
     serializer_class = GeneratePaymentSerializer
@@ -206,16 +237,22 @@ class GeneratePaymentWordpressView(GeneratePaymentView):
 
 
 @IsValidGenericApi(post=False, get=True)
-class BaseVerifyPaymentView(GenericAPIView):
+class BaseVerifyPaymentView(AsyncGenericAPIView):
     serializer_class = VerifyPaymentSerializer
 
-    def get(self, request, serializer):
+    async def get(self, request, serializer):
         payment_id = serializer.validated_data["payment_id"]
         application = request.application
-        # TODO change in backend and depricate the wallet field
-        response = FlouciBackendClient.check_payment(
-            payment_id=payment_id, wallet=application.wallet, merchant_id=application.merchant_id
-        )
+        cache_key = (application.merchant_id, payment_id)
+        response = await payment_status_cache.aget(*cache_key)
+        if response is None:
+            # TODO change in backend and depricate the wallet field
+            response = await AsyncFlouciBackendClient.check_payment(
+                payment_id=payment_id, wallet=application.wallet, merchant_id=application.merchant_id
+            )
+            timeout = payment_status_cache_timeout(response)
+            if timeout != 0:
+                await payment_status_cache.aset(cache_key, response, timeout)
         if response.get("success"):
             data = {
                 **response,
@@ -317,9 +354,9 @@ class VerifyPaymentView(BaseVerifyPaymentView):
 
 
 @IsValidGenericApi(post=True, get=False)
-class BaseSendMoneyView(GenericAPIView):
+class BaseSendMoneyView(AsyncGenericAPIView):
 
-    def post(self, request, serializer):
+    async def post(self, request, serializer):
         application: FlouciApp = request.application
         if application.test:
             return Response(
@@ -337,7 +374,7 @@ class BaseSendMoneyView(GenericAPIView):
             )
         validated_data = serializer.validated_data
 
-        response = FlouciBackendClient.developer_send_money_status(
+        response = await AsyncFlouciBackendClient.developer_send_money_status(
             amount_in_millimes=validated_data.get("amount_in_millimes"),
             receiver=validated_data.get("destination"),
             webhook=validated_data.get("webhook"),
@@ -414,6 +451,7 @@ class OldSendMoneyView(BaseSendMoneyView):
     permission_classes = (HasValidAppCredentials,)
 
 
+@Idempotent()
 @extend_schema(
     tags=["Orchestration-Payments"],
     summary="Send Money",
@@ -422,6 +460,7 @@ class OldSendMoneyView(BaseSendMoneyView):
         "The user can specify the amount, destination, and webhook URL for notifications."
     ),
     request=BaseSendMoneySerializer,
+    parameters=[IDEMPOTENCY_KEY],
     responses={
         200: {
             "description": "Money sent successfully",
@@ -457,11 +496,16 @@ class SendMoneyView(BaseSendMoneyView):
 
 
 @IsValidGenericApi(post=False, get=True)
-class BaseCheckSendMoneyStatusView(GenericAPIView):
-    def get(self, request, serializer):
+class BaseCheckSendMoneyStatusView(AsyncGenericAPIView):
+    async def get(self, request, serializer):
         sender_id = request.application.merchant_id
         operation_id = serializer.validated_data["operation_id"]
-        response = FlouciBackendClient.developer_check_send_money_status(operation_id=operation_id, sender_id=sender_id)
+        response = await send_money_status_flight.do(
+            (sender_id, operation_id),
+            lambda: AsyncFlouciBackendClient.developer_check_send_money_status(
+                operation_id=operation_id, sender_id=sender_id
+            ),
+        )
         status_code = response["status_code"]
 
         if response["success"]:
@@ -588,15 +632,15 @@ class BaseAcceptPayment(GenericAPIView):
 
 
 @IsValidGenericApi()
-class ConfirmSMTPreAuthorization(GenericAPIView):
+class ConfirmSMTPreAuthorization(AsyncGenericAPIView):
     permission_classes = (HasValidAppCredentials | HasValidAppCredentialsV2,)
     serializer_class = ConfirmSMTPreAuthorizationSerializer
 
-    def post(self, request, serializer):
+    async def post(self, request, serializer):
         merchant_id = request.application.merchant_id
         payment_id = serializer.validated_data["payment_id"]
         amount = serializer.validated_data["amount"]
-        response = FlouciBackendClient.confirm_payment(payment_id, amount, merchant_id)
+        response = await AsyncFlouciBackendClient.confirm_payment(payment_id, amount, merchant_id)
         if response["success"]:
             data = {
                 "result": {
@@ -624,14 +668,14 @@ class ConfirmSMTPreAuthorization(GenericAPIView):
 
 
 @IsValidGenericApi()
-class CancelSMTPreAuthorization(GenericAPIView):
+class CancelSMTPreAuthorization(AsyncGenericAPIView):
     permission_classes = (HasValidAppCredentials | HasValidAppCredentialsV2,)
     serializer_class = CancelSMTPreAuthorizationSerializer
 
-    def post(self, request, serializer):
+    async def post(self, request, serializer):
         merchant_id = request.application.merchant_id
         payment_id = serializer.validated_data["payment_id"]
-        response = FlouciBackendClient.cancel_payment(payment_id, merchant_id)
+        response = await AsyncFlouciBackendClient.cancel_payment(payment_id, merchant_id)
         if response["success"]:
             data = {
                 "result": {
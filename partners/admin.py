@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import LinkedAccount, PartnerTransaction
+from .models import LinkedAccount, PartnerTransaction, WebhookDelivery
 
 
 class LinkedAccountAdmin(admin.ModelAdmin):
@@ -18,6 +18,19 @@ class LinkedAccountAdmin(admin.ModelAdmin):
     raw_id_fields = ("app",)
     ordering = ("-time_created",)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        obj.invalidate_cache(merchant_id=form.initial.get("merchant_id"))
+
+    def delete_model(self, request, obj):
+        obj.invalidate_cache()
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            obj.invalidate_cache()
+        super().delete_queryset(request, queryset)
+
 
 class PartnerTransactionAdmin(admin.ModelAdmin):
     list_display = (
@@ -38,5 +51,15 @@ class PartnerTransactionAdmin(admin.ModelAdmin):
     ordering = ("-time_created",)
 
 
+class WebhookDeliveryAdmin(admin.ModelAdmin):
+    list_display = ("id", "host", "status", "attempts", "next_attempt_at", "time_created", "time_modified")
+    raw_id_fields = ["partner_transaction"]
+    search_fields = ("url", "host", "partner_transaction__operation_id")
+    list_filter = ("status", "time_created")
+    readonly_fields = ("time_created", "time_modified")
+    ordering = ("-time_created",)
+
+
 admin.site.register(LinkedAccount, LinkedAccountAdmin)
 admin.site.register(PartnerTransaction, PartnerTransactionAdmin)
+admin.site.register(WebhookDelivery, WebhookDeliveryAdmin)
@@ -0,0 +1,155 @@
+import random
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from api.enum import RequestStatus, SendMoneyServiceOperationTypes
+from partners.models import LinkedAccount, PartnerTransaction
+from settings.configs.env import ENV
+
+BENCHMARK_MERCHANT_ID = "index-benchmark"
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed LinkedAccount and PartnerTransaction rows and print the query plans of their access paths "
+        "without then with the partner indexes. Everything runs in a transaction that is rolled back, but the "
+        "dropped indexes lock both tables until then: only run it against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--transactions", type=int, default=2_000_000)
+        parser.add_argument("--accounts", type=int, default=20_000)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--analyze", action="store_true", help="Run EXPLAIN ANALYZE (postgresql only)")
+        parser.add_argument(
+            "--i-know",
+            action="store_true",
+            help="Run even though ENV is set, the configured database is a scratch copy",
+        )
+
+    def handle(self, *args, **options):
+        if ENV and not options["i_know"]:
+            raise CommandError(
+                f"ENV is {ENV}: refusing to drop the indexes of database {connection.settings_dict['NAME']}. "
+                "Point the command at a scratch database and pass --i-know."
+            )
+        self.analyze = options["analyze"] and connection.vendor == "postgresql"
+        try:
+            with transaction.atomic():
+                accounts = self.seed_accounts(options["accounts"], options["batch_size"])
+                self.seed_transactions(accounts, options["transactions"], options["batch_size"])
+                if connection.vendor == "postgresql":
+                    with connection.cursor() as cursor:
+                        cursor.execute("ANALYZE partners_linkedaccount, partners_partnertransaction")
+                self.sample = random.choice(accounts)
+                self.sample_operation_id = PartnerTransaction.objects.filter(sender=self.sample).values_list(
+                    "operation_id", flat=True
+                )[0]
+
+                self.stdout.write(self.style.MIGRATE_HEADING("Without indexes"))
+                with transaction.atomic():
+                    self.drop_indexes()
+                    self.explain_queries()
+                    transaction.set_rollback(True)
+
+                self.stdout.write(self.style.MIGRATE_HEADING("With indexes"))
+                self.explain_queries()
+                raise Rollback()
+        except Rollback:
+            self.stdout.write("Benchmark data rolled back")
+
+    def seed_accounts(self, count, batch_size):
+        self.stdout.write(f"Seeding {count} linked accounts...")
+        accounts = [
+            LinkedAccount(
+                account_tracking_id=uuid.uuid4(),
+                phone_number=f"{20000000 + index}",
+                merchant_id=BENCHMARK_MERCHANT_ID,
+                is_active=index % 10 != 0,
+            )
+            for index in range(count)
+        ]
+        return LinkedAccount.objects.bulk_create(accounts, batch_size=batch_size)
+
+    def seed_transactions(self, accounts, count, batch_size):
+        self.stdout.write(f"Seeding {count} partner transactions...")
+        now = timezone.now()
+        statuses = [RequestStatus.APPROVED] * 90 + [RequestStatus.DECLINED] * 9 + [RequestStatus.DATA_API_PENDING]
+        for start in range(0, count, batch_size):
+            PartnerTransaction.objects.bulk_create(
+                [
+                    PartnerTransaction(
+                        operation_type=SendMoneyServiceOperationTypes.P2P,
+                        sender=random.choice(accounts),
+                        receiver=random.choice(accounts),
+                        amount_in_millimes=random.randint(1000, 1_000_000),
+                        operation_status=random.choice(statuses),
+                    )
+                    for _ in range(min(batch_size, count - start))
+                ],
+                batch_size=batch_size,
+            )
+        # auto_now_add ignores the values given to bulk_create, spread the rows over a year afterwards
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    "UPDATE partners_partnertransaction SET time_created = %s - random() * interval '365 days'",
+                    [now],
+                )
+            else:
+                cursor.execute(
+                    "UPDATE partners_partnertransaction "
+                    "SET time_created = datetime(%s, '-' || (abs(random()) %% 365) || ' days')",
+                    [now],
+                )
+
+    def drop_indexes(self):
+        quote_name = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            for model in (LinkedAccount, PartnerTransaction):
+                for index in model._meta.indexes:
+                    cursor.execute(f"DROP INDEX {quote_name(index.name)}")
+            if connection.vendor != "postgresql":
+                # sqlite unique constraints are part of the table definition and cannot be dropped
+                return
+            table = PartnerTransaction._meta.db_table
+            for name, constraint in connection.introspection.get_constraints(cursor, table).items():
+                if constraint["unique"] and not constraint["primary_key"] and constraint["columns"] == ["operation_id"]:
+                    cursor.execute(f"ALTER TABLE {quote_name(table)} DROP CONSTRAINT {quote_name(name)}")
+
+    def explain_queries(self):
+        sample = self.sample
+        queries = {
+            "IsValidPartnerUser": LinkedAccount.objects.filter(
+                phone_number=sample.phone_number,
+                partner_tracking_id=sample.partner_tracking_id,
+                merchant_id=BENCHMARK_MERCHANT_ID,
+                is_active=True,
+            ),
+            "IsPartnerAuthenticated": LinkedAccount.objects.filter(
+                partner_tracking_id=sample.partner_tracking_id, merchant_id=BENCHMARK_MERCHANT_ID
+            ),
+            "InitiateLinkAccountView": LinkedAccount.objects.filter(
+                phone_number=sample.phone_number, merchant_id=BENCHMARK_MERCHANT_ID, is_active=True
+            ),
+            "Data api catcher": PartnerTransaction.objects.filter(
+                operation_id=self.sample_operation_id, operation_status__in=[RequestStatus.DATA_API_PENDING]
+            ),
+            "History page": PartnerTransaction.objects.filter(Q(sender=sample) | Q(receiver=sample)).order_by(
+                "-time_created"
+            )[:20],
+            "Pending data api operations": PartnerTransaction.objects.filter(
+                operation_status=RequestStatus.DATA_API_PENDING
+            ).order_by("time_created")[:100],
+        }
+        for name, queryset in queries.items():
+            self.stdout.write(self.style.SUCCESS(name))
+            self.stdout.write(queryset.explain(analyze=True) if self.analyze else queryset.explain())
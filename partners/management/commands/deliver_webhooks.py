@@ -0,0 +1,35 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from partners.webhook_dispatcher import WebhookDispatcher
+from settings.settings import (
+    WEBHOOK_DELIVERY_PER_HOST_CONCURRENCY,
+    WEBHOOK_DELIVERY_WORKERS,
+)
+
+
+class Command(BaseCommand):
+    help = "Deliver the pending developer webhooks of the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit once no delivery is due")
+        parser.add_argument("--workers", type=int, default=WEBHOOK_DELIVERY_WORKERS)
+        parser.add_argument("--per-host", type=int, default=WEBHOOK_DELIVERY_PER_HOST_CONCURRENCY)
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between two outbox polls")
+
+    def handle(self, *args, **options):
+        stopping = []
+
+        def stop(signum, frame):
+            self.stdout.write("Stopping after the deliveries in flight...")
+            stopping.append(signum)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        dispatcher = WebhookDispatcher(max_workers=options["workers"], per_host_concurrency=options["per_host"])
+        processed = dispatcher.run(
+            poll_interval=options["poll_interval"], once=options["once"], should_stop=lambda: bool(stopping)
+        )
+        self.stdout.write(f"Processed {processed} webhook deliveries")
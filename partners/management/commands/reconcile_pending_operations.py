@@ -0,0 +1,43 @@
+import signal
+
+from django.core.management.base import BaseCommand
+from prometheus_client import start_http_server
+
+from partners.reconciler import PendingOperationReconciler
+from settings.settings import (
+    PARTNER_RECONCILE_BATCH_SIZE,
+    PARTNER_RECONCILE_CONCURRENCY,
+    PARTNER_RECONCILE_INTERVAL,
+    PARTNER_RECONCILE_STALE_AFTER,
+)
+
+
+class Command(BaseCommand):
+    help = "Settle the partner operations whose data api webhook never came by asking the backend for their status"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit after one sweep")
+        parser.add_argument("--stale-after", type=int, default=PARTNER_RECONCILE_STALE_AFTER, help="Seconds")
+        parser.add_argument("--batch-size", type=int, default=PARTNER_RECONCILE_BATCH_SIZE)
+        parser.add_argument("--concurrency", type=int, default=PARTNER_RECONCILE_CONCURRENCY)
+        parser.add_argument("--interval", type=int, default=PARTNER_RECONCILE_INTERVAL, help="Seconds between sweeps")
+        parser.add_argument("--metrics-port", type=int, default=0, help="Serve the prometheus metrics on this port")
+
+    def handle(self, *args, **options):
+        stopping = []
+
+        def stop(signum, frame):
+            self.stdout.write("Stopping after the current sweep...")
+            stopping.append(signum)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        if options["metrics_port"]:
+            start_http_server(options["metrics_port"])
+
+        reconciler = PendingOperationReconciler(
+            stale_after=options["stale_after"], batch_size=options["batch_size"], concurrency=options["concurrency"]
+        )
+        settled = reconciler.run(interval=options["interval"], once=options["once"], should_stop=lambda: bool(stopping))
+        self.stdout.write(f"Settled {settled} stale partner operations")
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.20 on 2026-10-18 01:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("partners", "0003_linkedaccount_app_linkedaccount_is_active"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WebhookDelivery",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("url", models.URLField(max_length=1000)),
+                ("host", models.CharField(max_length=255)),
+                ("params", models.JSONField(blank=True, default=dict)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "Pending"),
+                            ("DELIVERED", "Delivered"),
+                            ("DEAD", "Dead"),
+                        ],
+                        default="PENDING",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("last_error", models.TextField(blank=True, null=True)),
+                ("time_created", models.DateTimeField(auto_now_add=True)),
+                ("time_modified", models.DateTimeField(auto_now=True)),
+                (
+                    "partner_transaction",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="webhook_deliveries",
+                        to="partners.partnertransaction",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Webhook Delivery",
+                "verbose_name_plural": "Webhook Deliveries",
+                "indexes": [
+                    models.Index(
+                        fields=["status", "next_attempt_at"],
+                        name="webhook_status_next_attempt",
+                    )
+                ],
+            },
+        ),
+    ]
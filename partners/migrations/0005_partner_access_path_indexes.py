@@ -0,0 +1,125 @@
+# Generated by Django 4.2.20 on 2026-10-18 01:17
+
+import uuid
+
+from django.contrib.postgres.operations import (
+    AddIndexConcurrently,
+    NotInTransactionMixin,
+)
+from django.db import migrations, models
+from django.db.models import Count
+
+OPERATION_ID_UNIQUE = "partner_tx_operation_id_uniq"
+
+
+class AddIndexConcurrentlyOnPostgres(AddIndexConcurrently):
+    """CREATE INDEX CONCURRENTLY on postgresql, a plain AddIndex on the sqlite test database."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        return migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        return migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class AlterFieldUniqueConcurrentlyOnPostgres(NotInTransactionMixin, migrations.AlterField):
+    """
+    On postgresql, build the unique index with CREATE UNIQUE INDEX CONCURRENTLY and attach it as the constraint,
+    so the table is never locked for the length of an index build. A plain AlterField elsewhere.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != "postgresql":
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        self._ensure_not_in_transaction(schema_editor)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        table = schema_editor.quote_name(model._meta.db_table)
+        column = schema_editor.quote_name(model._meta.get_field(self.name).column)
+        name = schema_editor.quote_name(OPERATION_ID_UNIQUE)
+        schema_editor.execute(f"CREATE UNIQUE INDEX CONCURRENTLY {name} ON {table} ({column})")
+        schema_editor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE USING INDEX {name}")
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != "postgresql":
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        table = schema_editor.quote_name(model._meta.db_table)
+        schema_editor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {schema_editor.quote_name(OPERATION_ID_UNIQUE)}")
+
+
+def refuse_duplicate_operation_ids(apps, schema_editor):
+    """Fail before any index is built instead of halfway through the migration."""
+    PartnerTransaction = apps.get_model("partners", "PartnerTransaction")
+    duplicates = list(
+        PartnerTransaction.objects.order_by()
+        .values("operation_id")
+        .annotate(rows=Count("id"))
+        .filter(rows__gt=1)
+        .values_list("operation_id", flat=True)[:10]
+    )
+    if duplicates:
+        raise RuntimeError(
+            "partners_partnertransaction.operation_id has duplicated values, resolve them before making it unique: "
+            + ", ".join(str(operation_id) for operation_id in duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently on postgresql, which cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("partners", "0004_webhookdelivery"),
+    ]
+
+    operations = [
+        migrations.RunPython(refuse_duplicate_operation_ids, migrations.RunPython.noop),
+        AlterFieldUniqueConcurrentlyOnPostgres(
+            model_name="partnertransaction",
+            name="operation_id",
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name="linkedaccount",
+            index=models.Index(
+                fields=["partner_tracking_id", "merchant_id"],
+                name="linked_account_partner_mid",
+            ),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name="linkedaccount",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["phone_number", "merchant_id"],
+                name="linked_account_active_phone",
+            ),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name="linkedaccount",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["account_tracking_id", "merchant_id"],
+                name="linked_account_active_account",
+            ),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name="partnertransaction",
+            index=models.Index(fields=["sender", "-time_created"], name="partner_tx_sender_created"),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name="partnertransaction",
+            index=models.Index(fields=["receiver", "-time_created"], name="partner_tx_receiver_created"),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name="partnertransaction",
+            index=models.Index(
+                condition=models.Q(("operation_status", "DP")),
+                fields=["time_created"],
+                name="partner_tx_data_api_pending",
+            ),
+        ),
+    ]
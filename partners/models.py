@@ -1,8 +1,25 @@
 import uuid
+from urllib.parse import urlsplit
 
 from django.db import models
+from django.utils import timezone
 
 from api.enum import RequestStatus, SendMoneyServiceOperationTypes
+from settings.settings import (
+    LINKED_ACCOUNT_CACHE_TIMEOUT,
+    LINKED_ACCOUNT_LOCAL_CACHE_SIZE,
+    LINKED_ACCOUNT_LOCAL_CACHE_TIMEOUT,
+    LINKED_ACCOUNT_NEGATIVE_CACHE_TIMEOUT,
+)
+from utils.cache_helper import TwoTierCache
+
+linked_account_cache = TwoTierCache(
+    "linked_account",
+    timeout=LINKED_ACCOUNT_CACHE_TIMEOUT,
+    local_timeout=LINKED_ACCOUNT_LOCAL_CACHE_TIMEOUT,
+    local_maxsize=LINKED_ACCOUNT_LOCAL_CACHE_SIZE,
+    negative_timeout=LINKED_ACCOUNT_NEGATIVE_CACHE_TIMEOUT,
+)
 
 
 class LinkedAccount(models.Model):
@@ -19,14 +36,50 @@ class LinkedAccount(models.Model):
     class Meta:
         verbose_name = "Linked Account"
         verbose_name_plural = "Linked Accounts"
+        indexes = [
+            # IsPartnerAuthenticated, AuthenticateView and IsValidPartnerUser
+            models.Index(fields=["partner_tracking_id", "merchant_id"], name="linked_account_partner_mid"),
+            # Already linked checks of InitiateLinkAccountView, only the active links matter
+            models.Index(
+                fields=["phone_number", "merchant_id"],
+                name="linked_account_active_phone",
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=["account_tracking_id", "merchant_id"],
+                name="linked_account_active_account",
+                condition=models.Q(is_active=True),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.partner_tracking_id}"
 
+    @classmethod
+    def get_by_partner_tracking_id(cls, partner_tracking_id, merchant_id):
+        """Cached lookup of a linked account (active or not) of a merchant, None if there is no match."""
+        try:
+            partner_tracking_id = str(uuid.UUID(str(partner_tracking_id)))
+        except ValueError:
+            return None
+        merchant_id = str(merchant_id)
+        return linked_account_cache.get_or_load(
+            (partner_tracking_id, merchant_id),
+            lambda: cls.objects.filter(partner_tracking_id=partner_tracking_id, merchant_id=merchant_id).first(),
+        )
+
+    def invalidate_cache(self, merchant_id=None):
+        """
+        Drop the cached lookup of this account, call it after any change to the account.
+        Pass the previous merchant_id when it has just been changed so the old lookup stops resolving as well.
+        """
+        for merchant in {self.merchant_id, merchant_id or self.merchant_id}:
+            linked_account_cache.invalidate(str(self.partner_tracking_id), str(merchant))
+
 
 class PartnerTransaction(models.Model):
     id = models.BigAutoField(primary_key=True, serialize=False)
-    operation_id = models.UUIDField(default=uuid.uuid4, editable=False)
+    operation_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     operation_type = models.CharField(max_length=50, null=True, choices=SendMoneyServiceOperationTypes.get_choices())
     sender = models.ForeignKey(
         LinkedAccount, on_delete=models.PROTECT, blank=True, null=True, related_name="sender_transactions"
@@ -43,6 +96,80 @@ class PartnerTransaction(models.Model):
     time_created = models.DateTimeField(auto_now_add=True)
     time_modified = models.DateTimeField(auto_now=True)
 
-    def set_operation_status(self, operation_status):
-        self.operation_status = operation_status
-        self.save(update_fields=["operation_status"])
+    class Meta:
+        indexes = [
+            # History of an account: (sender = x OR receiver = x) ORDER BY time_created DESC
+            models.Index(fields=["sender", "-time_created"], name="partner_tx_sender_created"),
+            models.Index(fields=["receiver", "-time_created"], name="partner_tx_receiver_created"),
+            # Operations still waiting for the data api, a small fraction of the table
+            models.Index(
+                fields=["time_created"],
+                name="partner_tx_data_api_pending",
+                condition=models.Q(operation_status=RequestStatus.DATA_API_PENDING),
+            ),
+        ]
+
+    def transition(self, from_status, to_status, **fields):
+        """
+        Move the operation from `from_status` to `to_status` with a single conditional UPDATE also writing `fields`.
+        Returns False and leaves the instance untouched when the row was no longer in `from_status`: a duplicate
+        webhook or another worker settled the operation first.
+        """
+        changes = {"operation_status": to_status, "time_modified": timezone.now(), **fields}
+        won = PartnerTransaction.objects.filter(id=self.id, operation_status=from_status).update(**changes) == 1
+        if won:
+            for name, value in changes.items():
+                setattr(self, name, value)
+        return won
+
+
+class WebhookDelivery(models.Model):
+    """
+    Outbox of the webhooks to send to developers, delivered out of the request thread
+    by the `deliver_webhooks` management command.
+    """
+
+    class DeliveryStatus(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        DELIVERED = "DELIVERED", "Delivered"
+        DEAD = "DEAD", "Dead"
+
+    id = models.BigAutoField(primary_key=True, serialize=False)
+    partner_transaction = models.ForeignKey(
+        PartnerTransaction, on_delete=models.PROTECT, blank=True, null=True, related_name="webhook_deliveries"
+    )
+    url = models.URLField(max_length=1000)
+    host = models.CharField(max_length=255)  # destination host, used to bound the parallelism per partner
+    params = models.JSONField(blank=True, default=dict)
+    status = models.CharField(max_length=20, choices=DeliveryStatus.choices, default=DeliveryStatus.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+    time_created = models.DateTimeField(auto_now_add=True)
+    time_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Webhook Delivery"
+        verbose_name_plural = "Webhook Deliveries"
+        indexes = [models.Index(fields=["status", "next_attempt_at"], name="webhook_status_next_attempt")]
+
+    def __str__(self):
+        return f"{self.url} ({self.status})"
+
+    @classmethod
+    def for_operation(cls, operation):
+        """Unsaved notification of the developer webhook of a finished partner operation, for bulk_create."""
+        url = operation.operation_payload.get("webhook")
+        return cls(
+            partner_transaction=operation,
+            url=url,
+            host=urlsplit(url).netloc.lower(),
+            params={"success": True, "operation_id": str(operation.operation_id)},
+        )
+
+    @classmethod
+    def enqueue_for_operation(cls, operation):
+        """Schedule the notification of the developer webhook of a finished partner operation."""
+        delivery = cls.for_operation(operation)
+        delivery.save()
+        return delivery
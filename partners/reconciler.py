@@ -0,0 +1,184 @@
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from api.enum import RequestStatus
+from partners.models import PartnerTransaction, WebhookDelivery
+from settings.settings import (
+    PARTNER_RECONCILE_BATCH_SIZE,
+    PARTNER_RECONCILE_CONCURRENCY,
+    PARTNER_RECONCILE_STALE_AFTER,
+)
+from utils.backend_client import FlouciBackendClient
+from utils.metrics import (
+    PENDING_OPERATION_AGE,
+    PENDING_OPERATIONS,
+    RECONCILED_OPERATIONS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Final statuses of the backend operations, any other status is left pending for the next sweep.
+# The operations sent by partners/send_money are registered by the backend under their operation_id, like the
+# developers/send_money ones: check_send_money_status answers for both with the operation id and the merchant id
+# the money was sent with, {"success": true, "result": {"status": "SUCCESS", "transaction_id": "..."}}.
+# An unknown operation is not a success and stays pending, it is never declined.
+UPSTREAM_STATUSES = {
+    "SUCCESS": RequestStatus.APPROVED,
+    "FAILED": RequestStatus.DECLINED,
+    "EXPIRED": RequestStatus.DECLINED,
+}
+RESULT_LABELS = {RequestStatus.APPROVED: "approved", RequestStatus.DECLINED: "declined"}
+
+
+class PendingOperationReconciler:
+    """
+    Settles the partner operations left in DATA_API_PENDING when the data api webhook (SendMoneyDeveloperApiCatcher)
+    never came. The operations older than `stale_after` seconds are read in batches along the
+    partner_tx_data_api_pending index, the backend is asked for their status `concurrency` calls at a time and the
+    final statuses and transaction ids are written with one bulk update per batch, like the webhook would have.
+
+    HTTP calls run in a thread pool, every database access stays in the calling thread.
+    """
+
+    def __init__(
+        self,
+        stale_after=PARTNER_RECONCILE_STALE_AFTER,
+        batch_size=PARTNER_RECONCILE_BATCH_SIZE,
+        concurrency=PARTNER_RECONCILE_CONCURRENCY,
+    ):
+        self.stale_after = timedelta(seconds=stale_after)
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+
+    def stale_queryset(self):
+        return PartnerTransaction.objects.filter(
+            operation_status=RequestStatus.DATA_API_PENDING, time_created__lt=timezone.now() - self.stale_after
+        )
+
+    def stale_batches(self):
+        """Yield the stale operations oldest first, `batch_size` at a time, with a keyset on (time_created, id)."""
+        queryset = self.stale_queryset().order_by("time_created", "id")
+        last = None
+        while True:
+            page = queryset
+            if last is not None:
+                page = page.filter(
+                    Q(time_created__gt=last.time_created) | Q(time_created=last.time_created, id__gt=last.id)
+                )
+            batch = list(page[: self.batch_size])
+            if not batch:
+                return
+            yield batch
+            last = batch[-1]
+
+    def update_backlog_metrics(self):
+        backlog = self.stale_queryset().aggregate(count=Count("id"), oldest=Min("time_created"))
+        PENDING_OPERATIONS.set(backlog["count"])
+        age = (timezone.now() - backlog["oldest"]).total_seconds() if backlog["oldest"] else 0
+        PENDING_OPERATION_AGE.set(age)
+        return backlog["count"]
+
+    @staticmethod
+    def check(operation):
+        """
+        (final status, backend transaction id) of the operation according to the backend, (None, None) while it is
+        not settled or unknown.
+        """
+        try:
+            response = FlouciBackendClient.developer_check_send_money_status(
+                operation_id=str(operation.operation_id), sender_id=operation.operation_payload.get("merchant_id")
+            )
+        except Exception as e:
+            logger.warning(f"Status check of operation {operation.operation_id} failed: {e}")
+            return None, None
+        result = response.get("result") if response.get("success") else None
+        if not isinstance(result, dict):
+            return None, None
+        operation_status = UPSTREAM_STATUSES.get(result.get("status"))
+        transaction_id = result.get("transaction_id")
+        if operation_status == RequestStatus.DECLINED and transaction_id:
+            # The money may have moved, declining the operation could make the partner send it again
+            logger.error(
+                f"Operation {operation.operation_id} reported {result['status']} with transaction {transaction_id}, "
+                "left pending"
+            )
+            return None, None
+        return operation_status, transaction_id
+
+    @staticmethod
+    def apply(settlements):
+        """
+        Write the (operation, operation_status, transaction_id) settlements of the operations still pending, returns
+        the settled operations. Rows locked or already settled by the webhook meanwhile are left to it.
+        """
+        settlements = {settlement[0].id: settlement for settlement in settlements}
+        now = timezone.now()
+        with transaction.atomic():
+            ids = (
+                PartnerTransaction.objects.select_for_update(skip_locked=True)
+                .filter(id__in=list(settlements), operation_status=RequestStatus.DATA_API_PENDING)
+                .values_list("id", flat=True)
+            )
+            settled = []
+            for operation_id in ids:
+                operation, operation_status, transaction_id = settlements[operation_id]
+                operation.operation_status = operation_status
+                operation.blockchain_ref = transaction_id or operation.blockchain_ref
+                operation.time_modified = now
+                settled.append(operation)
+            PartnerTransaction.objects.bulk_update(settled, ["operation_status", "blockchain_ref", "time_modified"])
+            WebhookDelivery.objects.bulk_create(
+                WebhookDelivery.for_operation(operation)
+                for operation in settled
+                if operation.operation_status == RequestStatus.APPROVED and operation.operation_payload.get("webhook")
+            )
+        return settled
+
+    def reconcile(self):
+        """One sweep over the stale operations, returns the number of operations checked per result."""
+        results = Counter()
+        if not self.update_backlog_metrics():
+            return results
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for batch in self.stale_batches():
+                settlements = []
+                for operation, (operation_status, transaction_id) in zip(batch, executor.map(self.check, batch)):
+                    if operation_status is None:
+                        results["pending"] += 1
+                    else:
+                        settlements.append((operation, operation_status, transaction_id))
+                if not settlements:
+                    continue
+                settled = self.apply(settlements)
+                for operation in settled:
+                    results[RESULT_LABELS[operation.operation_status]] += 1
+                if len(settled) < len(settlements):
+                    results["settled_elsewhere"] += len(settlements) - len(settled)
+        for result, count in results.items():
+            RECONCILED_OPERATIONS.labels(result).inc(count)
+        self.update_backlog_metrics()
+        logger.info(f"Reconciled stale partner operations: {dict(results)}")
+        return results
+
+    def run(self, interval=60, once=False, should_stop=lambda: False):
+        """
+        Sweep every `interval` seconds until `should_stop()` is true, or only once when `once` is set.
+        Returns the number of settled operations.
+        """
+        settled = 0
+        while not should_stop():
+            results = self.reconcile()
+            settled += results["approved"] + results["declined"]
+            if once:
+                break
+            deadline = time.monotonic() + interval
+            while not should_stop() and time.monotonic() < deadline:
+                time.sleep(min(1.0, interval))
+        return settled
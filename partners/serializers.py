@@ -13,6 +13,7 @@ from partners.validators import (
     validator_string_is_digit,
     validator_string_is_phone_number,
 )
+from settings.settings import POS_STATUS_WAIT_MAX_TIMEOUT
 
 
 class DefaultSerializer(serializers.Serializer):
@@ -92,11 +93,17 @@ class BaseRequestViewSerializer(serializers.Serializer):
 class FilterHistorySerializer(BaseRequestViewSerializer):
     page = serializers.IntegerField(min_value=1, default=1)
     size = serializers.IntegerField(min_value=1, max_value=10000, default=10)
+    pagination = serializers.ChoiceField(choices=["page", "cursor"], default="page")
+    cursor = serializers.CharField(required=False)
+    with_count = serializers.BooleanField(default=False)  # cursor pagination only
 
 
 class PartnerFilterHistorySerializer(DefaultPartnerSerializer, BaseRequestViewSerializer):
     page = serializers.IntegerField(min_value=1, default=1)
     size = serializers.IntegerField(min_value=1, max_value=10000, default=10)
+    pagination = serializers.ChoiceField(choices=["page", "cursor"], default="page")
+    cursor = serializers.CharField(required=False)
+    with_count = serializers.BooleanField(default=False)  # cursor pagination only
 
 
 class InitiatePaymentViewSerializer(DefaultSerializer):
@@ -177,6 +184,10 @@ class FetchPOSTransactionStatusSerializer(DefaultSerializer):
         return validate_data
 
 
+class WaitPOSTransactionStatusSerializer(FetchPOSTransactionStatusSerializer):
+    timeout = serializers.IntegerField(min_value=1, max_value=POS_STATUS_WAIT_MAX_TIMEOUT, default=25)
+
+
 class CancelPOSransactionViewSerializer(DefaultSerializer):
     id_terminal = serializers.CharField(max_length=16)
     serial_number = serializers.CharField(max_length=36)
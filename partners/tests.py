@@ -1,14 +1,36 @@
+import asyncio
 import logging
+import threading
+import time
 import uuid
-from unittest.mock import patch
-
+from unittest.mock import MagicMock, patch
+
+import requests
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework.test import APIClient, APITestCase
 
 from api.enum import RequestStatus, SendMoneyServiceOperationTypes
 from api.models import FlouciApp
-from partners.models import LinkedAccount, PartnerTransaction
+from partners.models import LinkedAccount, PartnerTransaction, WebhookDelivery
+from partners.reconciler import PendingOperationReconciler
+from partners.throttles import TransactionStatusThrottle
+from partners.views import (
+    pos_transaction_channel,
+    pos_transaction_lookup,
+    pos_transaction_status_flight,
+)
+from partners.webhook_dispatcher import WebhookDispatcher
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from utils.single_flight import SingleFlight
+from utils.status_events import status_events
+from utils.throttle_engines import LocalThrottleEngine, ThrottleModes
 
 
 class BaseCreateDeveloperApp(APITestCase):
@@ -169,7 +191,7 @@ class TestIsFlouciView(BaseCreateDeveloperApp):
             "phone_number": self.phone_number,
         }
 
-    @patch("utils.backend_client.FlouciBackendClient.is_flouci")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.is_flouci")
     def test_user_is_flouci(self, mock_is_flouci):
         mock_is_flouci.return_value = {
             "success": True,
@@ -181,7 +203,7 @@ class TestIsFlouciView(BaseCreateDeveloperApp):
         self.assertTrue(response.data.get("success"))
         self.assertTrue(response.data.get("is_flouci"))
 
-    @patch("utils.backend_client.FlouciBackendClient.is_flouci")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.is_flouci")
     def test_user_is_not_flouci(self, mock_is_flouci):
         mock_is_flouci.return_value = {
             "success": True,
@@ -193,7 +215,7 @@ class TestIsFlouciView(BaseCreateDeveloperApp):
         self.assertTrue(response.data.get("success"))
         self.assertFalse(response.data.get("is_flouci"))
 
-    @patch("utils.backend_client.FlouciBackendClient.is_flouci")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.is_flouci")
     def test_phone_number_not_exist(self, mock_is_flouci):
         mock_is_flouci.return_value = {
             "success": True,
@@ -230,7 +252,7 @@ class TestAuthenticateView(BaseCreateDeveloperApp):
             app=self.app,
         )
 
-    @patch("utils.backend_client.FlouciBackendClient.generate_authentication_token")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.generate_authentication_token")
     def test_authenticate_success(self, mock_generate_token):
         mock_generate_token.return_value = {
             "success": True,
@@ -258,7 +280,7 @@ class TestAuthenticateView(BaseCreateDeveloperApp):
             "XIifQ.LPMtxeGgD1b3Htb-vlSBGzH0sDk2lmBaP0RDYCbSJoGJAEUvtFT3OeQE5kpiM_73UEKwyC7pR19FcRxiYHD6Fw",
         )
 
-    @patch("utils.backend_client.FlouciBackendClient.generate_authentication_token")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.generate_authentication_token")
     def test_authenticate_success_mrtchant_not_ppa(self, mock_generate_token):
         mock_generate_token.return_value = {
             "success": False,
@@ -278,7 +300,7 @@ class TestAuthenticateView(BaseCreateDeveloperApp):
         self.assertFalse(response.data.get("success"))
         self.assertEqual(response.data.get("is_ppa"), False)
 
-    @patch("utils.backend_client.FlouciBackendClient.generate_authentication_token")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.generate_authentication_token")
     def test_linked_account_not_found(self, mock_generate_token):
         mock_generate_token.return_value = {
             "success": False,
@@ -341,7 +363,7 @@ class TestPartnerBalanceView(BaseCreateDeveloperApp):
             app=self.app,
         )
 
-    @patch("utils.backend_client.FlouciBackendClient.get_user_balance")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.get_user_balance")
     def test_balance_success(self, mock_get_balance):
         mock_get_balance.return_value = {
             "success": True,
@@ -359,7 +381,34 @@ class TestPartnerBalanceView(BaseCreateDeveloperApp):
         self.assertTrue(response.data.get("success"))
         self.assertEqual(response.data.get("balance"), 1000)
 
-    @patch("utils.backend_client.FlouciBackendClient.get_user_balance")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.get_user_balance")
+    def test_linked_account_resolved_from_cache(self, mock_get_balance):
+        mock_get_balance.return_value = {"success": True, "balance": 1000, "status_code": 200}
+        param = {"phone_number": self.phone_number, "tracking_id": self.partner_tracking_id}
+        self.client.get(self.url, data=param, headers=self.valid_headers)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, data=param, headers=self.valid_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in queries if "partners_linkedaccount" in query["sql"]])
+
+    @patch("api.permissions.verify_backend_token")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.get_user_balance")
+    def test_deactivated_account_rejected_at_once(self, mock_get_balance, mock_verify_token):
+        mock_get_balance.return_value = {"success": True, "balance": 1000, "status_code": 200}
+        mock_verify_token.return_value = (True, {"tracking_id": self.account_tracking_id})
+        param = {"phone_number": self.phone_number, "tracking_id": self.partner_tracking_id}
+        self.assertEqual(self.client.get(self.url, data=param, headers=self.valid_headers).status_code, 200)
+
+        response = self.client.put(
+            reverse("partner_connected_apps"),
+            data={"public_token": self.public_token},
+            format="json",
+            headers={"Authorization": "Bearer token"},
+        )
+        self.assertFalse(response.data["is_active"])
+        self.assertEqual(self.client.get(self.url, data=param, headers=self.valid_headers).status_code, 403)
+
+    @patch("utils.backend_client.AsyncFlouciBackendClient.get_user_balance")
     def test_missing_parameters(self, mock_get_balance):
         mock_get_balance.return_value = {
             "success": True,
@@ -375,7 +424,7 @@ class TestPartnerBalanceView(BaseCreateDeveloperApp):
         response = self.client.get(self.url, data=param, headers=self.valid_headers)
         self.assertEqual(response.status_code, 403)
 
-    @patch("utils.backend_client.FlouciBackendClient.get_user_balance")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.get_user_balance")
     def test_invalid_linked_account(self, mock_get_balance):
         mock_get_balance.return_value = {
             "success": True,
@@ -388,7 +437,7 @@ class TestPartnerBalanceView(BaseCreateDeveloperApp):
         self.assertEqual(response.status_code, 403)
         self.assertEqual(response.data["message"], "Invalid credentials")
 
-    @patch("utils.backend_client.FlouciBackendClient.get_user_balance")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.get_user_balance")
     def test_invalid_authorization_token(self, mock_get_balance):
         mock_get_balance.return_value = {
             "success": True,
@@ -503,6 +552,84 @@ class TestPartnerHistoryView(BaseCreateDeveloperApp):
         self.assertEqual(response.status_code, 200)
         self.assertGreater(len(response.data["results"]), 0)
 
+    def create_transactions(self, count):
+        return [
+            PartnerTransaction.objects.create(
+                operation_type=SendMoneyServiceOperationTypes.P2P,
+                sender=self.linked_account,
+                receiver=self.linked_account,
+                amount_in_millimes=1000 + index,
+                operation_status=RequestStatus.APPROVED,
+            )
+            for index in range(count)
+        ]
+
+    def test_history_page_size_is_per_request(self):
+        self.create_transactions(3)
+        param = {"phone_number": self.phone_number, "tracking_id": str(self.app.tracking_id)}
+        response = self.client.get(self.url, {**param, "size": 1}, headers=self.valid_headers)
+        self.assertEqual(len(response.data["results"]), 1)
+        response = self.client.get(self.url, param, headers=self.valid_headers)
+        self.assertEqual(len(response.data["results"]), 3)
+        response = self.client.get(self.url, {**param, "page_size": 2}, headers=self.valid_headers)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIn("page_size=2", response.data["next"])
+        response = self.client.get(self.url, {**param, "size": 1, "page_size": 2}, headers=self.valid_headers)
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_history_cursor_pagination(self):
+        operations = self.create_transactions(5)
+        expected = [str(operation.operation_id) for operation in reversed(operations)]
+        param = {
+            "phone_number": self.phone_number,
+            "tracking_id": str(self.app.tracking_id),
+            "pagination": "cursor",
+            "size": 2,
+        }
+        response = self.client.get(self.url, param, headers=self.valid_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("count", response.data)
+        self.assertIsNone(response.data["previous"])
+        pages = [response.data]
+        while pages[-1]["next"]:
+            pages.append(self.client.get(pages[-1]["next"], headers=self.valid_headers).data)
+        self.assertEqual([len(page["results"]) for page in pages], [2, 2, 1])
+        self.assertEqual([result["operation_id"] for page in pages for result in page["results"]], expected)
+
+        response = self.client.get(pages[-1]["previous"], headers=self.valid_headers)
+        self.assertEqual(response.data["results"], pages[1]["results"])
+
+        response = self.client.get(self.url, {**param, "with_count": "true"}, headers=self.valid_headers)
+        self.assertEqual(response.data["count"], 5)
+
+    def test_history_query_count_does_not_depend_on_page_size(self):
+        receiver = LinkedAccount.objects.create(
+            phone_number="33333333", merchant_id=self.app.merchant_id, account_tracking_id=uuid.uuid4()
+        )
+        for _ in range(10):
+            PartnerTransaction.objects.create(
+                operation_type=SendMoneyServiceOperationTypes.P2P,
+                sender=self.linked_account,
+                receiver=receiver,
+                amount_in_millimes=1000,
+                operation_status=RequestStatus.APPROVED,
+            )
+        param = {"phone_number": self.phone_number, "tracking_id": str(self.app.tracking_id)}
+        self.client.get(self.url, param, headers=self.valid_headers)
+        query_counts = []
+        for size in (1, 10):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url, {**param, "size": size}, headers=self.valid_headers)
+            self.assertEqual(len(response.data["results"]), size)
+            self.assertEqual(response.data["results"][0]["receiver"], "33333333")
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_history_invalid_cursor(self):
+        param = {"phone_number": self.phone_number, "tracking_id": str(self.app.tracking_id), "cursor": "invalid"}
+        response = self.client.get(self.url, param, headers=self.valid_headers)
+        self.assertEqual(response.status_code, 404)
+
     def test_history_invalid_size(self):
         param = {
             "phone_number": self.phone_number,
@@ -585,6 +712,58 @@ class TestPartnerInitiatePaymentView(BaseCreateDeveloperApp):
         response = self.client.post(self.url, self.serializer_data, headers=self.valid_headers)
         self.assertEqual(response.status_code, 451)
 
+    @patch("utils.backend_client.FlouciBackendClient.send_money")
+    def test_retry_with_idempotency_key_is_replayed(self, mock_send_money):
+        mock_send_money.return_value = {"success": True, "blockchain_ref": "147582265886625", "status_code": 200}
+        headers = {**self.valid_headers, "Idempotency-Key": str(uuid.uuid4())}
+
+        first = self.client.post(self.url, self.serializer_data, headers=headers)
+        retry = self.client.post(self.url, self.serializer_data, headers=headers)
+
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry.headers["Idempotent-Replayed"], "true")
+        mock_send_money.assert_called_once()
+        self.assertEqual(PartnerTransaction.objects.filter(sender=self.linked_account).count(), 1)
+
+    @patch("utils.backend_client.FlouciBackendClient.send_money")
+    def test_idempotency_key_reused_for_another_request(self, mock_send_money):
+        mock_send_money.return_value = {"success": True, "blockchain_ref": "147582265886625", "status_code": 200}
+        headers = {**self.valid_headers, "Idempotency-Key": str(uuid.uuid4())}
+
+        self.client.post(self.url, self.serializer_data, headers=headers)
+        response = self.client.post(self.url, {**self.serializer_data, "amount_in_millimes": 6000}, headers=headers)
+
+        self.assertEqual(response.status_code, 422)
+        mock_send_money.assert_called_once()
+
+    @patch("requests.Session.request", side_effect=requests.exceptions.Timeout)
+    def test_timed_out_send_money_is_not_sent_again(self, mock_request):
+        headers = {**self.valid_headers, "Idempotency-Key": str(uuid.uuid4())}
+
+        self.assertEqual(self.client.post(self.url, self.serializer_data, headers=headers).status_code, 408)
+        retry = self.client.post(self.url, self.serializer_data, headers=headers)
+
+        self.assertEqual(retry.status_code, 409)
+        self.assertEqual(retry.headers["Idempotent-Replayed"], "true")
+        mock_request.assert_called_once()
+        self.assertEqual(PartnerTransaction.objects.filter(sender=self.linked_account).count(), 1)
+
+    @patch("requests.Session.request")
+    def test_send_money_refused_before_the_backend_can_be_retried(self, mock_request):
+        mock_request.return_value.status_code = 200
+        mock_request.return_value.content = b'{"blockchain_ref": "147582265886625"}'
+        headers = {**self.valid_headers, "Idempotency-Key": str(uuid.uuid4())}
+
+        with patch.object(CircuitBreaker, "before_call", side_effect=CircuitOpenError("send_money")):
+            self.assertEqual(self.client.post(self.url, self.serializer_data, headers=headers).status_code, 503)
+        mock_request.assert_not_called()
+        response = self.client.post(self.url, self.serializer_data, headers=headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Idempotent-Replayed", response.headers)
+        mock_request.assert_called_once()
+
 
 class TestInitiatePosTransaction(BaseCreateDeveloperApp):
     def setUp(self):
@@ -601,7 +780,7 @@ class TestInitiatePosTransaction(BaseCreateDeveloperApp):
             "developer_tracking_id": self.app.tracking_id,
         }
 
-    @patch("utils.backend_client.FlouciBackendClient.generate_pos_transaction")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.generate_pos_transaction")
     def test_pos_transaction_success(self, mock_generate_pos_transaction):
         mock_generate_pos_transaction.return_value = {
             "success": True,
@@ -614,6 +793,38 @@ class TestInitiatePosTransaction(BaseCreateDeveloperApp):
         self.assertTrue(response.data["success"])
         self.assertEqual(response.data["terminal_id"], "99142")
 
+    @patch("utils.backend_client.AsyncFlouciBackendClient.generate_pos_transaction")
+    def test_multi_payment_segments_are_sent_concurrently(self, mock_generate_pos_transaction):
+        in_flight, max_in_flight = 0, 0
+
+        async def generate_pos_transaction(**kwargs):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            # The first segments answer last, the response must still follow the segments order
+            await asyncio.sleep(0.01 * (4 - int(kwargs["developer_tracking_id"])))
+            in_flight -= 1
+            if kwargs["developer_tracking_id"] == "2":
+                return {"success": False, "error": "Request timed out", "code": -2, "status_code": 408}
+            return {"success": True, "developer_tracking_id": kwargs["developer_tracking_id"], "status_code": 200}
+
+        mock_generate_pos_transaction.side_effect = generate_pos_transaction
+        data = {
+            "id_terminal": "99142",
+            "serial_number": "21141",
+            "is_multi_payment": True,
+            "payment_segments": [
+                {"amount_in_millimes": 5000, "payment_method": "card", "developer_tracking_id": str(index)}
+                for index in range(4)
+            ],
+        }
+        response = self.client.post(self.url, data, format="json", headers=self.valid_headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([segment["success"] for segment in response.data], [True, True, False, True])
+        self.assertEqual(response.data[3]["developer_tracking_id"], "3")
+        self.assertEqual(response.data[2]["status_code"], 408)
+        self.assertGreater(max_in_flight, 1)
+
     def test_missing_required_field(self):
         invalid_data = self.serializer_data.copy()
         del invalid_data["serial_number"]
@@ -639,7 +850,7 @@ class TestFetchPOSTransactionStatusView(BaseCreateDeveloperApp):
         self.token = f"{self.app.public_token}:{self.app.private_token}"
         self.valid_headers = {"Authorization": f"Bearer {self.token}"}
 
-    @patch("utils.backend_client.FlouciBackendClient.fetch_associated_partner_transaction")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.fetch_associated_partner_transaction")
     def test_fetch_pos_transaction_status_success(self, mock_fetch_status):
         mock_fetch_status.return_value = {
             "success": True,
@@ -654,7 +865,7 @@ class TestFetchPOSTransactionStatusView(BaseCreateDeveloperApp):
         response = self.client.get(self.url, self.serializer_data, headers=self.valid_headers)
         self.assertEqual(response.status_code, 200)
 
-    @patch("utils.backend_client.FlouciBackendClient.fetch_associated_partner_transaction")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.fetch_associated_partner_transaction")
     def test_fetch_pos_transaction_with_developer_tracking_id(self, mock_fetch_status):
         mock_fetch_status.return_value = {
             "success": True,
@@ -669,7 +880,7 @@ class TestFetchPOSTransactionStatusView(BaseCreateDeveloperApp):
         response = self.client.get(self.url, self.serializer_data, headers=self.valid_headers)
         self.assertEqual(response.status_code, 200)
 
-    @patch("utils.backend_client.FlouciBackendClient.fetch_associated_partner_transaction")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.fetch_associated_partner_transaction")
     def test_fetch_pos_transaction_with_both_field(self, mock_fetch_status):
         mock_fetch_status.return_value = {
             "success": True,
@@ -686,7 +897,7 @@ class TestFetchPOSTransactionStatusView(BaseCreateDeveloperApp):
         response = self.client.get(self.url, self.serializer_data, headers=self.valid_headers)
         self.assertEqual(response.status_code, 200)
 
-    @patch("utils.backend_client.FlouciBackendClient.fetch_associated_partner_transaction")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.fetch_associated_partner_transaction")
     def test_fetch_pos_transaction_not_allowed(self, mock_fetch_status):
         mock_fetch_status.return_value = {"success": False, "status_code": 406, "message": "Not allowed."}
         self.serializer_data = {
@@ -697,7 +908,7 @@ class TestFetchPOSTransactionStatusView(BaseCreateDeveloperApp):
         self.assertEqual(response.status_code, 406)
         self.assertIn("Not allowed.", response.data["message"])
 
-    @patch("utils.backend_client.FlouciBackendClient.fetch_associated_partner_transaction")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.fetch_associated_partner_transaction")
     def test_fetch_pos_transaction_not_found(self, mock_fetch_status):
         mock_fetch_status.return_value = {"success": False, "status_code": 404, "message": "Transaction not found"}
         self.serializer_data = {
@@ -708,6 +919,345 @@ class TestFetchPOSTransactionStatusView(BaseCreateDeveloperApp):
         self.assertEqual(response.status_code, 404)
         self.assertIn("Transaction not found", response.data["message"])
 
+    @patch("utils.backend_client.AsyncFlouciBackendClient.fetch_associated_partner_transaction")
+    def test_identical_requests_share_backend_call(self, mock_fetch_status):
+        mock_fetch_status.return_value = {"success": True, "payment_status": "PS", "status_code": 200}
+        self.serializer_data = {
+            "flouci_transaction_id": uuid.uuid4(),
+        }
+
+        for _ in range(3):
+            response = self.client.get(self.url, self.serializer_data, headers=self.valid_headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["payment_status"], "PS")
+        self.assertEqual(mock_fetch_status.call_count, 1)
+
+    @patch.object(TransactionStatusThrottle, "rate_limit", 1)
+    @patch("utils.backend_client.AsyncFlouciBackendClient.fetch_associated_partner_transaction")
+    def test_identical_requests_are_throttled(self, mock_fetch_status):
+        mock_fetch_status.return_value = {"success": True, "payment_status": "PS", "status_code": 200}
+        self.serializer_data = {
+            "flouci_transaction_id": uuid.uuid4(),
+        }
+
+        response = self.client.get(self.url, self.serializer_data, headers=self.valid_headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, self.serializer_data, headers=self.valid_headers)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response.headers)
+
+
+@patch.object(pos_transaction_status_flight, "result_timeout", 0)
+@patch("partners.views.ASGI_ENABLED", True)
+class TestWaitPOSTransactionStatusView(BaseCreateDeveloperApp):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("wait_pos_transaction_status")
+        self.valid_headers = {"Authorization": f"Bearer {self.app.public_token}:{self.app.private_token}"}
+        self.pending = {"success": True, "transactions": [{"payment_status": "PP"}], "status_code": 200}
+        self.resolved = {"success": True, "transactions": [{"payment_status": "PS"}], "status_code": 200}
+
+    @patch("partners.views.POS_STATUS_RECHECK_INTERVAL", 0.05)
+    @patch("utils.backend_client.AsyncFlouciBackendClient.fetch_associated_partner_transaction")
+    def test_held_until_resolved(self, mock_fetch_status):
+        mock_fetch_status.side_effect = [self.pending, self.pending, self.resolved]
+        data = {"flouci_transaction_id": str(uuid.uuid4()), "timeout": 5}
+        response = self.client.get(self.url, data, headers=self.valid_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["transactions"][0]["payment_status"], "PS")
+        self.assertEqual(mock_fetch_status.call_count, 3)
+
+    @patch("partners.views.POS_STATUS_RECHECK_INTERVAL", 10)
+    @patch("utils.backend_client.AsyncFlouciBackendClient.fetch_associated_partner_transaction")
+    def test_released_by_published_status(self, mock_fetch_status):
+        mock_fetch_status.return_value = self.pending
+        flouci_transaction_id = str(uuid.uuid4())
+        channel = pos_transaction_channel(pos_transaction_lookup(self.app.merchant_id, None, flouci_transaction_id))
+        publisher = threading.Timer(0.2, status_events.publish, args=(channel, self.resolved))
+        publisher.start()
+        started_at = time.monotonic()
+        response = self.client.get(
+            self.url, {"flouci_transaction_id": flouci_transaction_id, "timeout": 5}, headers=self.valid_headers
+        )
+        publisher.join()
+        self.assertLess(time.monotonic() - started_at, 5)
+        self.assertEqual(response.data["transactions"][0]["payment_status"], "PS")
+        self.assertEqual(mock_fetch_status.call_count, 1)
+
+    @patch("partners.views.POS_STATUS_RECHECK_INTERVAL", 0.2)
+    @patch("utils.backend_client.AsyncFlouciBackendClient.fetch_associated_partner_transaction")
+    def test_last_status_returned_on_timeout(self, mock_fetch_status):
+        mock_fetch_status.return_value = self.pending
+        data = {"flouci_transaction_id": str(uuid.uuid4()), "timeout": 1}
+        response = self.client.get(self.url, data, headers=self.valid_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["transactions"][0]["payment_status"], "PP")
+
+    @patch("partners.views.POS_STATUS_WSGI_WAIT_TIMEOUT", 0.2)
+    @patch("partners.views.POS_STATUS_RECHECK_INTERVAL", 10)
+    @patch("utils.backend_client.AsyncFlouciBackendClient.fetch_associated_partner_transaction")
+    def test_wait_capped_under_wsgi(self, mock_fetch_status):
+        mock_fetch_status.return_value = self.pending
+        data = {"flouci_transaction_id": str(uuid.uuid4()), "timeout": 20}
+        started_at = time.monotonic()
+        with patch("partners.views.ASGI_ENABLED", False):
+            response = self.client.get(self.url, data, headers=self.valid_headers)
+        self.assertLess(time.monotonic() - started_at, 2)
+        self.assertEqual(response.data["transactions"][0]["payment_status"], "PP")
+
+
+class TestSingleFlight(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_calls_are_coalesced(self):
+        flight = SingleFlight("test", wait_timeout=1)
+        calls = []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"status_code": 200}
+
+        async def run():
+            return await asyncio.gather(*(flight.do(("key",), call) for _ in range(5)))
+
+        results = async_to_sync(run)()
+        self.assertEqual(results, [{"status_code": 200}] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_other_worker_waits_for_leader_result(self):
+        leader, follower = SingleFlight("test", wait_timeout=1), SingleFlight("test", wait_timeout=1)
+        follower_call = MagicMock()
+
+        async def leader_call():
+            await asyncio.sleep(0.1)
+            return {"status_code": 200}
+
+        async def follower_call_async():
+            follower_call()
+            return {"status_code": 500}
+
+        async def run():
+            return await asyncio.gather(leader.do(("key",), leader_call), follower.do(("key",), follower_call_async))
+
+        self.assertEqual(async_to_sync(run)(), [{"status_code": 200}] * 2)
+        follower_call.assert_not_called()
+
+
+class TestThrottleEngines(TestCase):
+    def test_local_engine_modes(self):
+        engine = LocalThrottleEngine()
+        for mode in (ThrottleModes.FIXED_WINDOW, ThrottleModes.SLIDING_WINDOW, ThrottleModes.TOKEN_BUCKET):
+            results = [engine.hit(f"key_{mode}", mode, 2, 60)[0] for _ in range(3)]
+            self.assertEqual(results, [True, True, False], mode)
+            allowed, wait = engine.hit(f"key_{mode}", mode, 2, 60)
+            self.assertFalse(allowed)
+            self.assertGreater(wait, 0)
+
+
+class TestWebhookDispatcher(TestCase):
+    def setUp(self):
+        self.operation = PartnerTransaction.objects.create(
+            operation_type=SendMoneyServiceOperationTypes.P2P,
+            amount_in_millimes=1000,
+            operation_payload={"webhook": "https://Partner.example.com/hook"},
+            operation_status=RequestStatus.APPROVED,
+        )
+        self.delivery = WebhookDelivery.enqueue_for_operation(self.operation)
+        self.dispatcher = WebhookDispatcher(max_workers=2, per_host_concurrency=1, max_attempts=2)
+
+    def run_dispatcher(self, status_code=None, side_effect=None):
+        session = MagicMock()
+        session.get.return_value = MagicMock(status_code=status_code, __bool__=lambda _: status_code < 400)
+        session.get.side_effect = side_effect
+        with patch.object(self.dispatcher.session, "get", return_value=session):
+            processed = self.dispatcher.run(poll_interval=0.01, once=True)
+        self.delivery.refresh_from_db()
+        return processed, session
+
+    def test_enqueue_for_operation(self):
+        self.assertEqual(self.delivery.host, "partner.example.com")
+        self.assertEqual(self.delivery.params, {"success": True, "operation_id": str(self.operation.operation_id)})
+        self.assertEqual(self.delivery.status, WebhookDelivery.DeliveryStatus.PENDING)
+
+    def test_successful_delivery(self):
+        processed, session = self.run_dispatcher(status_code=200)
+        self.assertEqual(processed, 1)
+        session.get.assert_called_once()
+        self.assertEqual(self.delivery.status, WebhookDelivery.DeliveryStatus.DELIVERED)
+        self.operation.refresh_from_db()
+        self.assertTrue(self.operation.operation_payload["webhook_sent"])
+
+    def test_failed_delivery_is_retried_later_then_dead(self):
+        self.run_dispatcher(status_code=500)
+        self.assertEqual(self.delivery.status, WebhookDelivery.DeliveryStatus.PENDING)
+        self.assertEqual(self.delivery.attempts, 1)
+        self.assertGreater(self.delivery.next_attempt_at, timezone.now())
+
+        WebhookDelivery.objects.filter(id=self.delivery.id).update(next_attempt_at=timezone.now())
+        self.run_dispatcher(side_effect=ConnectionError("refused"))
+        self.assertEqual(self.delivery.status, WebhookDelivery.DeliveryStatus.DEAD)
+        self.assertEqual(self.delivery.attempts, 2)
+        self.operation.refresh_from_db()
+        self.assertNotIn("webhook_sent", self.operation.operation_payload)
+
+    def test_per_host_concurrency(self):
+        WebhookDelivery.enqueue_for_operation(self.operation)
+        self.assertEqual(len(self.dispatcher.claim(limit=2)), 1)
+
+
+class TestSendMoneyDeveloperApiCatcher(APITestCase):
+    def setUp(self):
+        self.url = reverse("internal_send_money_catcher")
+        self.operation = PartnerTransaction.objects.create(
+            operation_type=SendMoneyServiceOperationTypes.PAYMENT.value,
+            amount_in_millimes=1000,
+            operation_payload={"merchant_id": "mid", "webhook": "https://partner.example.com/hook"},
+            operation_status=RequestStatus.DATA_API_PENDING,
+        )
+        self.data = {"id": str(self.operation.operation_id), "result": {"success": True, "transactionId": "tx-1"}}
+
+    @patch("api.permissions.signed_request_is_valid", return_value=True)
+    def test_success_is_written_with_one_update(self, mock_signature):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, self.data, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        updates = [query for query in queries.captured_queries if query["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.operation.refresh_from_db()
+        self.assertEqual(self.operation.operation_status, RequestStatus.APPROVED)
+        self.assertEqual(self.operation.blockchain_ref, "tx-1")
+        self.assertEqual(WebhookDelivery.objects.filter(partner_transaction=self.operation).count(), 1)
+
+    @patch("api.permissions.signed_request_is_valid", return_value=True)
+    def test_status_change_rolled_back_when_the_webhook_is_not_queued(self, mock_signature):
+        self.client.raise_request_exception = False
+        with patch.object(WebhookDelivery, "enqueue_for_operation", side_effect=DatabaseError("outbox unavailable")):
+            self.assertEqual(self.client.post(self.url, self.data, format="json").status_code, 500)
+        self.operation.refresh_from_db()
+        self.assertEqual(self.operation.operation_status, RequestStatus.DATA_API_PENDING)
+
+        response = self.client.post(self.url, self.data, format="json")  # retried by the data api
+
+        self.assertEqual(response.data["message"], f"Operation {self.operation.operation_id} validated")
+        self.assertEqual(WebhookDelivery.objects.filter(partner_transaction=self.operation).count(), 1)
+
+    @patch("api.permissions.signed_request_is_valid", return_value=True)
+    def test_failure_declines_the_operation(self, mock_signature):
+        self.data["result"] = {"success": False}
+
+        response = self.client.post(self.url, self.data, format="json")
+
+        self.assertEqual(response.status_code, 412)
+        self.operation.refresh_from_db()
+        self.assertEqual(self.operation.operation_status, RequestStatus.DECLINED)
+
+    def test_only_one_of_concurrent_transitions_wins(self):
+        duplicate = PartnerTransaction.objects.get(id=self.operation.id)
+
+        self.assertTrue(
+            self.operation.transition(RequestStatus.DATA_API_PENDING, RequestStatus.APPROVED, blockchain_ref="tx-1")
+        )
+        self.assertFalse(
+            duplicate.transition(RequestStatus.DATA_API_PENDING, RequestStatus.APPROVED, blockchain_ref="tx-2")
+        )
+
+        self.assertEqual(duplicate.operation_status, RequestStatus.DATA_API_PENDING)
+        self.operation.refresh_from_db()
+        self.assertEqual(self.operation.blockchain_ref, "tx-1")
+
+
+class TestPendingOperationReconciler(TestCase):
+    def setUp(self):
+        self.reconciler = PendingOperationReconciler(stale_after=600, batch_size=2, concurrency=2)
+        self.upstream_statuses = {}
+        stale_time = timezone.now() - timezone.timedelta(hours=1)
+        for upstream_status in ("SUCCESS", "FAILED", "PENDING", "SUCCESS"):
+            operation = self.create_operation()
+            PartnerTransaction.objects.filter(id=operation.id).update(time_created=stale_time)
+            self.upstream_statuses[str(operation.operation_id)] = upstream_status
+        self.recent_operation = self.create_operation()
+
+    @staticmethod
+    def create_operation():
+        return PartnerTransaction.objects.create(
+            operation_type=SendMoneyServiceOperationTypes.PAYMENT.value,
+            amount_in_millimes=1000,
+            operation_payload={"merchant_id": "mid", "webhook": "https://partner.example.com/hook"},
+            operation_status=RequestStatus.DATA_API_PENDING,
+        )
+
+    def check_send_money_status(self, operation_id, sender_id):
+        # Response of developers/check_send_money_status for an operation sent through partners/send_money
+        self.assertEqual(sender_id, "mid")
+        upstream_status = self.upstream_statuses[operation_id]
+        result = {"status": upstream_status}
+        if upstream_status == "SUCCESS":
+            result["transaction_id"] = f"tx-{operation_id}"
+        return {"success": True, "result": result, "status_code": 200}
+
+    @patch("utils.backend_client.FlouciBackendClient.developer_check_send_money_status")
+    def test_stale_operations_are_settled(self, mock_check):
+        mock_check.side_effect = self.check_send_money_status
+
+        results = self.reconciler.reconcile()
+
+        self.assertEqual(results, {"approved": 2, "declined": 1, "pending": 1})
+        self.assertEqual(mock_check.call_count, 4)
+        operations = {
+            str(operation_id): (operation_status, blockchain_ref)
+            for operation_id, operation_status, blockchain_ref in PartnerTransaction.objects.values_list(
+                "operation_id", "operation_status", "blockchain_ref"
+            )
+        }
+        expected = {"SUCCESS": RequestStatus.APPROVED, "FAILED": RequestStatus.DECLINED, "PENDING": "DP"}
+        for operation_id, upstream_status in self.upstream_statuses.items():
+            blockchain_ref = f"tx-{operation_id}" if upstream_status == "SUCCESS" else None
+            self.assertEqual(operations[operation_id], (expected[upstream_status], blockchain_ref))
+        self.assertEqual(operations[str(self.recent_operation.operation_id)], (RequestStatus.DATA_API_PENDING, None))
+        self.assertEqual(WebhookDelivery.objects.count(), 2)
+        self.assertEqual(self.reconciler.update_backlog_metrics(), 1)
+
+    @patch("utils.backend_client.FlouciBackendClient.developer_check_send_money_status")
+    def test_operation_settled_by_the_webhook_meanwhile_is_left_alone(self, mock_check):
+        mock_check.side_effect = self.check_send_money_status
+        settled_id = next(key for key, value in self.upstream_statuses.items() if value == "SUCCESS")
+        operation = PartnerTransaction.objects.get(operation_id=settled_id)
+
+        self.assertEqual(len(self.reconciler.apply([(operation, RequestStatus.DECLINED, None)])), 1)
+        duplicate = PartnerTransaction.objects.get(operation_id=settled_id)
+        self.assertEqual(self.reconciler.apply([(duplicate, RequestStatus.APPROVED, "tx-1")]), [])
+
+        operation.refresh_from_db()
+        self.assertEqual((operation.operation_status, operation.blockchain_ref), (RequestStatus.DECLINED, None))
+        self.assertFalse(WebhookDelivery.objects.exists())
+
+    @patch("utils.backend_client.FlouciBackendClient.developer_check_send_money_status")
+    def test_expired_operation_declined_unless_money_moved(self, mock_check):
+        operation = PartnerTransaction.objects.get(operation_id=next(iter(self.upstream_statuses)))
+        mock_check.return_value = {"success": True, "result": {"status": "EXPIRED"}, "status_code": 200}
+        self.assertEqual(self.reconciler.check(operation), (RequestStatus.DECLINED, None))
+
+        mock_check.return_value = {
+            "success": True,
+            "result": {"status": "EXPIRED", "transaction_id": "tx-1"},
+            "status_code": 200,
+        }
+        self.assertEqual(self.reconciler.check(operation), (None, None))
+
+        mock_check.return_value = {"success": False, "message": "Operation not found", "status_code": 404}
+        self.assertEqual(self.reconciler.check(operation), (None, None))
+
+
+class TestBenchmarkPartnerIndexes(TestCase):
+    @patch("partners.management.commands.benchmark_partner_indexes.ENV", "PROD")
+    def test_refuses_to_drop_indexes_of_a_deployed_database(self):
+        with self.assertRaisesMessage(CommandError, "--i-know"):
+            call_command("benchmark_partner_indexes", transactions=10, accounts=2)
+        self.assertFalse(LinkedAccount.objects.filter(merchant_id="index-benchmark").exists())
+
 
 class TestBalanceView(BaseCreateDeveloperApp):
     def setUp(self):
@@ -726,7 +1276,7 @@ class TestBalanceView(BaseCreateDeveloperApp):
             app=self.app,
         )
 
-    @patch("utils.backend_client.FlouciBackendClient.get_user_balance")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.get_user_balance")
     @patch("api.permissions.verify_backend_token")
     def test_balance_success(self, mock_verify_token, mock_get_balance):
         mock_verify_token.return_value = (
@@ -750,7 +1300,7 @@ class TestBalanceView(BaseCreateDeveloperApp):
         self.assertTrue(response.data.get("success"))
         self.assertEqual(response.data.get("balance"), 1000)
 
-    @patch("utils.backend_client.FlouciBackendClient.get_user_balance")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.get_user_balance")
     @patch("api.permissions.verify_backend_token")
     def test_invalid_linked_account(self, mock_verify_token, mock_get_balance):
         mock_verify_token.return_value = (
@@ -772,7 +1322,7 @@ class TestBalanceView(BaseCreateDeveloperApp):
         self.assertEqual(response.status_code, 403)
         self.assertEqual(response.data["detail"], "Authentication credentials were not provided.")
 
-    @patch("utils.backend_client.FlouciBackendClient.get_user_balance")
+    @patch("utils.backend_client.AsyncFlouciBackendClient.get_user_balance")
     @patch("api.permissions.verify_backend_token")
     def test_invalid_authorization_token(self, mock_verify_token, mock_get_balance):
         mock_verify_token.return_value = (False, None)
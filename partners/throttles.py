@@ -1,24 +1,30 @@
 # throttles.py
 import hashlib
-import time
+import logging
 
-from django.core.cache import cache
 from rest_framework.throttling import BaseThrottle
 
-from settings.settings import THROTTLE_CACHE_TIMEOUT
+from settings.settings import THROTTLE_CACHE_TIMEOUT, TRANSACTION_STATUS_THROTTLE_RATE
+from utils.metrics import THROTTLE_REJECTIONS
+from utils.throttle_engines import ThrottleModes, get_throttle_engine
+
+logger = logging.getLogger(__name__)
 
 
 class GenericRequestThrottle(BaseThrottle):
     """
     Generic throttle that limits identical requests based on configurable fields and merchant.
-    Can be customized per view with different scopes, timeouts, and field combinations.
+    Can be customized per view with different scopes, timeouts, modes and field combinations.
+    The check-and-set is delegated to the throttle engine, atomic across workers when redis is enabled.
     """
 
     cache_format = "throttle_generic_%(scope)s_%(ident)s"
 
     # Default configuration - can be overridden in view or subclass
     scope = "default"
-    timeout_seconds = 10
+    timeout_seconds = 10  # length of the throttle window
+    throttle_mode = ThrottleModes.FIXED_WINDOW
+    rate_limit = 1  # identical requests allowed per window (bucket capacity in token bucket mode)
     merchant_field_path = "application.merchant_id"  # dot notation for nested access
     throttle_fields = []  # Fields to include in throttle key
     require_all_fields = False  # If True, all fields must be present; if False, at least one
@@ -115,31 +121,23 @@ class GenericRequestThrottle(BaseThrottle):
         if cache_key is None:
             return True
 
-        # Check if this exact request was made recently
-        last_request_time = cache.get(cache_key)
-        now = time.time()
-
-        if last_request_time is None:
-            # First request with this combination
-            cache.set(cache_key, now, timeout=self.timeout_seconds)
-            return True
-
-        # Check if enough time has passed since last request
-        time_since_last = now - last_request_time
-
-        if time_since_last >= self.timeout_seconds:
-            # Enough time has passed, allow request
-            cache.set(cache_key, now, timeout=self.timeout_seconds)
+        try:
+            allowed, self.wait_seconds = get_throttle_engine().hit(
+                cache_key, self.throttle_mode, self.rate_limit, self.timeout_seconds
+            )
+        except Exception as e:
+            # Never reject traffic because the throttle storage is unavailable
+            logger.error(f"Throttle engine failure for scope {self.scope}: {e}")
             return True
-        else:
-            # Not enough time, throttle the request
-            return False
+        if not allowed:
+            THROTTLE_REJECTIONS.labels(self.scope).inc()
+        return allowed
 
     def wait(self):
         """
         Return the number of seconds to wait before the next request is allowed.
         """
-        return self.timeout_seconds
+        return getattr(self, "wait_seconds", None) or self.timeout_seconds
 
 
 class TransactionStatusThrottle(GenericRequestThrottle):
@@ -149,5 +147,8 @@ class TransactionStatusThrottle(GenericRequestThrottle):
 
     scope = "transaction_status"
     timeout_seconds = THROTTLE_CACHE_TIMEOUT
+    # Identical lookups are coalesced into one backend call by the view, the throttle only stops abusive clients
+    throttle_mode = ThrottleModes.TOKEN_BUCKET
+    rate_limit = TRANSACTION_STATUS_THROTTLE_RATE
     throttle_fields = ["developer_tracking_id", "flouci_transaction_id"]
     require_all_fields = False  # At least one transaction ID required
@@ -16,6 +16,7 @@ from partners.views import (
     PartnerInitiatePaymentView,
     PartnerSendMoneyView,
     RefreshAuthenticateView,
+    WaitPOSTransactionStatusView,
 )
 from partners.webhook_catchers import SendMoneyDeveloperApiCatcher
 
@@ -48,6 +49,12 @@ urlpatterns = [
         FetchPOSTransactionStatusView.as_view(),
         name="get_pos_transaction_status",
     ),
+    # Held until the POS transaction is resolved, replaces polling get_pos_transaction_status (needs ASGI_ENABLED)
+    path(
+        "transactions/wait_pos_transaction_status",
+        WaitPOSTransactionStatusView.as_view(),
+        name="wait_pos_transaction_status",
+    ),
     # Cancel POS transaction once approved
     path(
         "transactions/cancel_pos_transaction",
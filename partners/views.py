@@ -1,10 +1,13 @@
+import asyncio
+import time
+
+from adrf.generics import GenericAPIView as AsyncGenericAPIView
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import transaction
 from django.db.models import Q
 from drf_spectacular.utils import OpenApiResponse, extend_schema
 from rest_framework import status
 from rest_framework.generics import GenericAPIView, ListAPIView
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
@@ -41,12 +44,67 @@ from partners.serializers import (
     PartnerInitiatePaymentViewSerializer,
     RefreshAuthenticateSerializer,
     SendMoneyViewSerializer,
+    WaitPOSTransactionStatusSerializer,
 )
 from partners.throttles import TransactionStatusThrottle
-from settings.settings import ENV
-from utils.backend_client import FlouciBackendClient
-from utils.decorators import IsValidGenericApi
-from utils.docs_helper import CUSTOM_AUTHENTICATION
+from settings.settings import (
+    ASGI_ENABLED,
+    ENV,
+    POS_PENDING_PAYMENT_STATUSES,
+    POS_SEGMENTS_MAX_CONCURRENCY,
+    POS_STATUS_RECHECK_INTERVAL,
+    POS_STATUS_WSGI_WAIT_TIMEOUT,
+    SINGLE_FLIGHT_RESULT_TIMEOUT,
+    SINGLE_FLIGHT_WAIT_TIMEOUT,
+)
+from utils.backend_client import AsyncFlouciBackendClient, FlouciBackendClient
+from utils.cache_helper import hash_cache_key
+from utils.decorators import Idempotent, IsValidGenericApi
+from utils.docs_helper import CUSTOM_AUTHENTICATION, IDEMPOTENCY_KEY
+from utils.pagination_helper import KeysetPagination, SizedPageNumberPagination
+from utils.single_flight import SingleFlight
+from utils.status_events import status_events
+
+pos_transaction_status_flight = SingleFlight(
+    "pos_transaction_status", result_timeout=SINGLE_FLIGHT_RESULT_TIMEOUT, wait_timeout=SINGLE_FLIGHT_WAIT_TIMEOUT
+)
+
+
+def pos_transaction_lookup(merchant_id, developer_tracking_id, flouci_transaction_id):
+    # The backend looks the transaction up by flouci_transaction_id first, the other id is then irrelevant
+    if flouci_transaction_id:
+        return (merchant_id, "flouci_transaction_id", flouci_transaction_id)
+    return (merchant_id, "developer_tracking_id", developer_tracking_id)
+
+
+def pos_transaction_channel(lookup):
+    return f"pos_transaction:{hash_cache_key(*lookup)}"
+
+
+def pos_transaction_resolved(response):
+    """False while a transaction of the status response is still pending."""
+    if not response.get("success"):
+        return True
+    transactions = response.get("transactions") or [response]
+    return all(transaction.get("payment_status") not in POS_PENDING_PAYMENT_STATUSES for transaction in transactions)
+
+
+async def fetch_pos_transaction_status(merchant_id, developer_tracking_id, flouci_transaction_id):
+    """Status of a POS transaction, identical concurrent lookups share a single backend call."""
+    lookup = pos_transaction_lookup(merchant_id, developer_tracking_id, flouci_transaction_id)
+
+    async def fetch():
+        response = await AsyncFlouciBackendClient.fetch_associated_partner_transaction(
+            merchant_id=merchant_id,
+            developer_tracking_id=developer_tracking_id,
+            flouci_transaction_id=flouci_transaction_id,
+        )
+        if pos_transaction_resolved(response):
+            # Releases the requests of every worker waiting for this transaction
+            status_events.publish(pos_transaction_channel(lookup), response)
+        return response
+
+    return await pos_transaction_status_flight.do(lookup, fetch)
 
 
 @IsValidGenericApi()
@@ -144,6 +202,7 @@ class ConfirmLinkAccountView(GenericAPIView):
             if not linked_account.is_active:
                 linked_account.is_active = True
                 linked_account.save(update_fields=["is_active"])
+                linked_account.invalidate_cache()
 
             return Response(
                 data={
@@ -157,7 +216,7 @@ class ConfirmLinkAccountView(GenericAPIView):
 
 
 @IsValidGenericApi()
-class IsFlouciView(GenericAPIView):
+class IsFlouciView(AsyncGenericAPIView):
     permission_classes = [HasValidPartnerAppCredentials]
     serializer_class = IsFlouciSerializer
 
@@ -170,10 +229,10 @@ class IsFlouciView(GenericAPIView):
             200: OpenApiResponse(response=IsFlouciResponseSerializer, description="Check if the user is flouci user"),
         },
     )
-    def post(self, request, serializer):
+    async def post(self, request, serializer):
         phone_number = serializer.validated_data["phone_number"]
         merchant_id = request.application.merchant_id
-        response = FlouciBackendClient.is_flouci(
+        response = await AsyncFlouciBackendClient.is_flouci(
             phone_number=phone_number,
             merchant_id=merchant_id,
         )
@@ -181,21 +240,21 @@ class IsFlouciView(GenericAPIView):
 
 
 @IsValidGenericApi()
-class AuthenticateView(GenericAPIView):
+class AuthenticateView(AsyncGenericAPIView):
     permission_classes = [HasValidPartnerAppCredentials]
     serializer_class = AuthenticateSerializer
 
-    def post(self, request, serializer):
+    async def post(self, request, serializer):
         application_tracking_id = serializer.validated_data["tracking_id"]
         phone_number = serializer.validated_data["phone_number"]
         merchant_id = request.application.merchant_id
         try:
-            linked_account = LinkedAccount.objects.get(
+            linked_account = await LinkedAccount.objects.aget(
                 partner_tracking_id=application_tracking_id, merchant_id=merchant_id, is_active=True
             )
         except ObjectDoesNotExist:
             return Response({"success": False, "message": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
-        response = FlouciBackendClient.generate_authentication_token(
+        response = await AsyncFlouciBackendClient.generate_authentication_token(
             phone_number=phone_number,
             account_tracking_id=linked_account.account_tracking_id,
             partner_tracking_id=linked_account.partner_tracking_id,
@@ -215,7 +274,7 @@ class RefreshAuthenticateView(APIView):
 
 
 @IsValidGenericApi(post=False, get=True)
-class BalanceView(GenericAPIView):
+class BalanceView(AsyncGenericAPIView):
     permission_classes = [IsPartnerAuthenticated]
     serializer_class = BalanceSerializer
 
@@ -228,33 +287,41 @@ class BalanceView(GenericAPIView):
             412: OpenApiResponse(response=AccountBalanceNotFoundSerializer, description="Couldn't get account balance"),
         },
     )
-    def get(self, request, serializer):
+    async def get(self, request, serializer):
         account: LinkedAccount = request.account
-        response = FlouciBackendClient.get_user_balance(
+        response = await AsyncFlouciBackendClient.get_user_balance(
             tracking_id=account.account_tracking_id,
         )
         return Response(data=response, status=response["status_code"])
 
 
 @IsValidGenericApi(post=False, get=True)
-class PartnerBalanceView(GenericAPIView):
+class PartnerBalanceView(AsyncGenericAPIView):
     permission_classes = [HasValidPartnerAppCredentials, IsValidPartnerUser]
     serializer_class = PartnerBalanceSerializer
 
-    def get(self, request, serializer):
-        response = FlouciBackendClient.get_user_balance(
+    async def get(self, request, serializer):
+        response = await AsyncFlouciBackendClient.get_user_balance(
             tracking_id=request.account.account_tracking_id,
         )
         return Response(data=response, status=response["status_code"])
 
 
-class HistoryPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = "page_size"
-    max_page_size = 100
-
-
 class BaseRequestView(GenericAPIView):
+    pagination_class = SizedPageNumberPagination
+    cursor_pagination_class = KeysetPagination
+
+    @property
+    def paginator(self):
+        """Keyset pagination when a cursor is given or `pagination=cursor` is asked, page numbers otherwise."""
+        if not hasattr(self, "_paginator"):
+            query_params = self.request.query_params
+            if "cursor" in query_params or query_params.get("pagination") == "cursor":
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     def get_filters(self, validated_data):
         """
         Build filters for the queryset based on the validated data.
@@ -287,8 +354,19 @@ class BaseRequestView(GenericAPIView):
         filters = self.get_filters(serializer.validated_data)
         return (
             PartnerTransaction.objects.filter(filters)
-            .only("operation_status", "operation_payload", "amount_in_millimes", "sender", "receiver", "operation_id")
-            .order_by("-time_created")
+            # Exactly the columns read by PaginatedHistorySerializer, the linked accounts are joined in the same query
+            .select_related("sender", "receiver")
+            .only(
+                "operation_id",
+                "operation_type",
+                "operation_status",
+                "operation_payload",
+                "blockchain_ref",
+                "time_created",
+                "sender__phone_number",
+                "receiver__phone_number",
+            )
+            .order_by("-time_created", "-id")
         )
 
 
@@ -300,13 +378,9 @@ class HistoryView(BaseRequestView, ListAPIView):
 
     permission_classes = [IsPartnerAuthenticated]
     serializer_class = PaginatedHistorySerializer
-    pagination_class = HistoryPagination
 
     def get_queryset(self):
-        queryset = self.get_filtered_queryset(FilterHistorySerializer)
-        page_size = self.request.query_params.get("size", self.pagination_class.page_size)
-        self.pagination_class.page_size = min(int(page_size), self.pagination_class.max_page_size)
-        return queryset
+        return self.get_filtered_queryset(FilterHistorySerializer)
 
 
 @IsValidGenericApi(post=False, get=True)
@@ -317,15 +391,12 @@ class PartnerHistoryView(BaseRequestView, ListAPIView):
 
     permission_classes = [HasValidPartnerAppCredentials, IsValidPartnerUser]
     serializer_class = PaginatedHistorySerializer
-    pagination_class = HistoryPagination
 
     def get_queryset(self):
-        queryset = self.get_filtered_queryset(PartnerFilterHistorySerializer)
-        page_size = self.request.query_params.get("size", self.pagination_class.page_size)
-        self.pagination_class.page_size = min(int(page_size), self.pagination_class.max_page_size)
-        return queryset
+        return self.get_filtered_queryset(PartnerFilterHistorySerializer)
 
 
+@Idempotent()
 @IsValidGenericApi()
 class InitiatePaymentView(GenericAPIView):
     permission_classes = [IsPartnerAuthenticated]
@@ -335,6 +406,7 @@ class InitiatePaymentView(GenericAPIView):
     @extend_schema(
         parameters=[
             CUSTOM_AUTHENTICATION,
+            IDEMPOTENCY_KEY,
             InitiatePaymentViewSerializer,
         ],
         responses={
@@ -369,12 +441,13 @@ class InitiatePaymentView(GenericAPIView):
             )
         response = FlouciBackendClient.send_money(operation, merchant_id=merchant_id)
         if response.get("success"):
-            operation.set_operation_status(RequestStatus.DATA_API_PENDING)
+            operation.transition(RequestStatus.PENDING, RequestStatus.DATA_API_PENDING)
         else:
-            operation.set_operation_status(RequestStatus.DECLINED)
+            operation.transition(RequestStatus.PENDING, RequestStatus.DECLINED)
         return Response(data=response, status=response.get("status_code"))
 
 
+@Idempotent()
 @IsValidGenericApi()
 class PartnerInitiatePaymentView(GenericAPIView):
     permission_classes = [HasValidPartnerAppCredentials, IsValidPartnerUser]
@@ -384,6 +457,7 @@ class PartnerInitiatePaymentView(GenericAPIView):
     @extend_schema(
         parameters=[
             CUSTOM_AUTHENTICATION,
+            IDEMPOTENCY_KEY,
             PartnerInitiatePaymentViewSerializer,
         ],
         responses={
@@ -418,21 +492,22 @@ class PartnerInitiatePaymentView(GenericAPIView):
             )
         response = FlouciBackendClient.send_money(operation, merchant_id=merchant_id)
         if response.get("success"):
-            operation.set_operation_status(RequestStatus.DATA_API_PENDING)
+            operation.transition(RequestStatus.PENDING, RequestStatus.DATA_API_PENDING)
         else:
-            operation.set_operation_status(RequestStatus.DECLINED)
+            operation.transition(RequestStatus.PENDING, RequestStatus.DECLINED)
 
         response_data = {key: value for key, value in response.items() if key != "hash"}
         response_data["operation_id"] = str(operation.operation_id)
         return Response(data=response_data, status=response.get("status_code"))
 
 
+@Idempotent()
 @IsValidGenericApi()
-class InitiatePosTransaction(GenericAPIView):
+class InitiatePosTransaction(AsyncGenericAPIView):
     permission_classes = (HasValidPartnerAppCredentials,)
     serializer_class = InitiatePosTransactionSerializer
 
-    def post(self, request, serializer):
+    async def post(self, request, serializer):
         app = request.application
         merchant_id = app.merchant_id
         id_terminal = serializer.validated_data["id_terminal"]
@@ -443,25 +518,31 @@ class InitiatePosTransaction(GenericAPIView):
         parent_payment_id = serializer.validated_data.get("parent_payment_id")
 
         if is_multi_payment:
-            # Handle multiple payments
-            responses = []
-            for payment in serializer.validated_data["payment_segments"]:
-                resp = FlouciBackendClient.generate_pos_transaction(
-                    merchant_id=merchant_id,
-                    webhook=webhook,
-                    id_terminal=id_terminal,
-                    serial_number=serial_number,
-                    service_code=service_code,
-                    amount_in_millimes=payment["amount_in_millimes"],
-                    payment_method=payment["payment_method"],
-                    developer_tracking_id=payment["developer_tracking_id"],
-                    parent_payment_id=parent_payment_id,
-                )
-                responses.append(resp)
-            return Response(responses, status=status.HTTP_201_CREATED)
+            # Segments are sent concurrently, a failed or timed out segment only fails its own entry
+            semaphore = asyncio.Semaphore(POS_SEGMENTS_MAX_CONCURRENCY)
+
+            async def generate_segment(payment):
+                async with semaphore:
+                    return await AsyncFlouciBackendClient.generate_pos_transaction(
+                        merchant_id=merchant_id,
+                        webhook=webhook,
+                        id_terminal=id_terminal,
+                        serial_number=serial_number,
+                        service_code=service_code,
+                        amount_in_millimes=payment["amount_in_millimes"],
+                        payment_method=payment["payment_method"],
+                        developer_tracking_id=payment["developer_tracking_id"],
+                        parent_payment_id=parent_payment_id,
+                    )
+
+            # gather keeps the order of the segments
+            responses = await asyncio.gather(
+                *(generate_segment(payment) for payment in serializer.validated_data["payment_segments"])
+            )
+            return Response(list(responses), status=status.HTTP_201_CREATED)
         else:
             # Handle single payment
-            response = FlouciBackendClient.generate_pos_transaction(
+            response = await AsyncFlouciBackendClient.generate_pos_transaction(
                 merchant_id=merchant_id,
                 webhook=webhook,
                 id_terminal=id_terminal,
@@ -475,12 +556,12 @@ class InitiatePosTransaction(GenericAPIView):
 
 
 @IsValidGenericApi(get=True, post=False)
-class FetchPOSTransactionStatusView(GenericAPIView):
+class FetchPOSTransactionStatusView(AsyncGenericAPIView):
     permission_classes = (HasValidPartnerAppCredentials,)
     serializer_class = FetchPOSTransactionStatusSerializer
     throttle_classes = [TransactionStatusThrottle]
 
-    def get(self, request, serializer):
+    async def get(self, request, serializer):
         app = request.application
         merchant_id = app.merchant_id
         developer_tracking_id = serializer.validated_data.get("developer_tracking_id")
@@ -581,20 +662,57 @@ class FetchPOSTransactionStatusView(GenericAPIView):
             }
             if developer_tracking_id and developer_tracking_id in response_map:
                 return Response(response_map[developer_tracking_id], status=200)
-        response = FlouciBackendClient.fetch_associated_partner_transaction(
-            merchant_id=merchant_id,
-            developer_tracking_id=serializer.validated_data.get("developer_tracking_id"),
-            flouci_transaction_id=serializer.validated_data.get("flouci_transaction_id"),
+        response = await fetch_pos_transaction_status(
+            merchant_id, developer_tracking_id, serializer.validated_data.get("flouci_transaction_id")
         )
         return Response(response, status=response["status_code"])
 
 
+@IsValidGenericApi(get=True, post=False)
+class WaitPOSTransactionStatusView(AsyncGenericAPIView):
+    """
+    Long-poll alternative to FetchPOSTransactionStatusView: the request is held until the transaction is resolved,
+    or answered with its last known status after `timeout` seconds.
+    A held request is released by the status published by whichever worker sees the transaction resolve first, and
+    re-checks the backend every POS_STATUS_RECHECK_INTERVAL seconds otherwise.
+
+    Holding requests needs uvicorn workers (ASGI_ENABLED): a sync worker serves one request at a time, so under WSGI
+    the wait is capped at POS_STATUS_WSGI_WAIT_TIMEOUT seconds and the terminals poll instead.
+    """
+
+    permission_classes = (HasValidPartnerAppCredentials,)
+    serializer_class = WaitPOSTransactionStatusSerializer
+    throttle_classes = [TransactionStatusThrottle]
+
+    async def get(self, request, serializer):
+        merchant_id = request.application.merchant_id
+        developer_tracking_id = serializer.validated_data.get("developer_tracking_id")
+        flouci_transaction_id = serializer.validated_data.get("flouci_transaction_id")
+        timeout = serializer.validated_data["timeout"]
+        if not ASGI_ENABLED:
+            timeout = min(timeout, POS_STATUS_WSGI_WAIT_TIMEOUT)
+        deadline = time.monotonic() + timeout
+        lookup = pos_transaction_lookup(merchant_id, developer_tracking_id, flouci_transaction_id)
+        # Subscribe before the first check, a status published in between is not missed
+        with status_events.subscribe(pos_transaction_channel(lookup)) as subscription:
+            response = await fetch_pos_transaction_status(merchant_id, developer_tracking_id, flouci_transaction_id)
+            while not pos_transaction_resolved(response):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                event = await subscription.get(timeout=min(POS_STATUS_RECHECK_INTERVAL, remaining))
+                response = event or await fetch_pos_transaction_status(
+                    merchant_id, developer_tracking_id, flouci_transaction_id
+                )
+        return Response(response, status=response["status_code"])
+
+
 @IsValidGenericApi(get=False, post=True)
-class CancelPOSransactionView(GenericAPIView):
+class CancelPOSransactionView(AsyncGenericAPIView):
     permission_classes = (HasValidPartnerAppCredentials,)
     serializer_class = CancelPOSransactionViewSerializer
 
-    def post(self, request, serializer):
+    async def post(self, request, serializer):
         app = request.application
         merchant_id = app.merchant_id
         # password = serializer.validated_data["password"]
@@ -620,7 +738,7 @@ class CancelPOSransactionView(GenericAPIView):
             if developer_tracking_id and developer_tracking_id in response_map:
                 resp = response_map[developer_tracking_id]
                 return Response(resp, status=resp["status_code"])
-        response = FlouciBackendClient.refund_pos_transaction(
+        response = await AsyncFlouciBackendClient.refund_pos_transaction(
             id_terminal=id_terminal,
             serial_number=serial_number,
             reason=reason,
@@ -1,6 +1,6 @@
 import logging
 
-import requests
+from django.db import transaction
 from drf_spectacular.utils import extend_schema
 from rest_framework import status
 from rest_framework.generics import GenericAPIView
@@ -8,6 +8,7 @@ from rest_framework.response import Response
 
 from api.enum import RequestStatus
 from api.permissions import HasValidDataApiSignature
+from partners.models import WebhookDelivery
 from partners.serializers import DevAPIDataApiCatcherSerializer
 from utils.decorators import IsValidGenericApi
 
@@ -22,32 +23,29 @@ class SendMoneyDeveloperApiCatcher(GenericAPIView):
 
     def post(self, request, serializer):
         operation = serializer.validated_data.get("transaction")
+        result = serializer.validated_data["result"]
 
-        if not serializer.validated_data["result"]["success"]:
-            operation.set_operation_status(RequestStatus.DECLINED)
+        if not result["success"]:
+            operation.transition(RequestStatus.DATA_API_PENDING, RequestStatus.DECLINED)
             return Response(
-                data={"success": False, "message": f"Operation {operation.uuid} aborted"},
+                data={"success": False, "message": f"Operation {operation.operation_id} aborted"},
                 status=status.HTTP_412_PRECONDITION_FAILED,
             )
-        operation.set_operation_status(RequestStatus.APPROVED)
-        operation.blockchain_ref = serializer.validated_data["result"]["transactionId"]
-        operation.save(update_fields=["blockchain_ref"])
-        if operation.operation_payload.get("webhook"):
-            # TODO make this a task
-            logger.info(f"Sending webhook to {operation.operation_payload.get('webhook')}")
-            headers = {"Content-Type": "application/json"}
-            response_data = {
-                "success": True,
-                "operation_id": str(operation.operation_id),
-            }
-            developer_webhook_url = f"{operation.operation_payload.get('webhook')}"
-            try:
-                response = requests.get(developer_webhook_url, params=response_data, headers=headers, timeout=10)
-                if response:
-                    operation.operation_payload.update({"webhook_sent": True})
-                    operation.save(update_fields=["operation_payload"])
-            except requests.RequestException as e:
-                logger.warning(f"Failed to send webhook to {developer_webhook_url}: {e}")
+        # The developer webhook is queued in the same transaction as the status change: should the enqueue fail, the
+        # data api retry finds the operation still pending
+        with transaction.atomic():
+            approved = operation.transition(
+                RequestStatus.DATA_API_PENDING, RequestStatus.APPROVED, blockchain_ref=result["transactionId"]
+            )
+            if approved and operation.operation_payload.get("webhook"):
+                # Delivered by the deliver_webhooks command, a slow developer server must not hold this request
+                WebhookDelivery.enqueue_for_operation(operation)
+        if not approved:
+            # A duplicate delivery of this webhook settled the operation first, it already queued the webhook
+            return Response(
+                data={"success": True, "message": f"Operation {operation.operation_id} already processed"},
+                status=status.HTTP_200_OK,
+            )
         return Response(
             data={"success": True, "message": f"Operation {operation.operation_id} validated"},
             status=status.HTTP_200_OK,
@@ -0,0 +1,162 @@
+import logging
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from partners.models import PartnerTransaction, WebhookDelivery
+from settings.settings import (
+    WEBHOOK_DELIVERY_BACKOFF_BASE,
+    WEBHOOK_DELIVERY_BACKOFF_MAX,
+    WEBHOOK_DELIVERY_MAX_ATTEMPTS,
+    WEBHOOK_DELIVERY_PER_HOST_CONCURRENCY,
+    WEBHOOK_DELIVERY_TIMEOUT,
+    WEBHOOK_DELIVERY_WORKERS,
+)
+from utils.http_session import PooledSession
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookDispatcher:
+    """
+    Delivers the pending rows of the webhook outbox.
+
+    HTTP calls run in a thread pool, every database access stays in the calling thread. A destination host never
+    has more than `per_host_concurrency` deliveries in flight, so one slow partner cannot use up the whole pool.
+    Failed deliveries are retried with an exponential backoff and marked DEAD after `max_attempts`.
+    """
+
+    HEADERS = {"Content-Type": "application/json"}
+
+    def __init__(
+        self,
+        max_workers=WEBHOOK_DELIVERY_WORKERS,
+        per_host_concurrency=WEBHOOK_DELIVERY_PER_HOST_CONCURRENCY,
+        max_attempts=WEBHOOK_DELIVERY_MAX_ATTEMPTS,
+        timeout=WEBHOOK_DELIVERY_TIMEOUT,
+        backoff_base=WEBHOOK_DELIVERY_BACKOFF_BASE,
+        backoff_max=WEBHOOK_DELIVERY_BACKOFF_MAX,
+    ):
+        self.max_workers = max_workers
+        self.per_host_concurrency = per_host_concurrency
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Claimed rows are hidden from other dispatchers for this long, a crashed dispatcher's rows are retried after
+        self.lease = timedelta(seconds=timeout * 3)
+        self.session = PooledSession(pool_connections=max_workers, pool_maxsize=per_host_concurrency)
+        self.in_flight = {}  # future -> delivery
+        self.host_load = {}  # host -> number of deliveries in flight
+
+    def claim(self, limit):
+        """Lease up to `limit` due deliveries, skipping hosts that are already at their concurrency limit."""
+        saturated_hosts = [host for host, load in self.host_load.items() if load >= self.per_host_concurrency]
+        with transaction.atomic():
+            candidates = (
+                WebhookDelivery.objects.select_for_update(skip_locked=True)
+                .filter(status=WebhookDelivery.DeliveryStatus.PENDING, next_attempt_at__lte=timezone.now())
+                .exclude(host__in=saturated_hosts)
+                .order_by("next_attempt_at")[: limit * 2]
+            )
+            claimed, planned_load = [], dict(self.host_load)
+            for delivery in candidates:
+                if len(claimed) >= limit:
+                    break
+                if planned_load.get(delivery.host, 0) >= self.per_host_concurrency:
+                    continue
+                planned_load[delivery.host] = planned_load.get(delivery.host, 0) + 1
+                claimed.append(delivery)
+            if claimed:
+                WebhookDelivery.objects.filter(id__in=[delivery.id for delivery in claimed]).update(
+                    next_attempt_at=timezone.now() + self.lease
+                )
+        return claimed
+
+    def send(self, delivery):
+        """Runs in a worker thread: no database access allowed here."""
+        response = self.session.get().get(
+            delivery.url, params=delivery.params, headers=self.HEADERS, timeout=self.timeout
+        )
+        if not response:
+            return f"Webhook answered with status code {response.status_code}"
+        return None
+
+    def backoff(self, attempts):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        # Jitter spreads the retries of deliveries that failed together (e.g. a partner outage)
+        return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+    def record_success(self, delivery):
+        WebhookDelivery.objects.filter(id=delivery.id).update(
+            status=WebhookDelivery.DeliveryStatus.DELIVERED,
+            attempts=delivery.attempts + 1,
+            last_error=None,
+            time_modified=timezone.now(),
+        )
+        if delivery.partner_transaction_id:
+            with transaction.atomic():
+                operation = PartnerTransaction.objects.select_for_update().get(id=delivery.partner_transaction_id)
+                operation.operation_payload.update({"webhook_sent": True})
+                operation.save(update_fields=["operation_payload"])
+
+    def record_failure(self, delivery, error):
+        attempts = delivery.attempts + 1
+        if attempts >= self.max_attempts:
+            logger.error(f"Webhook {delivery.id} to {delivery.url} dead after {attempts} attempts: {error}")
+            status, next_attempt_at = WebhookDelivery.DeliveryStatus.DEAD, timezone.now()
+        else:
+            logger.warning(f"Webhook {delivery.id} to {delivery.url} failed (attempt {attempts}): {error}")
+            status, next_attempt_at = WebhookDelivery.DeliveryStatus.PENDING, timezone.now() + self.backoff(attempts)
+        WebhookDelivery.objects.filter(id=delivery.id).update(
+            status=status,
+            attempts=attempts,
+            next_attempt_at=next_attempt_at,
+            last_error=str(error)[:2000],
+            time_modified=timezone.now(),
+        )
+
+    def submit(self, executor, limit):
+        for delivery in self.claim(limit):
+            self.host_load[delivery.host] = self.host_load.get(delivery.host, 0) + 1
+            self.in_flight[executor.submit(self.send, delivery)] = delivery
+
+    def collect(self, futures):
+        for future in futures:
+            delivery = self.in_flight.pop(future)
+            self.host_load[delivery.host] -= 1
+            if not self.host_load[delivery.host]:
+                del self.host_load[delivery.host]
+            try:
+                error = future.result()
+            except Exception as e:
+                error = e
+            if error is None:
+                self.record_success(delivery)
+            else:
+                self.record_failure(delivery, error)
+
+    def run(self, poll_interval=1.0, once=False, should_stop=lambda: False):
+        """
+        Keep the pool busy until `should_stop()` is true, or until no delivery is due when `once` is set.
+        Returns the number of processed deliveries.
+        """
+        processed = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="webhook") as executor:
+            while True:
+                free_slots = self.max_workers - len(self.in_flight)
+                if free_slots and not should_stop():
+                    self.submit(executor, free_slots)
+                if not self.in_flight:
+                    if once or should_stop():
+                        break
+                    time.sleep(poll_interval)
+                    continue
+                done, _ = wait(list(self.in_flight), timeout=poll_interval, return_when=FIRST_COMPLETED)
+                self.collect(done)
+                processed += len(done)
+        return processed
@@ -13,4 +13,22 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from utils.backend_client import (  # noqa: E402  (needs the apps loaded)
+    AsyncFlouciBackendClient,
+)
+
+
+async def application(scope, receive, send):
+    if scope["type"] != "lifespan":
+        return await django_application(scope, receive, send)
+    # Django does not implement the lifespan protocol, the worker's backend connections are closed on shutdown
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await AsyncFlouciBackendClient.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
@@ -3,3 +3,6 @@ from settings.configs.env import config
 """JWT"""
 
 BACKEND_JWT_PUBLIC_KEY = config("BACKEND_JWT_PUBLIC_KEY", cast=lambda key: bytes(key.replace("\\n", "\n"), "utf-8"))
+# Verified tokens kept per worker process, to skip the ES256 verification of the tokens sent again and again
+JWT_VERIFIED_TOKEN_CACHE_SIZE = config("JWT_VERIFIED_TOKEN_CACHE_SIZE", default=10000, cast=int)
+JWT_VERIFIED_TOKEN_CACHE_TIMEOUT = config("JWT_VERIFIED_TOKEN_CACHE_TIMEOUT", default=300, cast=int)
@@ -1,12 +1,49 @@
+import glob
+import os
+
+from decouple import config
+
 from settings.logging.custom_gunicorn_logger import CustomGunicornLogger
 
 """
 gunicorn --bind 0.0.0.0:8000 settings.wsgi --access-logfile - -w 4 --timeout 60
     --logger-class=utils.logging.custom_gunicorn_logger.CustomGunicornLogger
+
+With ASGI_ENABLED=True the workers are uvicorn workers serving settings.asgi: the async views then keep
+many upstream calls in flight per worker instead of one.
+
+The prometheus samples of every worker are written to PROMETHEUS_MULTIPROC_DIR, /metrics aggregates them.
 """
 
+ASGI_ENABLED = config("ASGI_ENABLED", default=False, cast=bool)
+
 bind = "0.0.0.0:8000"
-workers = 4
+workers = config("GUNICORN_WORKERS", default=4, cast=int)
 timeout = 60
 logger_class = CustomGunicornLogger
 accesslog = "-"
+if ASGI_ENABLED:
+    worker_class = "uvicorn_worker.UvicornWorker"
+    wsgi_app = "settings.asgi:application"
+else:
+    wsgi_app = "settings.wsgi:application"
+
+PROMETHEUS_MULTIPROC_DIR = config("PROMETHEUS_MULTIPROC_DIR", default="/tmp/prometheus_multiproc")
+if PROMETHEUS_MULTIPROC_DIR:
+    # Read by prometheus_client when the workers import it
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = PROMETHEUS_MULTIPROC_DIR
+
+
+def on_starting(server):
+    if PROMETHEUS_MULTIPROC_DIR:
+        # Samples left by the workers of a previous run would be added to the new ones
+        os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+        for path in glob.glob(os.path.join(PROMETHEUS_MULTIPROC_DIR, "*.db")):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -71,14 +71,22 @@ INSTALLED_APPS += [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
-    "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
+    "utils.middleware.PathRoutedMiddleware",
+]
+# Only run by PathRoutedMiddleware for the routes outside API_PATH_PREFIXES (admin, docs...)
+BROWSER_MIDDLEWARE = [
+    "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django_otp.middleware.OTPMiddleware",
 ]
+# Machine to machine routes, they use neither sessions nor cookies
+API_PATH_PREFIXES = ["/api/", "/partners/", "/internal/", "/metrics"]
+# The admin checks only look for its middlewares in MIDDLEWARE, PathRoutedMiddleware runs them for the admin routes
+SILENCED_SYSTEM_CHECKS = ["admin.E408", "admin.E409", "admin.E410"]
 
 ROOT_URLCONF = "settings.urls"
 
@@ -105,10 +113,15 @@ WSGI_APPLICATION = "settings.wsgi.application"
 
 # REST FRAMEWORK
 REST_FRAMEWORK = {
-    "DEFAULT_AUTHENTICATION_CLASSES": ("rest_framework.authentication.SessionAuthentication",),
+    "DEFAULT_AUTHENTICATION_CLASSES": ("utils.authentication.StatelessAuthentication",),
     "DEFAULT_METADATA_CLASS": None,
     "TEST_REQUEST_DEFAULT_FORMAT": "json",
-    "DEFAULT_RENDERER_CLASSES": ("rest_framework.renderers.JSONRenderer",),
+    "DEFAULT_RENDERER_CLASSES": ("utils.json_helper.ORJSONRenderer",),
+    "DEFAULT_PARSER_CLASSES": (
+        "utils.json_helper.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
     "EXCEPTION_HANDLER": "utils.custom_exception_handlers.drf_custom_exception_handler",
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
@@ -118,6 +131,7 @@ SPECTACULAR_SETTINGS = {
     "DESCRIPTION": "Flouci Developers APIs",
     "VERSION": "2.0.0",
     "SERVE_PERMISSIONS": ["rest_framework.permissions.AllowAny"],
+    "GET_LIB_DOC_EXCLUDES": "utils.docs_helper.get_lib_doc_excludes_with_adrf",
 }
 
 # Password validation
@@ -212,6 +226,18 @@ if config("ELASTIC_APM_ENABLED", default=True, cast=bool):
 ADMIN_ENABLED = config("ADMIN_ENABLED", default=True, cast=bool)
 ADMIN_TWO_FA_ENABLED = config("ADMIN_TWO_FA_ENABLED", default=True, cast=bool)
 
+# Served by uvicorn workers (settings.asgi) instead of sync workers, read by settings/gunicorn_config.py as well.
+# Under WSGI every async view runs in its own short lived event loop: the features that need a long lived loop
+# (shared httpx client, long polls) fall back to their sync behaviour.
+ASGI_ENABLED = config("ASGI_ENABLED", default=False, cast=bool)
+
+# PROMETHEUS METRICS
+METRICS_ENABLED = config("METRICS_ENABLED", default=True, cast=bool)
+# /metrics requires an "Authorization: Bearer <token>" header, without a token it is only served when DEBUG is on
+METRICS_AUTH_TOKEN = config("METRICS_AUTH_TOKEN", default="")
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(0, "utils.metrics.MetricsMiddleware")
+
 
 # FLOUCI BACKEND
 FLOUCI_BACKEND_API_ADDRESS = config("FLOUCI_BACKEND_API_ADDRESS", default="")
@@ -219,7 +245,64 @@ FLOUCI_BACKEND_API_KEY = config("FLOUCI_BACKEND_API_KEY", default="")
 FLOUCI_BACKEND_INTERNAL_API_KEY = config("FLOUCI_BACKEND_INTERNAL_API_KEY", default="")
 
 SHORT_EXTERNAL_REQUESTS_TIMEOUT = config("SHORT_EXTERNAL_REQUESTS_TIMEOUT", default=5, cast=int)
+# Keep-alive connection pool used by the backend client, sized per worker process
+FLOUCI_BACKEND_POOL_CONNECTIONS = config("FLOUCI_BACKEND_POOL_CONNECTIONS", default=4, cast=int)
+FLOUCI_BACKEND_POOL_MAXSIZE = config("FLOUCI_BACKEND_POOL_MAXSIZE", default=20, cast=int)
+FLOUCI_BACKEND_ASYNC_MAX_CONNECTIONS = config("FLOUCI_BACKEND_ASYNC_MAX_CONNECTIONS", default=100, cast=int)
+# Circuit breaker per backend endpoint, its state is shared by every worker through the cache
+FLOUCI_BACKEND_CIRCUIT_FAILURE_THRESHOLD = config("FLOUCI_BACKEND_CIRCUIT_FAILURE_THRESHOLD", default=5, cast=int)
+FLOUCI_BACKEND_CIRCUIT_FAILURE_WINDOW = config("FLOUCI_BACKEND_CIRCUIT_FAILURE_WINDOW", default=30, cast=int)
+FLOUCI_BACKEND_CIRCUIT_RECOVERY_TIMEOUT = config("FLOUCI_BACKEND_CIRCUIT_RECOVERY_TIMEOUT", default=30, cast=int)
+# Calls in flight per backend endpoint across all the workers (expiring slots in the shared cache), how long a call
+# waits for a free slot and after how long the slot of a worker killed during a call is freed
+FLOUCI_BACKEND_BULKHEAD_SIZE = config("FLOUCI_BACKEND_BULKHEAD_SIZE", default=20, cast=int)
+FLOUCI_BACKEND_BULKHEAD_TIMEOUT = config("FLOUCI_BACKEND_BULKHEAD_TIMEOUT", default=1, cast=float)
+FLOUCI_BACKEND_BULKHEAD_LEASE = config("FLOUCI_BACKEND_BULKHEAD_LEASE", default=30, cast=int)
+# Segments of a multi payment POS transaction sent to the backend at the same time
+POS_SEGMENTS_MAX_CONCURRENCY = config("POS_SEGMENTS_MAX_CONCURRENCY", default=5, cast=int)
 THROTTLE_CACHE_TIMEOUT = config("THROTTLE_CACHE_TIMEOUT", default=8, cast=int)
+# Identical transaction status requests allowed per THROTTLE_CACHE_TIMEOUT, they share one backend call anyway
+TRANSACTION_STATUS_THROTTLE_RATE = config("TRANSACTION_STATUS_THROTTLE_RATE", default=30, cast=int)
+# Identical concurrent status lookups wait this long for the backend call of the first one, whose result is shared
+# with the lookups arriving during the next SINGLE_FLIGHT_RESULT_TIMEOUT seconds
+SINGLE_FLIGHT_WAIT_TIMEOUT = config("SINGLE_FLIGHT_WAIT_TIMEOUT", default=5, cast=float)
+SINGLE_FLIGHT_RESULT_TIMEOUT = config("SINGLE_FLIGHT_RESULT_TIMEOUT", default=1, cast=int)
+# Long-poll of the POS transaction status: longest hold of a request, and how often a held request re-checks the
+# backend when no status event arrives. Payment statuses of the backend that are not final:
+POS_STATUS_WAIT_MAX_TIMEOUT = config("POS_STATUS_WAIT_MAX_TIMEOUT", default=30, cast=int)
+POS_STATUS_RECHECK_INTERVAL = config("POS_STATUS_RECHECK_INTERVAL", default=3, cast=float)
+# A held request pins a whole sync worker: without ASGI_ENABLED the long-poll waits at most this long
+POS_STATUS_WSGI_WAIT_TIMEOUT = config("POS_STATUS_WSGI_WAIT_TIMEOUT", default=1, cast=float)
+POS_PENDING_PAYMENT_STATUSES = config("POS_PENDING_PAYMENT_STATUSES", default="PP,PENDING").split(",")
+
+# App credentials cache used by the permission classes, the local tier bounds staleness across workers
+APP_CREDENTIALS_CACHE_TIMEOUT = config("APP_CREDENTIALS_CACHE_TIMEOUT", default=300, cast=int)
+APP_CREDENTIALS_NEGATIVE_CACHE_TIMEOUT = config("APP_CREDENTIALS_NEGATIVE_CACHE_TIMEOUT", default=30, cast=int)
+APP_CREDENTIALS_LOCAL_CACHE_TIMEOUT = config("APP_CREDENTIALS_LOCAL_CACHE_TIMEOUT", default=5, cast=int)
+APP_CREDENTIALS_LOCAL_CACHE_SIZE = config("APP_CREDENTIALS_LOCAL_CACHE_SIZE", default=1024, cast=int)
+
+# Verified api keys of the internal endpoints, a revoked key may be accepted for API_KEY_LOCAL_CACHE_TIMEOUT seconds
+API_KEY_CACHE_TIMEOUT = config("API_KEY_CACHE_TIMEOUT", default=300, cast=int)
+API_KEY_LOCAL_CACHE_TIMEOUT = config("API_KEY_LOCAL_CACHE_TIMEOUT", default=5, cast=int)
+
+# Linked accounts resolved by the partner permission classes, same tiers as the app credentials cache
+LINKED_ACCOUNT_CACHE_TIMEOUT = config("LINKED_ACCOUNT_CACHE_TIMEOUT", default=300, cast=int)
+LINKED_ACCOUNT_NEGATIVE_CACHE_TIMEOUT = config("LINKED_ACCOUNT_NEGATIVE_CACHE_TIMEOUT", default=30, cast=int)
+LINKED_ACCOUNT_LOCAL_CACHE_TIMEOUT = config("LINKED_ACCOUNT_LOCAL_CACHE_TIMEOUT", default=5, cast=int)
+LINKED_ACCOUNT_LOCAL_CACHE_SIZE = config("LINKED_ACCOUNT_LOCAL_CACHE_SIZE", default=4096, cast=int)
+
+# check_payment responses, final payment states are cached for a day and pending ones for a few seconds
+PAYMENT_STATUS_FINAL_CACHE_TIMEOUT = config("PAYMENT_STATUS_FINAL_CACHE_TIMEOUT", default=24 * 3600, cast=int)
+PAYMENT_STATUS_PENDING_CACHE_TIMEOUT = config("PAYMENT_STATUS_PENDING_CACHE_TIMEOUT", default=3, cast=int)
+PAYMENT_STATUS_LOCAL_CACHE_TIMEOUT = config("PAYMENT_STATUS_LOCAL_CACHE_TIMEOUT", default=3600, cast=int)
+PAYMENT_STATUS_LOCAL_CACHE_SIZE = config("PAYMENT_STATUS_LOCAL_CACHE_SIZE", default=10000, cast=int)
+
+# Responses of the money-moving endpoints replayed to the requests sent again with the same Idempotency-Key.
+# A duplicate arriving while the first request is served waits IDEMPOTENCY_WAIT_TIMEOUT seconds for its response,
+# the key of a request whose worker died is freed after IDEMPOTENCY_LOCK_TIMEOUT seconds.
+IDEMPOTENCY_KEY_TIMEOUT = config("IDEMPOTENCY_KEY_TIMEOUT", default=24 * 3600, cast=int)
+IDEMPOTENCY_LOCK_TIMEOUT = config("IDEMPOTENCY_LOCK_TIMEOUT", default=60, cast=int)
+IDEMPOTENCY_WAIT_TIMEOUT = config("IDEMPOTENCY_WAIT_TIMEOUT", default=10, cast=float)
 
 # Data API:
 DATA_API_ADDRESS = config("DATA_API_ADDRESS", default="")
@@ -230,7 +313,36 @@ DATA_API_USERNAME = config("DATA_API_USERNAME", default="")
 CASH_IO_VERIFICATION_TOKEN = config("CASH_IO_VERIFICATION_TOKEN", default="")
 DEVELOPER_API_INTERNAL_ADDRESS = config("DEVELOPER_API_INTERNAL_ADDRESS", default="")
 
+# WEBHOOKS TO DEVELOPERS (outbox delivered by the deliver_webhooks command)
+WEBHOOK_DELIVERY_TIMEOUT = config("WEBHOOK_DELIVERY_TIMEOUT", default=10, cast=int)
+WEBHOOK_DELIVERY_WORKERS = config("WEBHOOK_DELIVERY_WORKERS", default=16, cast=int)
+WEBHOOK_DELIVERY_PER_HOST_CONCURRENCY = config("WEBHOOK_DELIVERY_PER_HOST_CONCURRENCY", default=4, cast=int)
+WEBHOOK_DELIVERY_MAX_ATTEMPTS = config("WEBHOOK_DELIVERY_MAX_ATTEMPTS", default=8, cast=int)
+WEBHOOK_DELIVERY_BACKOFF_BASE = config("WEBHOOK_DELIVERY_BACKOFF_BASE", default=30, cast=int)
+WEBHOOK_DELIVERY_BACKOFF_MAX = config("WEBHOOK_DELIVERY_BACKOFF_MAX", default=3600, cast=int)
+
+# RECONCILIATION of the partner operations whose data api webhook never came (reconcile_pending_operations command)
+PARTNER_RECONCILE_STALE_AFTER = config("PARTNER_RECONCILE_STALE_AFTER", default=600, cast=int)  # seconds
+PARTNER_RECONCILE_BATCH_SIZE = config("PARTNER_RECONCILE_BATCH_SIZE", default=200, cast=int)
+PARTNER_RECONCILE_CONCURRENCY = config("PARTNER_RECONCILE_CONCURRENCY", default=10, cast=int)
+PARTNER_RECONCILE_INTERVAL = config("PARTNER_RECONCILE_INTERVAL", default=60, cast=int)  # seconds between sweeps
+
 # GCS
 GCS_BUCKET_NAME = config("GCS_BUCKET_NAME", default="")
 GCS_FOLDER_NAME = config("GCS_FOLDER_NAME", default="")
 GCS_BASE_DIR_NAME = config("GCS_BASE_DIR_NAME", default="")
+
+# APP IMAGES (resized and uploaded by the process_image_uploads command)
+IMAGE_UPLOAD_MAX_SIZE = config("IMAGE_UPLOAD_MAX_SIZE", default=5 * 1024 * 1024, cast=int)  # bytes, once decoded
+IMAGE_UPLOAD_MAX_PIXELS = config("IMAGE_UPLOAD_MAX_PIXELS", default=25_000_000, cast=int)
+# Longest side in pixels of the uploaded variants, the first one is the image_url of the app
+IMAGE_VARIANT_SIZES = [int(size) for size in config("IMAGE_VARIANT_SIZES", default="512,128").split(",")]
+IMAGE_JPEG_QUALITY = config("IMAGE_JPEG_QUALITY", default=85, cast=int)
+IMAGE_UPLOAD_MAX_ATTEMPTS = config("IMAGE_UPLOAD_MAX_ATTEMPTS", default=5, cast=int)
+IMAGE_UPLOAD_BACKOFF_BASE = config("IMAGE_UPLOAD_BACKOFF_BASE", default=10, cast=int)
+
+# CACHE
+# Without redis the default per-process local memory cache is used
+REDIS_ENABLED = config("REDIS_ENABLED", default=False, cast=bool)
+if REDIS_ENABLED:
+    from settings.configs.redis_cache import CACHES  # noqa: E402, F401
@@ -21,7 +21,7 @@ from django.views.generic import RedirectView
 from django_otp.admin import OTPAdminSite
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView
 
-from settings.settings import ADMIN_ENABLED, ADMIN_TWO_FA_ENABLED
+from settings.settings import ADMIN_ENABLED, ADMIN_TWO_FA_ENABLED, METRICS_ENABLED
 
 urlpatterns = [
     path("", RedirectView.as_view(url="https://app.flouci.com"), name="home"),
@@ -34,6 +34,10 @@ urlpatterns = [
     path("docs/", SpectacularRedocView.as_view(url_name="schema"), name="redoc"),
 ]
 
+if METRICS_ENABLED:
+    from utils.metrics import metrics_view
+
+    urlpatterns += [path("metrics", metrics_view, name="metrics")]
 
 if ADMIN_ENABLED:
     from django.contrib import admin
@@ -1,31 +1,78 @@
+import hmac
+
+from django.utils import timezone
 from rest_framework_api_key.models import APIKey
 from rest_framework_api_key.permissions import HasAPIKey
 
+from settings.settings import API_KEY_CACHE_TIMEOUT, API_KEY_LOCAL_CACHE_TIMEOUT
+from utils.cache_helper import TwoTierCache, hash_cache_key
+
+# Verified api keys by prefix, the prefix is unique so a cached entry matches a single key
+api_key_cache = TwoTierCache("api_key", timeout=API_KEY_CACHE_TIMEOUT, local_timeout=API_KEY_LOCAL_CACHE_TIMEOUT)
+
 
 class ApiKeyServicesNames:
     BACKEND = "BACKEND"
 
 
+class InvalidApiKey(Exception):
+    pass
+
+
+def get_verified_api_key(key):
+    """
+    Name and expiry of a usable api key, None if the key is not valid.
+    The key is looked up and its hash verified once per API_KEY_CACHE_TIMEOUT, the cache only keeps a hash of it.
+    """
+    prefix = key.partition(".")[0]
+    key_hash = hash_cache_key(key)
+
+    def load():
+        try:
+            api_key = APIKey.objects.get_from_key(key)
+        except APIKey.DoesNotExist:
+            # Not cached: a wrong secret must not hide the valid key of the same prefix
+            raise InvalidApiKey()
+        return {"name": api_key.name, "expiry_date": api_key.expiry_date, "key_hash": key_hash}
+
+    try:
+        verified = api_key_cache.get_or_load((prefix,), load)
+    except InvalidApiKey:
+        return None
+    if verified is None or not hmac.compare_digest(verified["key_hash"], key_hash):
+        return None
+    if verified["expiry_date"] is not None and verified["expiry_date"] < timezone.now():
+        return None
+    return verified
+
+
+def invalidate_api_key_cache(sender, instance, **kwargs):
+    """Connected to the APIKey save and delete signals, a revoked key stops being accepted."""
+    api_key_cache.invalidate(instance.prefix)
+
+
 class HasCustomApiKey(HasAPIKey):
     name = None
     name_starts_with = None
 
-    def get_api_key_name(self, request):
-        api_key = APIKey.objects.get(prefix=self.get_key(request).partition(".")[0])
-        request.api_key = api_key
-        request.tracking_id = None
-        return api_key.name
-
-    def check_api_key_name(self, request):
+    def check_api_key_name(self, api_key_name):
         if self.name_starts_with:
-            return self.get_api_key_name(request).startswith(self.name_starts_with)
+            return api_key_name.startswith(self.name_starts_with)
         elif self.name:
-            return self.get_api_key_name(request) == self.name
+            return api_key_name == self.name
         else:
             return True
 
     def has_permission(self, request, view):
-        return super(HasAPIKey, self).has_permission(request, view) and self.check_api_key_name(request)
+        key = self.get_key(request)
+        if not key:
+            return False
+        verified = get_verified_api_key(key)
+        if verified is None:
+            return False
+        request.api_key_name = verified["name"]
+        request.tracking_id = None
+        return self.check_api_key_name(verified["name"])
 
 
 class HasBackendApiKey(HasCustomApiKey):
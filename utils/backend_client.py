@@ -1,40 +1,113 @@
+import asyncio
+import inspect
 import logging
+import time
+import weakref
 from datetime import timedelta
+from functools import lru_cache, wraps
+from urllib.parse import urlsplit
 
+import httpx
 import requests
+from asgiref.sync import sync_to_async
 from django.urls import reverse
 from django.utils import timezone
 
 from api.enum import TransactionsTypes
 from settings.settings import (
+    ASGI_ENABLED,
     DEVELOPER_API_INTERNAL_ADDRESS,
     FLOUCI_BACKEND_API_ADDRESS,
     FLOUCI_BACKEND_API_KEY,
+    FLOUCI_BACKEND_ASYNC_MAX_CONNECTIONS,
+    FLOUCI_BACKEND_BULKHEAD_LEASE,
+    FLOUCI_BACKEND_BULKHEAD_SIZE,
+    FLOUCI_BACKEND_BULKHEAD_TIMEOUT,
+    FLOUCI_BACKEND_CIRCUIT_FAILURE_THRESHOLD,
+    FLOUCI_BACKEND_CIRCUIT_FAILURE_WINDOW,
+    FLOUCI_BACKEND_CIRCUIT_RECOVERY_TIMEOUT,
     FLOUCI_BACKEND_INTERNAL_API_KEY,
+    FLOUCI_BACKEND_POOL_CONNECTIONS,
+    FLOUCI_BACKEND_POOL_MAXSIZE,
     SHORT_EXTERNAL_REQUESTS_TIMEOUT,
 )
+from utils.circuit_breaker import (
+    Bulkhead,
+    BulkheadFullError,
+    CircuitBreaker,
+    CircuitOpenError,
+)
 from utils.dataapi_client import convert_millimes_to_dinars
+from utils.http_session import PooledSession
+from utils.idempotency import note_upstream_call
+from utils.json_helper import dumps, loads
+from utils.metrics import BACKEND_TIMEOUTS, observe_backend_call
 
 logger = logging.getLogger(__name__)
 
 
+def _exception_response(func_name, exception):
+    if isinstance(exception, (CircuitOpenError, BulkheadFullError)):
+        logger.warning(f"{func_name} not attempted: {exception.__class__.__name__} {exception}")
+        return {"success": False, "code": 5, "message": "Service indisponible", "status_code": 503}
+    if isinstance(exception, (requests.exceptions.Timeout, httpx.TimeoutException)):
+        logger.error(f"Timeout occurred in {func_name}")
+        BACKEND_TIMEOUTS.labels(func_name).inc()
+        return {"success": False, "error": "Request timed out", "code": -2, "status_code": 408}
+    logger.critical(f"Exception in {func_name}: {exception}")
+    return {"success": False, "error": "Problem processing request", "code": -1, "status_code": 500}
+
+
+@lru_cache(maxsize=None)
+def endpoint_guards(url):
+    """Circuit breaker and bulkhead of a backend endpoint, a stuck endpoint cannot starve the other ones."""
+    name = urlsplit(url).path
+    breaker = CircuitBreaker(
+        name,
+        failure_threshold=FLOUCI_BACKEND_CIRCUIT_FAILURE_THRESHOLD,
+        failure_window=FLOUCI_BACKEND_CIRCUIT_FAILURE_WINDOW,
+        recovery_timeout=FLOUCI_BACKEND_CIRCUIT_RECOVERY_TIMEOUT,
+    )
+    bulkhead = Bulkhead(
+        name,
+        size=FLOUCI_BACKEND_BULKHEAD_SIZE,
+        timeout=FLOUCI_BACKEND_BULKHEAD_TIMEOUT,
+        lease=FLOUCI_BACKEND_BULKHEAD_LEASE,
+    )
+    return breaker, bulkhead
+
+
 def handle_exceptions(func):
-    """Decorator to handle exceptions and log them."""
+    """Decorator to handle exceptions, log them and record the call metrics, for both the sync and the async client."""
+
+    def observed(response, start):
+        observe_backend_call(func.__name__, response, time.perf_counter() - start)
+        return response
 
+    async def await_result(result, start):
+        try:
+            return observed(await result, start)
+        except Exception as e:
+            return observed(_exception_response(func.__name__, e), start)
+
+    @wraps(func)
     def wrapper(*args, **kwargs):
+        start = time.perf_counter()
         try:
-            return func(*args, **kwargs)
-        except requests.exceptions.Timeout:
-            logger.error(f"Timeout occurred in {func.__name__}")
-            return {"success": False, "error": "Request timed out", "code": -2, "status_code": 408}
+            result = func(*args, **kwargs)
         except Exception as e:
-            logger.critical(f"Exception in {func.__name__}: {e}")
-            return {"success": False, "error": "Problem processing request", "code": -1, "status_code": 500}
+            return observed(_exception_response(func.__name__, e), start)
+        if inspect.isawaitable(result):
+            return await_result(result, start)
+        return observed(result, start)
 
     return wrapper
 
 
 class FlouciBackendClient:
+    pooled_session = PooledSession(
+        pool_connections=FLOUCI_BACKEND_POOL_CONNECTIONS, pool_maxsize=FLOUCI_BACKEND_POOL_MAXSIZE
+    )
     HEADERS = {"Content-Type": "application/json", "Authorization": "Api-Key " + FLOUCI_BACKEND_API_KEY}
     GENERATE_PAYMENT_PAGE_URL = f"{FLOUCI_BACKEND_API_ADDRESS}/api/developers/generate_payment_page"
     CHECK_PAYMENT_URL = f"{FLOUCI_BACKEND_API_ADDRESS}/api/developers/check_payment"
@@ -55,6 +128,37 @@ class FlouciBackendClient:
     CANCEL_PAYMENT_AUTHORIZATION_URL = f"{FLOUCI_BACKEND_API_ADDRESS}/api/developers/cancel_pre_authorized_payment"
     REFUND_POS_PAYMENT_URL = f"{FLOUCI_BACKEND_API_ADDRESS}/api/developers/refund_pos_transaction"
 
+    @staticmethod
+    def _session():
+        """Shared keep-alive session of the current worker process."""
+        return FlouciBackendClient.pooled_session.get()
+
+    @classmethod
+    def _request(cls, method, url, headers=None, **kwargs):
+        if "json" in kwargs:
+            kwargs["data"] = dumps(kwargs.pop("json"))
+        breaker, bulkhead = endpoint_guards(url)
+        with bulkhead.slot():
+            is_probe = breaker.before_call()
+            note_upstream_call(url)
+            try:
+                response = cls._session().request(
+                    method, url, headers=headers or cls.HEADERS, timeout=SHORT_EXTERNAL_REQUESTS_TIMEOUT, **kwargs
+                )
+            except Exception:
+                breaker.record_failure(is_probe)
+                raise
+        cls._record_outcome(breaker, is_probe, response)
+        return cls._process_response(response)
+
+    @staticmethod
+    def _record_outcome(breaker, is_probe, response):
+        # Client errors are the caller's fault, only server errors count against the endpoint
+        if response.status_code >= 500:
+            breaker.record_failure(is_probe)
+        else:
+            breaker.record_success(is_probe)
+
     @staticmethod
     def _process_response(response, success_code=[200, 201, 204]):
         """Process the HTTP response and standardize error handling."""
@@ -62,7 +166,7 @@ class FlouciBackendClient:
             logger.critical(f"Request failed with status code {response.status_code}. Response: {response.text}")
             return {"success": False, "code": 5, "message": "Service indisponible", "status_code": response.status_code}
         else:
-            response_json = response.json()
+            response_json = loads(response.content)
             if response.status_code in success_code:
                 return {"success": True, **response_json, "status_code": response.status_code}
             elif response.status_code >= 400:
@@ -75,9 +179,10 @@ class FlouciBackendClient:
                     "status_code": response.status_code,
                 }
 
-    @staticmethod
+    @classmethod
     @handle_exceptions
     def generate_payment_page(
+        cls,
         test_account,
         accept_card,
         accept_edinar,
@@ -118,29 +223,17 @@ class FlouciBackendClient:
         if currency:
             data["currency"] = currency
 
-        response = requests.post(
-            FlouciBackendClient.GENERATE_PAYMENT_PAGE_URL,
-            headers=FlouciBackendClient.HEADERS,
-            json=data,
-            timeout=SHORT_EXTERNAL_REQUESTS_TIMEOUT,
-        )
-        return FlouciBackendClient._process_response(response)
+        return cls._request("post", cls.GENERATE_PAYMENT_PAGE_URL, json=data)
 
-    @staticmethod
+    @classmethod
     @handle_exceptions
-    def check_payment(payment_id, wallet, merchant_id):
+    def check_payment(cls, payment_id, wallet, merchant_id):
         params = {"slug": payment_id, "wallet": wallet, "merchant_id": merchant_id}
-        response = requests.get(
-            FlouciBackendClient.CHECK_PAYMENT_URL,
-            headers=FlouciBackendClient.HEADERS,
-            params=params,
-            timeout=SHORT_EXTERNAL_REQUESTS_TIMEOUT,
-        )
-        return FlouciBackendClient._process_response(response)
+        return cls._request("get", cls.CHECK_PAYMENT_URL, params=params)
 
-    @staticmethod
+    @classmethod
     @handle_exceptions
-    def developer_send_money_status(amount_in_millimes, receiver, sender_id, webhook=None):
+    def developer_send_money_status(cls, amount_in_millimes, receiver, sender_id, webhook=None):
         data = {
             "amount_in_millimes": amount_in_millimes,
             "receiver": receiver,
@@ -149,32 +242,21 @@ class FlouciBackendClient:
         if webhook:
             data["webhook_url"] = webhook
 
-        response = requests.post(
-            FlouciBackendClient.SEND_MONEY_URL,
-            headers=FlouciBackendClient.HEADERS,
-            json=data,
-            timeout=SHORT_EXTERNAL_REQUESTS_TIMEOUT,
-        )
-        return FlouciBackendClient._process_response(response)
+        return cls._request("post", cls.SEND_MONEY_URL, json=data)
 
-    @staticmethod
+    @classmethod
     @handle_exceptions
-    def developer_check_send_money_status(operation_id, sender_id):
+    def developer_check_send_money_status(cls, operation_id, sender_id):
         params = {
             "operation_id": operation_id,
             "sender_id": sender_id,
         }
-        response = requests.get(
-            FlouciBackendClient.CHECK_SEND_MONEY_STATUS_URL,
-            headers=FlouciBackendClient.HEADERS,
-            params=params,
-            timeout=SHORT_EXTERNAL_REQUESTS_TIMEOUT,
-        )
-        return FlouciBackendClient._process_response(response)
+        return cls._request("get", cls.CHECK_SEND_MONEY_STATUS_URL, params=params)
 
-    @staticmethod
+    @classmethod
     @handle_exceptions
     def generate_pos_transaction(
+        cls,
         merchant_id,
         webhook,
         id_terminal,
@@ -198,35 +280,24 @@ class FlouciBackendClient:
             data["parent_payment_id"] = parent_payment_id
         if webhook:
             data["webhook"] = webhook
-        response = requests.post(
-            FlouciBackendClient.GENERATE_EXTERNAL_POS_TRANSACTION,
-            headers=FlouciBackendClient.HEADERS,
-            json=data,
-            timeout=SHORT_EXTERNAL_REQUESTS_TIMEOUT,
-        )
-        return FlouciBackendClient._process_response(response)
+        return cls._request("post", cls.GENERATE_EXTERNAL_POS_TRANSACTION, json=data)
 
-    @staticmethod
+    @classmethod
     @handle_exceptions
     def fetch_associated_partner_transaction(
-        merchant_id, *, developer_tracking_id: str = None, flouci_transaction_id: str = None
+        cls, merchant_id, *, developer_tracking_id: str = None, flouci_transaction_id: str = None
     ):
         params = {"merchant_id": merchant_id}
         if flouci_transaction_id:
             params["transaction_id"] = flouci_transaction_id
         else:
             params["developer_tracking_id"] = developer_tracking_id
-        response = requests.get(
-            FlouciBackendClient.FETCH_PARTNER_TRANSACTION_STATUS,
-            headers=FlouciBackendClient.HEADERS,
-            params=params,
-            timeout=SHORT_EXTERNAL_REQUESTS_TIMEOUT,
-        )
-        return FlouciBackendClient._process_response(response)
+        return cls._request("get", cls.FETCH_PARTNER_TRANSACTION_STATUS, params=params)
 
-    @staticmethod
+    @classmethod
     @handle_exceptions
     def refund_pos_transaction(
+        cls,
         id_terminal,
         serial_number,
         reason,
@@ -242,95 +313,59 @@ class FlouciBackendClient:
             "developer_tracking_id": developer_tracking_id,
             "transaction_id": flouci_transaction_id,
         }
-        response = requests.post(
-            FlouciBackendClient.REFUND_POS_PAYMENT_URL,
-            headers=FlouciBackendClient.HEADERS,
-            json=data,
-            timeout=SHORT_EXTERNAL_REQUESTS_TIMEOUT,
-        )
-        return FlouciBackendClient._process_response(response)
+        return cls._request("post", cls.REFUND_POS_PAYMENT_URL, json=data)
 
-    @staticmethod
+    @classmethod
     @handle_exceptions
-    def initiate_link_account(phone_number, merchant_id):
+    def initiate_link_account(cls, phone_number, merchant_id):
         data = {
             "phone_number": phone_number,
             "merchant_id": merchant_id,
         }
-        response = requests.post(
-            FlouciBackendClient.INITIATE_LINK_ACCOUNT,
-            headers=FlouciBackendClient.HEADERS,
-            json=data,
-            timeout=SHORT_EXTERNAL_REQUESTS_TIMEOUT,
-        )
-        return FlouciBackendClient._process_response(response)
+        return cls._request("post", cls.INITIATE_LINK_ACCOUNT, json=data)
 
-    @staticmethod
+    @classmethod
     @handle_exceptions
-    def is_flouci(phone_number, merchant_id):
+    def is_flouci(cls, phone_number, merchant_id):
         data = {
             "phone_number": phone_number,
             "merchant_id": merchant_id,
         }
-        response = requests.post(
-            FlouciBackendClient.IS_FLOUCI,
-            headers=FlouciBackendClient.HEADERS,
-            json=data,
-            timeout=SHORT_EXTERNAL_REQUESTS_TIMEOUT,
-        )
-        return FlouciBackendClient._process_response(response)
+        return cls._request("post", cls.IS_FLOUCI, json=data)
 
-    @staticmethod
+    @classmethod
     @handle_exceptions
-    def confirm_link_account(phone_number, session_id, otp, merchant_id):
+    def confirm_link_account(cls, phone_number, session_id, otp, merchant_id):
         data = {
             "phone_number": phone_number,
             "session_id": str(session_id),
             "otp": otp,
             "merchant_id": merchant_id,
         }
-        response = requests.post(
-            FlouciBackendClient.CONFIRM_LINK_ACCOUNT,
-            headers=FlouciBackendClient.HEADERS,
-            json=data,
-            timeout=SHORT_EXTERNAL_REQUESTS_TIMEOUT,
-        )
-        return FlouciBackendClient._process_response(response)
+        return cls._request("post", cls.CONFIRM_LINK_ACCOUNT, json=data)
 
-    @staticmethod
+    @classmethod
     @handle_exceptions
-    def generate_authentication_token(phone_number, partner_tracking_id, account_tracking_id, merchant_id):
+    def generate_authentication_token(cls, phone_number, partner_tracking_id, account_tracking_id, merchant_id):
         data = {
             "phone_number": phone_number,
             "account_tracking_id": str(account_tracking_id),
             "partner_tracking_id": str(partner_tracking_id),
             "merchant_id": merchant_id,
         }
-        response = requests.post(
-            FlouciBackendClient.PARTNER_AUTHENTICATE,
-            headers=FlouciBackendClient.HEADERS,
-            json=data,
-            timeout=SHORT_EXTERNAL_REQUESTS_TIMEOUT,
-        )
-        return FlouciBackendClient._process_response(response)
+        return cls._request("post", cls.PARTNER_AUTHENTICATE, json=data)
 
-    @staticmethod
+    @classmethod
     @handle_exceptions
-    def get_user_balance(tracking_id):
+    def get_user_balance(cls, tracking_id):
         data = {
             "account_tracking_id": str(tracking_id),
         }
-        response = requests.post(
-            FlouciBackendClient.GET_BALANCE,
-            headers=FlouciBackendClient.HEADERS,
-            json=data,
-            timeout=SHORT_EXTERNAL_REQUESTS_TIMEOUT,
-        )
-        return FlouciBackendClient._process_response(response)
+        return cls._request("post", cls.GET_BALANCE, json=data)
 
-    @staticmethod
+    @classmethod
     @handle_exceptions
-    def send_money(operation, merchant_id=None, receiver=None):
+    def send_money(cls, operation, merchant_id=None, receiver=None):
         # TODO add receiver can be merchant
 
         data = {
@@ -345,47 +380,97 @@ class FlouciBackendClient:
             data["merchant_id"] = merchant_id
         if receiver:
             data["receiver"] = receiver
-        response = requests.post(
-            FlouciBackendClient.SEND_MONEY,
-            headers=FlouciBackendClient.HEADERS,
-            json=data,
-            timeout=SHORT_EXTERNAL_REQUESTS_TIMEOUT,
-        )
-        return FlouciBackendClient._process_response(response)
+        return cls._request("post", cls.SEND_MONEY, json=data)
 
-    @staticmethod
+    @classmethod
     @handle_exceptions
-    def confirm_payment(payment_id, amount, merchant_id):
+    def confirm_payment(cls, payment_id, amount, merchant_id):
         data = {"payment_id": payment_id, "amount": amount, "merchant_id": merchant_id}
-        response = requests.post(
-            FlouciBackendClient.CONFIRM_PAYMENT_AUTHORIZATION_URL,
-            headers=FlouciBackendClient.HEADERS,
-            json=data,
-            timeout=SHORT_EXTERNAL_REQUESTS_TIMEOUT,
-        )
-        return FlouciBackendClient._process_response(response)
+        return cls._request("post", cls.CONFIRM_PAYMENT_AUTHORIZATION_URL, json=data)
 
-    @staticmethod
+    @classmethod
     @handle_exceptions
-    def cancel_payment(payment_id, merchant_id):
+    def cancel_payment(cls, payment_id, merchant_id):
         data = {"payment_id": payment_id, "merchant_id": merchant_id}
-        response = requests.post(
-            FlouciBackendClient.CANCEL_PAYMENT_AUTHORIZATION_URL,
-            headers=FlouciBackendClient.HEADERS,
-            json=data,
-            timeout=SHORT_EXTERNAL_REQUESTS_TIMEOUT,
-        )
-        return FlouciBackendClient._process_response(response)
-
-    def fetch_associated_tracking_id(wallet):
+        return cls._request("post", cls.CANCEL_PAYMENT_AUTHORIZATION_URL, json=data)
+
+    @classmethod
+    def fetch_associated_tracking_id(cls, wallet):
         params = {
             "wallet": wallet,
         }
         headers = {"Content-Type": "application/json", "Authorization": "Api-Key " + FLOUCI_BACKEND_INTERNAL_API_KEY}
-        response = requests.get(
-            FlouciBackendClient.FETCH_TRACKING_ID_URL,
-            headers=headers,
-            params=params,
-            timeout=SHORT_EXTERNAL_REQUESTS_TIMEOUT,
-        )
-        return FlouciBackendClient._process_response(response)
+        return cls._request("get", cls.FETCH_TRACKING_ID_URL, params=params, headers=headers)
+
+
+class AsyncFlouciBackendClient(FlouciBackendClient):
+    """
+    Same calls as FlouciBackendClient, returning coroutines:
+    `response = await AsyncFlouciBackendClient.check_payment(...)`.
+
+    Under uvicorn workers (ASGI_ENABLED) there is a single loop per process and its httpx client, built on the
+    first call, keeps every connection alive until the worker shuts down (see settings.asgi). Under WSGI each
+    request runs in a loop of its own: the calls go through the pooled session of the sync client in a thread
+    instead, a client per loop would open a new connection per request.
+    """
+
+    _clients = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def _client(cls):
+        loop = asyncio.get_running_loop()
+        client = cls._clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=FLOUCI_BACKEND_ASYNC_MAX_CONNECTIONS,
+                    max_keepalive_connections=FLOUCI_BACKEND_POOL_MAXSIZE,
+                ),
+                timeout=SHORT_EXTERNAL_REQUESTS_TIMEOUT,
+            )
+            cls._clients[loop] = client
+        return client
+
+    @classmethod
+    async def aclose(cls):
+        """Close the client of the running loop and its connections."""
+        client = cls._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    @classmethod
+    async def _request(cls, method, url, headers=None, **kwargs):
+        if not ASGI_ENABLED:
+            return await sync_to_async(FlouciBackendClient._request, thread_sensitive=False)(
+                method, url, headers=headers, **kwargs
+            )
+        if "json" in kwargs:
+            kwargs["content"] = dumps(kwargs.pop("json"))
+        breaker, bulkhead = endpoint_guards(url)
+        async with bulkhead.async_slot():
+            is_probe = await breaker.abefore_call()
+            note_upstream_call(url)
+            try:
+                response = await cls._client().request(method, url, headers=headers or cls.HEADERS, **kwargs)
+            except Exception:
+                await breaker.arecord_failure(is_probe)
+                raise
+        if response.status_code >= 500:
+            await breaker.arecord_failure(is_probe)
+        else:
+            await breaker.arecord_success(is_probe)
+        return cls._process_response(response)
+
+
+def _coroutine_method(func):
+    @wraps(func)
+    async def method(cls, *args, **kwargs):
+        return await func(cls, *args, **kwargs)
+
+    return classmethod(method)
+
+
+# Expose every backend call of the async client as a real coroutine function
+for _name, _attribute in list(vars(FlouciBackendClient).items()):
+    if isinstance(_attribute, classmethod) and not _name.startswith("_"):
+        setattr(AsyncFlouciBackendClient, _name, _coroutine_method(_attribute.__func__))
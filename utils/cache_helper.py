@@ -0,0 +1,179 @@
+import copy
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+from utils.metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+NOT_FOUND = "__not_found__"
+
+
+def hash_cache_key(*parts):
+    """Hash the key parts so that secrets (tokens, keys) never appear in plain text in the shared cache."""
+    return hashlib.sha256("|".join(str(part) for part in parts).encode()).hexdigest()
+
+
+class LocalTTLCache:
+    """
+    Thread-safe, size-bounded LRU cache living in the memory of the current process.
+    Every entry expires after `timeout` seconds (or the timeout given to `set`).
+    """
+
+    def __init__(self, maxsize=1024, timeout=60):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        if timeout <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TwoTierCache:
+    """
+    Read-through cache with a short lived per-process tier in front of the shared django cache.
+
+    Lookups that found nothing are cached as well (negative caching) with their own, shorter, timeout.
+    The local tier of other worker processes cannot be invalidated remotely, keep `local_timeout` short:
+    it is the maximum staleness accepted after an invalidation.
+    """
+
+    def __init__(self, prefix, timeout=300, local_timeout=5, local_maxsize=1024, negative_timeout=30):
+        self.prefix = prefix
+        self.timeout = timeout
+        self.local_timeout = local_timeout
+        self.negative_timeout = negative_timeout
+        self.local_cache = LocalTTLCache(maxsize=local_maxsize, timeout=local_timeout)
+
+    def make_key(self, *parts):
+        return f"{self.prefix}_{hash_cache_key(*parts)}"
+
+    def get_or_load(self, key_parts, loader):
+        """
+        Return the cached value for key_parts, calling `loader()` on a miss.
+        `loader` returns the value to cache or None when nothing was found.
+        """
+        key = self.make_key(*key_parts)
+        value = self.local_cache.get(key)
+        result = "local_hit"
+        if value is None:
+            result = "shared_hit"
+            try:
+                value = cache.get(key)
+            except Exception as e:
+                logger.warning(f"Shared cache unavailable for {self.prefix}: {e}")
+                value = None
+            if value is None:
+                result = "miss"
+                value = loader()
+                if value is None:
+                    value = NOT_FOUND
+                self._set_shared(key, value)
+            self.local_cache.set(key, value, timeout=min(self.local_timeout, self._timeout_for(value)))
+        CACHE_LOOKUPS.labels(self.prefix, result).inc()
+        if value == NOT_FOUND:
+            return None
+        # Callers may mutate what they get back, never hand out the cached object itself
+        return copy.copy(value)
+
+    def invalidate(self, *key_parts):
+        key = self.make_key(*key_parts)
+        self.local_cache.delete(key)
+        try:
+            cache.delete(key)
+        except Exception as e:
+            logger.warning(f"Failed to invalidate {self.prefix} cache entry: {e}")
+
+    def _timeout_for(self, value):
+        return self.negative_timeout if value == NOT_FOUND else self.timeout
+
+    def _set_shared(self, key, value):
+        try:
+            cache.set(key, value, timeout=self._timeout_for(value))
+        except Exception as e:
+            logger.warning(f"Failed to populate shared cache for {self.prefix}: {e}")
+
+
+class ResponseCache:
+    """
+    Two tier cache of upstream responses whose timeout is chosen per response by the caller.
+    The local tier answers repeated lookups without leaving the process, the shared tier is filled for the other
+    workers. Lookups are counted by the cache_lookups_total metric.
+    """
+
+    def __init__(self, prefix, local_timeout=3600, local_maxsize=10000):
+        self.prefix = prefix
+        self.local_timeout = local_timeout
+        self.local_cache = LocalTTLCache(maxsize=local_maxsize, timeout=local_timeout)
+
+    def make_key(self, *parts):
+        return f"{self.prefix}_{hash_cache_key(*parts)}"
+
+    async def aget(self, *key_parts):
+        key = self.make_key(*key_parts)
+        value = self.local_cache.get(key)
+        result = "local_hit"
+        if value is None:
+            result = "shared_hit"
+            try:
+                entry = await cache.aget(key)
+            except Exception as e:
+                logger.warning(f"Shared cache unavailable for {self.prefix}: {e}")
+                entry = None
+            if entry is not None:
+                value, expires_at = entry
+                # Entries cached without expiration by earlier releases have no expires_at
+                local_timeout = self.local_timeout if expires_at is None else expires_at - time.time()
+                self.local_cache.set(key, value, timeout=min(self.local_timeout, local_timeout))
+        if value is None:
+            CACHE_LOOKUPS.labels(self.prefix, "miss").inc()
+            return None
+        CACHE_LOOKUPS.labels(self.prefix, result).inc()
+        return copy.copy(value)
+
+    async def aset(self, key_parts, value, timeout):
+        """Cache value for `timeout` seconds."""
+        key = self.make_key(*key_parts)
+        self.local_cache.set(key, value, timeout=min(self.local_timeout, timeout))
+        # The expiration travels with the value, a worker reading it never keeps it locally past that point
+        expires_at = time.time() + timeout
+        try:
+            await cache.aset(key, (value, expires_at), timeout=timeout)
+        except Exception as e:
+            logger.warning(f"Failed to populate shared cache for {self.prefix}: {e}")
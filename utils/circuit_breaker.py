@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from django.core.cache import cache
+
+from utils.cache_helper import LocalTTLCache, hash_cache_key
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class BulkheadFullError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker whose state is shared by every worker through the django cache.
+
+    closed: calls go through, `failure_threshold` failures within `failure_window` seconds open the circuit.
+    open: calls fail fast with CircuitOpenError for `recovery_timeout` seconds.
+    half-open: a single call (the probe) goes through, its outcome closes or re-opens the circuit.
+
+    The open flag is read from the shared cache at most once per `state_cache_timeout` seconds per process.
+    """
+
+    def __init__(self, name, failure_threshold=5, failure_window=30, recovery_timeout=30, state_cache_timeout=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.failure_window = failure_window
+        self.recovery_timeout = recovery_timeout
+        key = hash_cache_key("circuit", name)
+        self.opened_at_key = f"circuit_opened_at_{key}"
+        self.failures_key = f"circuit_failures_{key}"
+        self.probe_key = f"circuit_probe_{key}"
+        self.local_state = LocalTTLCache(maxsize=1, timeout=state_cache_timeout)
+
+    def _opened_at(self):
+        opened_at = self.local_state.get("opened_at")
+        if opened_at is None:
+            try:
+                opened_at = cache.get(self.opened_at_key) or 0
+            except Exception as e:
+                logger.warning(f"Shared cache unavailable for circuit {self.name}: {e}")
+                opened_at = 0
+            self.local_state.set("opened_at", opened_at)
+        return opened_at
+
+    def before_call(self):
+        """Raise CircuitOpenError when the call must not be attempted, return True when the call is the probe."""
+        opened_at = self._opened_at()
+        if not opened_at:
+            return False
+        if time.time() - opened_at < self.recovery_timeout:
+            raise CircuitOpenError(self.name)
+        try:
+            is_probe = cache.add(self.probe_key, 1, timeout=self.recovery_timeout)
+        except Exception:
+            is_probe = False
+        if not is_probe:
+            raise CircuitOpenError(self.name)
+        return True
+
+    async def _aopened_at(self):
+        opened_at = self.local_state.get("opened_at")
+        if opened_at is None:
+            try:
+                opened_at = await cache.aget(self.opened_at_key) or 0
+            except Exception as e:
+                logger.warning(f"Shared cache unavailable for circuit {self.name}: {e}")
+                opened_at = 0
+            self.local_state.set("opened_at", opened_at)
+        return opened_at
+
+    async def abefore_call(self):
+        """before_call for the event loop, the shared cache is never called synchronously from it."""
+        opened_at = await self._aopened_at()
+        if not opened_at:
+            return False
+        if time.time() - opened_at < self.recovery_timeout:
+            raise CircuitOpenError(self.name)
+        try:
+            is_probe = await cache.aadd(self.probe_key, 1, timeout=self.recovery_timeout)
+        except Exception:
+            is_probe = False
+        if not is_probe:
+            raise CircuitOpenError(self.name)
+        return True
+
+    def record_success(self, is_probe):
+        if not is_probe:
+            return
+        logger.info(f"Circuit {self.name} closed")
+        try:
+            self._set_opened_at(0)
+            cache.delete_many([self.failures_key, self.probe_key])
+        except Exception as e:
+            logger.warning(f"Failed to close circuit {self.name}: {e}")
+
+    def record_failure(self, is_probe):
+        try:
+            if is_probe:
+                self._open()
+                cache.delete(self.probe_key)
+                return
+            cache.add(self.failures_key, 0, timeout=self.failure_window)
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            # The failures counter expired between add and incr
+            return
+        except Exception as e:
+            logger.warning(f"Failed to record a failure of circuit {self.name}: {e}")
+            return
+        if failures >= self.failure_threshold and not self._opened_at():
+            self._open()
+
+    async def arecord_success(self, is_probe):
+        if not is_probe:
+            return
+        logger.info(f"Circuit {self.name} closed")
+        try:
+            await self._aset_opened_at(0)
+            await cache.adelete_many([self.failures_key, self.probe_key])
+        except Exception as e:
+            logger.warning(f"Failed to close circuit {self.name}: {e}")
+
+    async def arecord_failure(self, is_probe):
+        try:
+            if is_probe:
+                await self._aopen()
+                await cache.adelete(self.probe_key)
+                return
+            await cache.aadd(self.failures_key, 0, timeout=self.failure_window)
+            failures = await cache.aincr(self.failures_key)
+        except ValueError:
+            return
+        except Exception as e:
+            logger.warning(f"Failed to record a failure of circuit {self.name}: {e}")
+            return
+        if failures >= self.failure_threshold and not await self._aopened_at():
+            await self._aopen()
+
+    def _open(self):
+        logger.error(f"Circuit {self.name} opened for {self.recovery_timeout} seconds")
+        self._set_opened_at(time.time())
+        cache.delete(self.failures_key)
+
+    async def _aopen(self):
+        logger.error(f"Circuit {self.name} opened for {self.recovery_timeout} seconds")
+        await self._aset_opened_at(time.time())
+        await cache.adelete(self.failures_key)
+
+    def _set_opened_at(self, opened_at):
+        self.local_state.set("opened_at", opened_at)
+        if opened_at:
+            cache.set(self.opened_at_key, opened_at, timeout=None)
+        else:
+            cache.delete(self.opened_at_key)
+
+    async def _aset_opened_at(self, opened_at):
+        self.local_state.set("opened_at", opened_at)
+        if opened_at:
+            await cache.aset(self.opened_at_key, opened_at, timeout=None)
+        else:
+            await cache.adelete(self.opened_at_key)
+
+
+class Bulkhead:
+    """
+    Bounds the number of calls in flight to an endpoint across every worker with `size` slots in the shared cache: a
+    sync worker serves a single request, a per-process limit would never be reached.
+    A slot is a key of its own taken with an atomic add and expiring after `lease` seconds, never renewed: the slot of
+    a worker killed during a call is freed after `lease` seconds whatever the traffic, `lease` must outlast a call.
+    A caller finding the endpoint full retries for at most `timeout` seconds before BulkheadFullError is raised.
+    Calls go through when the shared cache is unavailable.
+    """
+
+    def __init__(self, name, size=10, timeout=1, lease=60, poll_interval=0.05):
+        self.name = name
+        self.size = size
+        self.timeout = timeout
+        self.lease = lease
+        self.poll_interval = poll_interval
+        prefix = f"bulkhead_{hash_cache_key('bulkhead', name)}"
+        self.slot_keys = [f"{prefix}_{index}" for index in range(size)]
+
+    def _free_slots(self, taken):
+        free = [key for key in self.slot_keys if key not in taken]
+        random.shuffle(free)
+        return free
+
+    def _try_acquire(self):
+        """The key of the slot taken, False when the endpoint is full, None when the shared cache is unavailable."""
+        try:
+            # A random slot first: a single round trip while the endpoint is not full
+            key = random.choice(self.slot_keys)
+            if cache.add(key, 1, timeout=self.lease):
+                return key
+            for key in self._free_slots(cache.get_many(self.slot_keys)):
+                if cache.add(key, 1, timeout=self.lease):
+                    return key
+        except Exception as e:
+            logger.warning(f"Shared cache unavailable for bulkhead {self.name}: {e}")
+            return None
+        return False
+
+    @staticmethod
+    def _release(key):
+        try:
+            cache.delete(key)
+        except Exception:
+            # Freed by its lease
+            pass
+
+    async def _atry_acquire(self):
+        try:
+            key = random.choice(self.slot_keys)
+            if await cache.aadd(key, 1, timeout=self.lease):
+                return key
+            for key in self._free_slots(await cache.aget_many(self.slot_keys)):
+                if await cache.aadd(key, 1, timeout=self.lease):
+                    return key
+        except Exception as e:
+            logger.warning(f"Shared cache unavailable for bulkhead {self.name}: {e}")
+            return None
+        return False
+
+    @staticmethod
+    async def _arelease(key):
+        try:
+            await cache.adelete(key)
+        except Exception:
+            pass
+
+    @contextmanager
+    def slot(self):
+        deadline = time.monotonic() + self.timeout
+        acquired = self._try_acquire()
+        while acquired is False:
+            if time.monotonic() >= deadline:
+                raise BulkheadFullError(self.name)
+            time.sleep(self.poll_interval)
+            acquired = self._try_acquire()
+        try:
+            yield
+        finally:
+            if acquired:
+                self._release(acquired)
+
+    @asynccontextmanager
+    async def async_slot(self):
+        deadline = time.monotonic() + self.timeout
+        acquired = await self._atry_acquire()
+        while acquired is False:
+            if time.monotonic() >= deadline:
+                raise BulkheadFullError(self.name)
+            await asyncio.sleep(self.poll_interval)
+            acquired = await self._atry_acquire()
+        try:
+            yield
+        finally:
+            if acquired:
+                await self._arelease(acquired)
@@ -2,21 +2,27 @@ import logging
 from decimal import Decimal
 
 from settings.settings import DATA_API_ADDRESS, DATA_API_PASSWORD, DATA_API_USERNAME
+from utils.json_helper import loads
+from utils.lazy_client import LazyClient
 from utils.token_based_requests_manager import TokenBasedRequests
 
 logger = logging.getLogger(__name__)
 
 
-# TODO: Better log messages for errors
-
-
-class DataApiClient:
-    request_client = TokenBasedRequests(
+def data_api_requests():
+    return TokenBasedRequests(
         DATA_API_ADDRESS + "/api/authenticate",
         {"password": DATA_API_PASSWORD, "remember_me": 1, "username": DATA_API_USERNAME},
         {"Content-Type": "application/json"},
         accepted_status_codes=[200, 201],
     )
+
+
+# TODO: Better log messages for errors
+
+
+class DataApiClient:
+    request_client = LazyClient(data_api_requests)
     AUTHENTICATE_URL = DATA_API_ADDRESS + "/api/authenticate"
     ACCEPT_PAYMENT = DATA_API_ADDRESS + "/api/developer/accept"
 
@@ -32,8 +38,8 @@ class DataApiClient:
             "paymentId": str(data.get("payment_id")),
             "acceptPayment": True,
         }
-        response = DataApiClient.request_client.post(DataApiClient.ACCEPT_PAYMENT, data)
-        response_data = response.json()
+        response = DataApiClient.request_client.get().post(DataApiClient.ACCEPT_PAYMENT, data)
+        response_data = loads(response.content)
         if response.status_code == 200 and response_data.get("code") == 0:
             transaction_result = response_data.get("result", {})
             payment_response = {
@@ -1,8 +1,18 @@
 import logging
 from functools import wraps
+from inspect import iscoroutinefunction
 
 from rest_framework.exceptions import ValidationError
 
+from utils.idempotency import (
+    IDEMPOTENCY_HEADER,
+    IDEMPOTENCY_KEY_MAX_LENGTH,
+    idempotency_store,
+    request_fingerprint,
+    stop_tracking_upstream_calls,
+    track_upstream_calls,
+)
+
 logger = logging.getLogger(__name__)
 
 
@@ -35,22 +45,101 @@ class IsValidGenericApi(BaseGenericApiViewDecorator):
     def decorate_method(self, klass, method):
         old_method = getattr(klass, method)
 
-        @wraps(getattr(klass, method))
-        def decorated_method(self, request, **kwargs):
+        def validate(view, request, kwargs):
             data = request.data
             keyword_args = {**kwargs}
             if request.method == "GET":
                 data = request.GET.copy()
             if keyword_args:
                 data.update(**kwargs)
-            context_kwargs = self.get_serializer_context()
-            serializer = self.get_serializer_class()(data=data, context=context_kwargs)
+            context_kwargs = view.get_serializer_context()
+            serializer = view.get_serializer_class()(data=data, context=context_kwargs)
             try:
                 serializer.is_valid(raise_exception=True)
             except ValidationError as e:
                 logger.warning(str(e))
                 raise e
-            return old_method(self, request, serializer)
+            return serializer
+
+        if iscoroutinefunction(old_method):
+
+            @wraps(old_method)
+            async def decorated_method(self, request, **kwargs):
+                return await old_method(self, request, validate(self, request, kwargs))
+
+        else:
+
+            @wraps(old_method)
+            def decorated_method(self, request, **kwargs):
+                return old_method(self, request, validate(self, request, kwargs))
+
+        setattr(klass, method, decorated_method)
+        return klass
+
+
+class Idempotent(BaseGenericApiViewDecorator):
+    """
+    Replays the stored response to the requests sent again with the same Idempotency-Key header, see
+    IdempotencyStore. Keys are scoped by view and by caller (the app and/or the linked account set by the
+    permissions). Put it above IsValidGenericApi so that a replay skips the validation as well.
+    """
+
+    def decorate_method(self, klass, method):
+        old_method = getattr(klass, method)
+        view_name = klass.__name__
+
+        def store_key(request):
+            idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not idempotency_key:
+                return None
+            if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+                raise ValidationError({IDEMPOTENCY_HEADER: [f"At most {IDEMPOTENCY_KEY_MAX_LENGTH} characters"]})
+            scope = [
+                f"{attribute}:{owner.pk}"
+                for attribute in ("application", "account")
+                if (owner := getattr(request, attribute, None)) is not None
+            ]
+            return idempotency_store.make_key(view_name, method, *scope, idempotency_key)
+
+        if iscoroutinefunction(old_method):
+
+            @wraps(old_method)
+            async def decorated_method(self, request, **kwargs):
+                key = store_key(request)
+                if key is None:
+                    return await old_method(self, request, **kwargs)
+                fingerprint = request_fingerprint(request)
+                entry = await idempotency_store.aclaim(key, fingerprint)
+                if entry is not None:
+                    return idempotency_store.replay(entry, fingerprint)
+                response = None
+                upstream_calls, token = track_upstream_calls()
+                try:
+                    response = await old_method(self, request, **kwargs)
+                finally:
+                    stop_tracking_upstream_calls(token)
+                    await idempotency_store.afinish(key, fingerprint, response, bool(upstream_calls))
+                return response
+
+        else:
+
+            @wraps(old_method)
+            def decorated_method(self, request, **kwargs):
+                key = store_key(request)
+                if key is None:
+                    return old_method(self, request, **kwargs)
+                fingerprint = request_fingerprint(request)
+                entry = idempotency_store.claim(key, fingerprint)
+                if entry is not None:
+                    return idempotency_store.replay(entry, fingerprint)
+                response = None
+                upstream_calls, token = track_upstream_calls()
+                try:
+                    response = old_method(self, request, **kwargs)
+                finally:
+                    stop_tracking_upstream_calls(token)
+                    idempotency_store.finish(key, fingerprint, response, bool(upstream_calls))
+                return response
 
         setattr(klass, method, decorated_method)
         return klass
@@ -1,3 +1,4 @@
+from drf_spectacular.plumbing import get_lib_doc_excludes
 from drf_spectacular.utils import OpenApiParameter
 
 CUSTOM_AUTHENTICATION = OpenApiParameter(
@@ -7,3 +8,22 @@ CUSTOM_AUTHENTICATION = OpenApiParameter(
     type=str,
     location=OpenApiParameter.HEADER,
 )
+
+IDEMPOTENCY_KEY = OpenApiParameter(
+    name="Idempotency-Key",
+    description=(
+        "Unique key of the request, a retry sent with the same key and body within 24 hours gets the response of "
+        "the first request instead of being executed again. When the first request timed out, its outcome is "
+        "unknown: the retry gets a 409 and the operation status has to be checked"
+    ),
+    required=False,
+    type=str,
+    location=OpenApiParameter.HEADER,
+)
+
+
+def get_lib_doc_excludes_with_adrf():
+    """Keep the docstrings of the adrf base views out of the schema, like the DRF ones."""
+    from adrf import generics, views
+
+    return [*get_lib_doc_excludes(), views.APIView, generics.GenericAPIView]
@@ -1,38 +1,45 @@
-import base64
 import logging
 
-from google.cloud import storage
-
 from settings.settings import (
     GCS_ACCOUNT_CREDENTIALS_FILE_PATH,
     GCS_BASE_DIR_NAME,
     GCS_BUCKET_NAME,
     GCS_FOLDER_NAME,
 )
+from utils.lazy_client import LazyClient
 
 logger = logging.getLogger(__name__)
 
 
+def storage_client():
+    # google-cloud-storage takes a few hundred milliseconds to import, only the processes uploading images load it
+    from google.cloud import storage
+
+    return storage.Client.from_service_account_json(GCS_ACCOUNT_CREDENTIALS_FILE_PATH)
+
+
 class GCSClient:
     GOOGLE_CLOUD_STORAGE_BASE_URL = "https://storage.googleapis.com"
     IMAGES_PREFIX = "devapi_img_"
     GCS_BUCKET = GCS_BUCKET_NAME
     GCS_FOLDER = GCS_FOLDER_NAME
     GCS_DIR = GCS_BASE_DIR_NAME
-    gcp_client = storage.Client.from_service_account_json(GCS_ACCOUNT_CREDENTIALS_FILE_PATH)
+    gcp_client = LazyClient(storage_client)
+
+    @classmethod
+    def image_url(cls, image_name: str, extension: str) -> str:
+        return f"{cls.GOOGLE_CLOUD_STORAGE_BASE_URL}/{cls.GCS_BUCKET}/{cls._image_path(image_name, extension)}"
+
+    @classmethod
+    def upload_image(cls, image_bytes: bytes, image_name: str, extension: str, content_type: str) -> str:
+        """Upload a publicly readable image and return its url, raises when the upload fails."""
+        bucket = cls.gcp_client.get().bucket(cls.GCS_BUCKET)
+        blob = bucket.blob(cls._image_path(image_name, extension))
+        blob.cache_control = "no-cache"
+        # The acl is set by the upload request itself, no make_public() round trip
+        blob.upload_from_string(image_bytes, content_type=content_type, predefined_acl="publicRead")
+        return cls.image_url(image_name, extension)
 
     @classmethod
-    def save_image(cls, image_b64: str, image_name: str, extension: str, content_type: str) -> None | str:
-        try:
-            image_bytes = base64.b64decode(image_b64)
-            path = f"{cls.GCS_FOLDER}/{cls.GCS_DIR}/{cls.IMAGES_PREFIX}{image_name}.{extension}"
-            bucket = cls.gcp_client.bucket(cls.GCS_BUCKET)
-            blob = bucket.blob(path)
-            blob.cache_control = "no-cache"
-            blob.upload_from_string(image_bytes, content_type=content_type)
-            blob.make_public()
-            img_url = f"{cls.GOOGLE_CLOUD_STORAGE_BASE_URL}/{cls.GCS_BUCKET}/{path}"
-            return img_url
-        except Exception as e:
-            logger.error(f"Failed to upload image: {e}", exc_info=True)
-            return None
+    def _image_path(cls, image_name, extension):
+        return f"{cls.GCS_FOLDER}/{cls.GCS_DIR}/{cls.IMAGES_PREFIX}{image_name}.{extension}"
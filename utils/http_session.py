@@ -0,0 +1,61 @@
+import logging
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class PooledSession:
+    """
+    Lazily builds a keep-alive requests.Session with a bounded connection pool, one per worker process.
+
+    Sockets must never be shared between a parent and a forked child (gunicorn forks its workers), so the
+    session is rebuilt whenever the current pid differs from the pid that created it.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _reset_after_fork(self):
+        # The lock may have been held by another thread at fork time, never reuse it in the child.
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+
+    def get(self):
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    logger.debug(f"Creating pooled http session for process {pid}")
+                    self._session = self._build_session()
+                    self._pid = pid
+        return self._session
+
+    def close(self):
+        with self._lock:
+            if self._session is not None and self._pid == os.getpid():
+                self._session.close()
+            self._session = None
+            self._pid = None
@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from contextvars import ContextVar
+
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from settings.settings import (
+    IDEMPOTENCY_KEY_TIMEOUT,
+    IDEMPOTENCY_LOCK_TIMEOUT,
+    IDEMPOTENCY_WAIT_TIMEOUT,
+)
+from utils.cache_helper import hash_cache_key
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+IN_PROGRESS = "in_progress"
+DONE = "done"
+# The request reached the backend but its result is not known (timeout, 5xx): running it again could move the
+# money twice, the key is kept until it expires
+UNKNOWN = "unknown"
+
+# Backend requests sent while serving the current request, a list set by Idempotent and shared by its tasks
+_upstream_calls = ContextVar("idempotency_upstream_calls", default=None)
+
+
+def track_upstream_calls():
+    """Start recording the backend requests sent from the current context, returns (calls, token to reset)."""
+    calls = []
+    return calls, _upstream_calls.set(calls)
+
+
+def stop_tracking_upstream_calls(token):
+    _upstream_calls.reset(token)
+
+
+def note_upstream_call(url):
+    """Called by the backend clients right before a request leaves for the backend."""
+    calls = _upstream_calls.get()
+    if calls is not None:
+        calls.append(url)
+
+
+def request_fingerprint(request):
+    """Hash of the parsed request data, a key sent again with another request is refused."""
+    data = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def is_final(response):
+    return response.status_code < 500 and response.status_code != status.HTTP_408_REQUEST_TIMEOUT
+
+
+def outcome(response, upstream_called):
+    """
+    State stored for a served request: DONE for a final response, UNKNOWN when it failed after reaching the
+    backend, None when it failed before (validation, open circuit, full bulkhead) and the key can be used again.
+    """
+    if response is not None and is_final(response):
+        return DONE
+    return UNKNOWN if upstream_called else None
+
+
+class IdempotencyStore:
+    """
+    Responses of the requests sent with an Idempotency-Key header, kept in the shared cache for `timeout` seconds.
+
+    The first request of a key claims it with an atomic add. A duplicate arriving while the first one is in
+    progress polls for its response for at most `wait_timeout` seconds; the claim expires after `lock_timeout`
+    seconds should its worker die. A request whose backend call timed out or failed leaves an UNKNOWN entry:
+    its duplicates are refused until it expires, the client has to look the operation status up.
+    """
+
+    def __init__(
+        self,
+        prefix="idempotency",
+        timeout=IDEMPOTENCY_KEY_TIMEOUT,
+        lock_timeout=IDEMPOTENCY_LOCK_TIMEOUT,
+        wait_timeout=IDEMPOTENCY_WAIT_TIMEOUT,
+        poll_interval=0.1,
+    ):
+        self.prefix = prefix
+        self.timeout = timeout
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+
+    def make_key(self, *parts):
+        return f"{self.prefix}_{hash_cache_key(*parts)}"
+
+    def claim(self, key, fingerprint):
+        """None when the caller owns the key and must serve the request, else the entry stored for the key."""
+        deadline = time.monotonic() + self.wait_timeout
+        try:
+            while True:
+                if cache.add(key, {"state": IN_PROGRESS, "fingerprint": fingerprint}, timeout=self.lock_timeout):
+                    return None
+                entry = cache.get(key)
+                if entry is not None and (entry["state"] != IN_PROGRESS or time.monotonic() >= deadline):
+                    return entry
+                if entry is not None:
+                    time.sleep(self.poll_interval)
+        except Exception as e:
+            logger.warning(f"Shared cache unavailable for {self.prefix}: {e}")
+            return None
+
+    async def aclaim(self, key, fingerprint):
+        deadline = time.monotonic() + self.wait_timeout
+        try:
+            while True:
+                if await cache.aadd(key, {"state": IN_PROGRESS, "fingerprint": fingerprint}, timeout=self.lock_timeout):
+                    return None
+                entry = await cache.aget(key)
+                if entry is not None and (entry["state"] != IN_PROGRESS or time.monotonic() >= deadline):
+                    return entry
+                if entry is not None:
+                    await asyncio.sleep(self.poll_interval)
+        except Exception as e:
+            logger.warning(f"Shared cache unavailable for {self.prefix}: {e}")
+            return None
+
+    def finish(self, key, fingerprint, response, upstream_called):
+        """Store the outcome of the request that claimed key, or release the key for a retry."""
+        state = outcome(response, upstream_called)
+        try:
+            if state is None:
+                cache.delete(key)
+            else:
+                cache.set(key, self._entry(state, fingerprint, response), timeout=self.timeout)
+        except Exception as e:
+            logger.warning(f"Failed to store the {self.prefix} response: {e}")
+
+    async def afinish(self, key, fingerprint, response, upstream_called):
+        state = outcome(response, upstream_called)
+        try:
+            if state is None:
+                await cache.adelete(key)
+            else:
+                await cache.aset(key, self._entry(state, fingerprint, response), timeout=self.timeout)
+        except Exception as e:
+            logger.warning(f"Failed to store the {self.prefix} response: {e}")
+
+    @staticmethod
+    def _entry(state, fingerprint, response):
+        return {
+            "state": state,
+            "fingerprint": fingerprint,
+            "status_code": response.status_code if response is not None else None,
+            "data": response.data if response is not None else None,
+        }
+
+    @staticmethod
+    def replay(entry, fingerprint):
+        if entry["fingerprint"] != fingerprint:
+            return Response(
+                {"success": False, "message": f"{IDEMPOTENCY_HEADER} already used for another request", "code": 1},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        if entry["state"] == IN_PROGRESS:
+            return Response(
+                {"success": False, "message": f"A request with this {IDEMPOTENCY_HEADER} is in progress", "code": 1},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if entry["state"] == UNKNOWN:
+            return Response(
+                {
+                    "success": False,
+                    "message": (
+                        f"The outcome of the request sent with this {IDEMPOTENCY_HEADER} is unknown, check the "
+                        "status of the operation before sending it again with another key"
+                    ),
+                    "code": 1,
+                    "result": entry["data"],
+                },
+                status=status.HTTP_409_CONFLICT,
+                headers={"Idempotent-Replayed": "true"},
+            )
+        return Response(entry["data"], status=entry["status_code"], headers={"Idempotent-Replayed": "true"})
+
+
+idempotency_store = IdempotencyStore()
@@ -1,6 +1,72 @@
-def extract_base64_image_data(value):
-    header_img, bare_img64 = value.split(",")
-    if header_img == "data:image/png;base64":
-        return bare_img64, "png", "image/png"
-    else:
-        return bare_img64, "jpg", "image/jpeg"
+import base64
+import io
+
+from PIL import Image, ImageOps
+
+from settings.settings import (
+    IMAGE_JPEG_QUALITY,
+    IMAGE_UPLOAD_MAX_PIXELS,
+    IMAGE_UPLOAD_MAX_SIZE,
+)
+
+# Pillow format -> (extension, content type) of the accepted images
+IMAGE_FORMATS = {"PNG": ("png", "image/png"), "JPEG": ("jpg", "image/jpeg")}
+IMAGE_SIGNATURES = (b"\x89PNG\r\n\x1a\n", b"\xff\xd8\xff")
+DECODE_CHUNK_SIZE = 64 * 1024  # base64 characters, a multiple of 4
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def decode_base64_image(bare_img64):
+    """
+    Decode a base64 png or jpeg chunk by chunk and check it, returns (image bytes, extension, content type).
+    Oversized payloads are refused before decoding anything and other file types after the first chunk. Only the
+    header of the image is parsed here, the pixels are decoded by the image upload worker.
+    """
+    if len(bare_img64) // 4 * 3 > IMAGE_UPLOAD_MAX_SIZE:
+        raise InvalidImage("Image too large")
+    image_bytes = bytearray()
+    for start in range(0, len(bare_img64), DECODE_CHUNK_SIZE):
+        try:
+            image_bytes += base64.b64decode(bare_img64[start : start + DECODE_CHUNK_SIZE], validate=True)
+        except ValueError as e:
+            raise InvalidImage("Invalid base64 image format") from e
+        if start == 0 and not image_bytes.startswith(IMAGE_SIGNATURES):
+            raise InvalidImage("Unsupported image type")
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            image_format, (width, height) = image.format, image.size
+    except Exception as e:
+        raise InvalidImage("Invalid image") from e
+    if image_format not in IMAGE_FORMATS:
+        raise InvalidImage("Unsupported image type")
+    if width * height > IMAGE_UPLOAD_MAX_PIXELS:
+        raise InvalidImage("Image too large")
+    extension, content_type = IMAGE_FORMATS[image_format]
+    return bytes(image_bytes), extension, content_type
+
+
+def render_image_variants(image_bytes, sizes, jpeg_quality=IMAGE_JPEG_QUALITY):
+    """
+    Downscale the image to fit each of `sizes` (longest side in pixels, never upscaled) and recompress it in its
+    own format. Returns {size: variant bytes}.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as original:
+        if original.format == "JPEG":
+            # Lets libjpeg decode a large photo directly at a fraction of its size
+            original.draft("RGB", (max(sizes), max(sizes)))
+        image_format = original.format
+        image = ImageOps.exif_transpose(original)
+        variants = {}
+        for size in sizes:
+            variant = image.copy()
+            variant.thumbnail((size, size), Image.LANCZOS)
+            output = io.BytesIO()
+            if image_format == "JPEG":
+                variant.convert("RGB").save(output, "JPEG", quality=jpeg_quality, optimize=True, progressive=True)
+            else:
+                variant.save(output, "PNG", optimize=True)
+            variants[size] = output.getvalue()
+    return variants
@@ -0,0 +1,116 @@
+import json
+import math
+import re
+
+import orjson
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import json as drf_json
+from rest_framework.utils.encoders import JSONEncoder
+
+_drf_encoder = JSONEncoder()
+# Datetimes are written by orjson, they keep their microseconds where DRF's encoder cuts them to milliseconds
+DUMPS_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+# orjson reads the integers out of the 64 bits range as floats (-2**63 - 1 has 19 digits), they are left to json
+BIG_NUMBER_PATTERN = re.compile(r"\d{19}")
+BIG_NUMBER_BYTES_PATTERN = re.compile(rb"\d{19}")
+# Deleting the digits, dots and minus signs of the output collapses its numbers, an exponent float leaves its "e"
+# right after the separator preceding it
+NUMBER_SEPARATORS = bytes.maketrans(b",[", b"::")
+NUMBER_CHARACTERS = b"0123456789.-"
+
+
+def _default(obj):
+    value = _drf_encoder.default(obj)
+    if isinstance(value, float) and not math.isfinite(value):
+        raise TypeError(f"Float {value!r} left to json")
+    return value
+
+
+def _has_float_formatted_apart(data):
+    """
+    True when orjson wrote a float that repr() formats differently: the exponents (1e16 for 1e+16) and the
+    decimals below 1e-4 (0.00001 for 1e-05). Strings holding the same text only cost a fallback to json.
+    """
+    if b"0.0000" in data:
+        return True
+    collapsed = data.translate(NUMBER_SEPARATORS, NUMBER_CHARACTERS)
+    return b":e" in collapsed or collapsed.startswith(b"e")
+
+
+def _orjson_dumps(obj):
+    """orjson bytes of obj, None when they would differ from json's."""
+    try:
+        data = orjson.dumps(obj, default=_default, option=DUMPS_OPTIONS)
+    except orjson.JSONEncodeError:
+        # Integers beyond 64 bits and the values that DRF's encoder rejects, json gives the same result or error
+        return None
+    if _has_float_formatted_apart(data):
+        return None
+    return data
+
+
+def dumps(obj):
+    """
+    Serialize obj to compact utf-8 JSON bytes, the same bytes as `json.dumps(obj, cls=JSONEncoder,
+    ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode()`: Decimal, UUID, lazy strings... are
+    encoded by DRF's JSONEncoder, datetimes keep their microseconds. The payloads holding a float that orjson
+    formats differently (exponents) are serialized by json, float keys keep orjson's format. NaN and Infinity
+    Decimals raise the ValueError of JSONRenderer, loads never returns such a float that orjson would write as null.
+    """
+    data = _orjson_dumps(obj)
+    if data is None:
+        return json.dumps(obj, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode()
+    return data
+
+
+def loads(data, parse_constant=drf_json.strict_constant):
+    """
+    Deserialize JSON bytes or str, NaN and Infinity raise the ValueError of DRF's strict parser unless another
+    parse_constant is given. What orjson refuses or may misread (big integers, utf-16...) is left to json.
+    """
+    pattern = BIG_NUMBER_PATTERN if isinstance(data, str) else BIG_NUMBER_BYTES_PATTERN
+    if pattern.search(data):
+        return json.loads(data, parse_constant=parse_constant)
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return json.loads(data, parse_constant=parse_constant)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer producing the same bytes through orjson (datetimes keep their microseconds), for the compact and
+    non indented responses.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        renderer_context = renderer_context or {}
+        if self.ensure_ascii or not self.compact or self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+        rendered = _orjson_dumps(data)
+        if rendered is None:
+            # Same output or error as JSONRenderer, which refuses NaN and Infinity
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escaped by JSONRenderer so that the output stays a strict javascript subset
+        return rendered.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        parse_constant = drf_json.strict_constant if self.strict else None
+        try:
+            data = stream.read()
+            if encoding.lower().replace("-", "") != "utf8":
+                data = data.decode(encoding)
+            return loads(data, parse_constant=parse_constant)
+        except ValueError as exc:
+            raise ParseError("JSON parse error - %s" % str(exc))
@@ -1,11 +1,52 @@
 import logging
+import time
+from functools import lru_cache
 
 import jwt
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
 
-from settings.configs.jwt_config import BACKEND_JWT_PUBLIC_KEY
+from settings.configs.jwt_config import (
+    BACKEND_JWT_PUBLIC_KEY,
+    JWT_VERIFIED_TOKEN_CACHE_SIZE,
+    JWT_VERIFIED_TOKEN_CACHE_TIMEOUT,
+)
+from utils.cache_helper import LocalTTLCache, hash_cache_key
 
 logger = logging.getLogger(__name__)
 
+# Claims of the tokens whose signature was already verified, an entry never outlives the `exp` of its token
+verified_tokens_cache = LocalTTLCache(maxsize=JWT_VERIFIED_TOKEN_CACHE_SIZE, timeout=JWT_VERIFIED_TOKEN_CACHE_TIMEOUT)
+
+
+@lru_cache(maxsize=8)
+def load_public_key(public_key):
+    """Parse the PEM public key once, jwt.decode would parse it again on every call."""
+    try:
+        return load_pem_public_key(public_key)
+    except Exception as e:
+        logger.error(f"Invalid jwt public key: {e}")
+        return public_key
+
+
+# Preloaded at import, before the workers are forked
+load_public_key(BACKEND_JWT_PUBLIC_KEY)
+
+
+def decode_backend_token(token, public_key):
+    cache_key = hash_cache_key(public_key, token)
+    decoded = verified_tokens_cache.get(cache_key)
+    if decoded is not None:
+        if decoded["exp"] <= time.time():
+            raise jwt.ExpiredSignatureError("Signature has expired")
+        return decoded
+    decoded = jwt.decode(
+        token, load_public_key(public_key), options={"verify_exp": True, "require": ["exp"]}, algorithms=["ES256"]
+    )
+    verified_tokens_cache.set(
+        cache_key, decoded, timeout=min(JWT_VERIFIED_TOKEN_CACHE_TIMEOUT, decoded["exp"] - time.time())
+    )
+    return decoded
+
 
 def verify_backend_token(token, is_token_partner=False, public_key=BACKEND_JWT_PUBLIC_KEY):
     """
@@ -16,7 +57,7 @@ def verify_backend_token(token, is_token_partner=False, public_key=BACKEND_JWT_P
         - False, None : expired token or wrong format
     """
     try:
-        decoded = jwt.decode(token, public_key, options={"verify_exp": True, "require": ["exp"]}, algorithms=["ES256"])
+        decoded = decode_backend_token(token, public_key)
         if is_token_partner:
             assert decoded["type"] == "partner"
         return True, {key: val for key, val in decoded.items() if key not in ["exp", "iat", "type"]}
@@ -0,0 +1,38 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class LazyClient:
+    """
+    Builds a costly client (heavy imports, credentials, connection pools) on its first use instead of at import
+    time, so that worker boots, management commands and tests that never use it do not pay for it.
+
+    Like PooledSession, one client is built per process: a child forked after the parent built it builds its own.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # The lock may have been held by another thread at fork time, never reuse it in the child.
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+
+    def get(self):
+        pid = os.getpid()
+        if self._client is None or self._pid != pid:
+            with self._lock:
+                if self._client is None or self._pid != pid:
+                    logger.debug(f"Building {self.factory.__name__} client for process {pid}")
+                    self._client = self.factory()
+                    self._pid = pid
+        return self._client
@@ -0,0 +1,132 @@
+import contextvars
+import hmac
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from settings.settings import DEBUG, METRICS_AUTH_TOKEN
+
+# With PROMETHEUS_MULTIPROC_DIR set (see settings/gunicorn_config.py) every worker writes its samples to that
+# directory and /metrics aggregates the samples of all the workers, whichever worker answers the scrape
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Latency of the requests", ["view", "method"])
+REQUESTS = Counter("http_requests_total", "Requests answered", ["view", "method", "status"])
+DB_QUERIES = Histogram(
+    "http_request_db_queries", "Database queries per request", ["view"], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+BACKEND_LATENCY = Histogram("backend_request_duration_seconds", "Latency of the flouci backend calls", ["call"])
+BACKEND_RESPONSES = Counter("backend_responses_total", "Flouci backend calls by status code", ["call", "status"])
+BACKEND_TIMEOUTS = Counter("backend_timeouts_total", "Flouci backend calls that timed out", ["call"])
+THROTTLE_REJECTIONS = Counter("throttle_rejections_total", "Requests rejected by a throttle", ["scope"])
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total", "Cache lookups by result: local_hit, shared_hit or miss", ["cache", "result"]
+)
+# Exported by the reconcile_pending_operations command
+PENDING_OPERATIONS = Gauge(
+    "partner_stale_pending_operations",
+    "Partner operations still waiting for the data api webhook after the reconciliation delay",
+    multiprocess_mode="livemax",
+)
+PENDING_OPERATION_AGE = Gauge(
+    "partner_stale_pending_operation_age_seconds",
+    "Age of the oldest partner operation waiting for the data api webhook",
+    multiprocess_mode="livemax",
+)
+RECONCILED_OPERATIONS = Counter(
+    "partner_reconciled_operations_total", "Stale pending operations checked by the reconciler", ["result"]
+)
+
+HTTP_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+# Mutable counter of the request being served, shared with the threads its sync_to_async calls run in
+query_count = contextvars.ContextVar("query_count", default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    queries = query_count.get()
+    if queries is not None:
+        queries[0] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """connection_created receiver, a connection object is reused across reconnections."""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def observe_backend_call(call, response, duration):
+    BACKEND_LATENCY.labels(call).observe(duration)
+    status = response.get("status_code") if isinstance(response, dict) else None
+    BACKEND_RESPONSES.labels(call, str(status)).inc()
+
+
+class MetricsMiddleware:
+    """Records the latency, status and number of database queries of every request, labelled by url name."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        queries, start = [0], time.perf_counter()
+        token = query_count.set(queries)
+        try:
+            response = self.get_response(request)
+        finally:
+            query_count.reset(token)
+        self.observe(request, response, time.perf_counter() - start, queries[0])
+        return response
+
+    async def __acall__(self, request):
+        queries, start = [0], time.perf_counter()
+        token = query_count.set(queries)
+        try:
+            response = await self.get_response(request)
+        finally:
+            query_count.reset(token)
+        self.observe(request, response, time.perf_counter() - start, queries[0])
+        return response
+
+    @staticmethod
+    def observe(request, response, duration, queries):
+        # Unresolved paths and unknown methods share one label, scanners must not create a time series per url
+        view = request.resolver_match.view_name if getattr(request, "resolver_match", None) else "unresolved"
+        method = request.method if request.method in HTTP_METHODS else "other"
+        REQUEST_LATENCY.labels(view, method).observe(duration)
+        REQUESTS.labels(view, method, str(response.status_code)).inc()
+        DB_QUERIES.labels(view).observe(queries)
+
+
+def metrics_view(request):
+    if METRICS_AUTH_TOKEN:
+        authorized = hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_AUTH_TOKEN}")
+    else:
+        # Without a token the samples are only served in development
+        authorized = DEBUG
+    if not authorized:
+        return HttpResponse(status=403)
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
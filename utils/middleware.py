@@ -0,0 +1,54 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.exception import convert_exception_to_response
+from django.utils.module_loading import import_string
+
+
+def build_middleware_chain(middleware_paths, get_response, is_async):
+    """Wrap get_response in the given middlewares the way django's handler does for settings.MIDDLEWARE."""
+    adapter = BaseHandler()
+    handler, handler_is_async = get_response, is_async
+    for middleware_path in reversed(middleware_paths):
+        middleware = import_string(middleware_path)
+        middleware_can_sync = getattr(middleware, "sync_capable", True)
+        middleware_can_async = getattr(middleware, "async_capable", False)
+        if not middleware_can_sync and not middleware_can_async:
+            raise ImproperlyConfigured(
+                f"Middleware {middleware_path} must have at least one of sync_capable/async_capable"
+            )
+        middleware_is_async = middleware_can_async if handler_is_async or not middleware_can_sync else False
+        adapted_handler = adapter.adapt_method_mode(
+            middleware_is_async, handler, handler_is_async, debug=settings.DEBUG, name=f"middleware {middleware_path}"
+        )
+        handler = convert_exception_to_response(middleware(adapted_handler))
+        handler_is_async = middleware_is_async
+    return adapter.adapt_method_mode(is_async, handler, handler_is_async)
+
+
+class PathRoutedMiddleware:
+    """
+    Runs settings.BROWSER_MIDDLEWARE (sessions, csrf, auth, messages, otp...) for the browser facing routes only.
+
+    The routes under settings.API_PATH_PREFIXES are authenticated by their permission classes and use neither
+    sessions nor cookies, they skip that stack. Under ASGI they also avoid the thread hop that the sync-only
+    OTPMiddleware forces on every request.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.api_path_prefixes = tuple(settings.API_PATH_PREFIXES)
+        self.browser_handler = build_middleware_chain(
+            settings.BROWSER_MIDDLEWARE, get_response, iscoroutinefunction(get_response)
+        )
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if request.path_info.startswith(self.api_path_prefixes):
+            return self.get_response(request)
+        return self.browser_handler(request)
@@ -1,5 +1,18 @@
+import base64
+import json
 from urllib.parse import urlencode
 
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    BasePagination,
+    PageNumberPagination,
+    _positive_int,
+)
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
 
 def generate_pagination_headers(base_url, page, size, total_count):
     """
@@ -31,3 +44,158 @@ def generate_pagination_headers(base_url, page, size, total_count):
     headers["Link"] = ", ".join(link)
 
     return headers
+
+
+class SizedPageNumberPagination(PageNumberPagination):
+    """
+    Page number pagination whose page size is read, per request, from the `size` query parameter, or from
+    `page_size` as the history endpoints used to.
+    """
+
+    page_size = 10
+    page_size_query_param = "size"
+    legacy_page_size_query_param = "page_size"
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        for query_param in (self.page_size_query_param, self.legacy_page_size_query_param):
+            if query_param in request.query_params:
+                try:
+                    return _positive_int(request.query_params[query_param], strict=True, cutoff=self.max_page_size)
+                except ValueError:
+                    break
+        return self.page_size
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on (time_created, id), both descending.
+
+    Each page is fetched with a `WHERE (time_created, id) < cursor` condition instead of an OFFSET, so deep pages cost
+    as much as the first one. The total count is only computed when `with_count=true` is given.
+    The cursor is opaque to the clients: a base64 encoded json of the boundary row and the paging direction.
+    """
+
+    page_size = 10
+    page_size_query_param = "size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    count_query_param = "with_count"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.count = queryset.count() if self.should_count(request) else None
+        position, reverse = self.decode_cursor(request)
+
+        if reverse:
+            queryset = queryset.order_by("time_created", "id")
+            if position:
+                queryset = queryset.filter(
+                    Q(time_created__gt=position[0]) | Q(time_created=position[0], id__gt=position[1])
+                )
+        else:
+            queryset = queryset.order_by("-time_created", "-id")
+            if position:
+                queryset = queryset.filter(
+                    Q(time_created__lt=position[0]) | Q(time_created=position[0], id__lt=position[1])
+                )
+
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def should_count(self, request):
+        return request.query_params.get(self.count_query_param, "").lower() in ("1", "true")
+
+    def decode_cursor(self, request):
+        """Return ((time_created, id), reverse) or (None, False) on the first page."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            time_created = parse_datetime(cursor["t"])
+            if time_created is None:
+                raise ValueError(cursor["t"])
+            return (time_created, int(cursor["i"])), bool(cursor.get("r"))
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse):
+        cursor = {"t": instance.time_created.isoformat(), "i": instance.id}
+        if reverse:
+            cursor["r"] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor, separators=(",", ":")).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        response_data = {"next": self.get_next_link(), "previous": self.get_previous_link(), "results": data}
+        if self.count is not None:
+            response_data = {"count": self.count, **response_data}
+        return Response(response_data)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "count": {"type": "integer", "example": 123},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "The pagination cursor value.",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Number of results to return per page.",
+                "schema": {"type": "integer"},
+            },
+            {
+                "name": self.count_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Include the total count of results.",
+                "schema": {"type": "boolean"},
+            },
+        ]
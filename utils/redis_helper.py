@@ -0,0 +1,17 @@
+import logging
+
+from settings.settings import REDIS_ENABLED
+
+logger = logging.getLogger(__name__)
+
+
+def get_redis_client():
+    """
+    Raw redis client behind the default django cache, None when redis is disabled.
+    Use it only for operations the django cache api cannot express atomically (scripts, pub/sub...).
+    """
+    if not REDIS_ENABLED:
+        return None
+    from django_redis import get_redis_connection
+
+    return get_redis_connection("default")
@@ -0,0 +1,100 @@
+import asyncio
+import copy
+import logging
+import time
+import weakref
+
+from django.core.cache import cache
+
+from utils.cache_helper import hash_cache_key
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent upstream calls, across workers.
+
+    The first caller (the leader) takes a lock in the shared cache, performs the call and publishes its result for
+    `result_timeout` seconds. The callers of other workers poll for that result for at most `wait_timeout` seconds
+    before calling upstream themselves, the callers of the same event loop simply await the leader.
+    """
+
+    def __init__(self, prefix, result_timeout=1, wait_timeout=5, lock_timeout=10, poll_interval=0.05):
+        self.prefix = prefix
+        self.result_timeout = result_timeout
+        self.wait_timeout = wait_timeout
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._calls = weakref.WeakKeyDictionary()  # event loop -> {key: future of the call in flight}
+
+    async def do(self, key_parts, call):
+        """Return the result of `await call()`, shared by every caller using the same key_parts."""
+        key = hash_cache_key(self.prefix, *key_parts)
+        loop = asyncio.get_running_loop()
+        calls = self._calls.setdefault(loop, {})
+        future = calls.get(key)
+        if future is not None:
+            return copy.copy(await asyncio.shield(future))
+        future = calls[key] = loop.create_future()
+        try:
+            result = await self._shared_call(key, call)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # the waiters get it, do not warn when there are none
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            calls.pop(key, None)
+        return result
+
+    async def _shared_call(self, key, call):
+        result_key = f"single_flight_result_{key}"
+        lock_key = f"single_flight_lock_{key}"
+        try:
+            result = await cache.aget(result_key)
+            if result is not None:
+                return result
+            is_leader = await cache.aadd(lock_key, 1, timeout=self.lock_timeout)
+        except Exception as e:
+            logger.warning(f"Shared cache unavailable for {self.prefix} single flight: {e}")
+            return await call()
+
+        if is_leader:
+            try:
+                result = await call()
+                await self._publish(result_key, result)
+            finally:
+                await self._release(lock_key)
+            return result
+
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                shared = await cache.aget_many([result_key, lock_key])
+            except Exception as e:
+                logger.warning(f"Shared cache unavailable for {self.prefix} single flight: {e}")
+                break
+            if result_key in shared:
+                return shared[result_key]
+            if lock_key not in shared:
+                break  # the leader failed without publishing a result
+        logger.warning(f"No shared result for {self.prefix}, calling upstream")
+        return await call()
+
+    async def _publish(self, result_key, result):
+        try:
+            await cache.aset(result_key, result, timeout=self.result_timeout)
+        except Exception as e:
+            logger.warning(f"Failed to share the {self.prefix} result: {e}")
+
+    async def _release(self, lock_key):
+        try:
+            await cache.adelete(lock_key)
+        except Exception as e:
+            logger.warning(f"Failed to release the {self.prefix} single flight lock: {e}")
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.redis_helper import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "status_events:"
+
+
+class Subscription:
+    def __init__(self, channel):
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    def deliver(self, payload):
+        """Called from any thread."""
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, payload)
+
+    async def get(self, timeout):
+        """Next event published on the channel, None if none came within `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class StatusEventHub:
+    """
+    Fans status events out to the requests waiting for them.
+
+    With redis, events are published on a pub/sub channel and every worker process runs a single listener thread
+    that hands them to its local subscribers. Without redis, events only reach the subscribers of the publishing
+    process.
+    """
+
+    RECONNECT_DELAY = 1
+
+    def __init__(self):
+        self._subscriptions = {}  # channel -> set of Subscription
+        self._lock = threading.Lock()
+        self._listener_pid = None
+
+    def publish(self, channel, payload):
+        client = get_redis_client()
+        if client is None:
+            self._dispatch(channel, payload)
+            return
+        try:
+            client.publish(CHANNEL_PREFIX + channel, json.dumps(payload))
+        except Exception as e:
+            logger.warning(f"Failed to publish status event on {channel}: {e}")
+
+    @contextmanager
+    def subscribe(self, channel):
+        """Receive the events published on channel while the context is open, from within an event loop."""
+        self._ensure_listener()
+        subscription = Subscription(channel)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                subscriptions = self._subscriptions.get(channel, set())
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    self._subscriptions.pop(channel, None)
+
+    def _dispatch(self, channel, payload):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.deliver(payload)
+            except RuntimeError:
+                pass  # the loop of the subscriber is closed
+
+    def _ensure_listener(self):
+        # Threads do not survive a fork, a forked worker starts its own listener
+        if self._listener_pid == os.getpid() or get_redis_client() is None:
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+        threading.Thread(target=self._listen, name="status-events", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(CHANNEL_PREFIX + "*")
+                for message in pubsub.listen():
+                    channel = message["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode()
+                    self._dispatch(channel[len(CHANNEL_PREFIX) :], json.loads(message["data"]))
+            except Exception as e:
+                logger.error(f"Status events listener disconnected: {e}")
+                time.sleep(self.RECONNECT_DELAY)
+
+
+status_events = StatusEventHub()
@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+
+from settings.settings import REDIS_ENABLED
+from utils.redis_helper import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class ThrottleModes:
+    FIXED_WINDOW = "fixed_window"  # at most `limit` requests per window, counter reset at the end of the window
+    SLIDING_WINDOW = "sliding_window"  # at most `limit` requests in any `window` long interval
+    TOKEN_BUCKET = "token_bucket"  # bursts of up to `limit` requests, refilled at `limit` tokens per window
+
+
+# Every script returns {allowed (0|1), milliseconds to wait before the next allowed request}
+FIXED_WINDOW_SCRIPT = """
+local current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+if current > tonumber(ARGV[1]) then
+    local ttl = redis.call('PTTL', KEYS[1])
+    if ttl < 0 then
+        redis.call('PEXPIRE', KEYS[1], ARGV[2])
+        ttl = tonumber(ARGV[2])
+    end
+    return {0, ttl}
+end
+return {1, 0}
+"""
+
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+if redis.call('ZCARD', KEYS[1]) < limit then
+    redis.call('ZADD', KEYS[1], now, ARGV[3])
+    redis.call('PEXPIRE', KEYS[1], window)
+    return {1, 0}
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return {0, math.max(1, tonumber(oldest[2]) + window - now)}
+"""
+
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1])
+local last = tonumber(bucket[2])
+if tokens == nil or last == nil then
+    tokens = capacity
+    last = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - last) * capacity / window)
+local allowed = 0
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    wait = math.ceil((1 - tokens) * window / capacity)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], window)
+return {allowed, wait}
+"""
+
+
+class BaseThrottleEngine:
+    def hit(self, key, mode, limit, window_seconds):
+        """
+        Record a request on `key` and decide, atomically, whether it is allowed.
+        Returns (allowed, seconds to wait before the next request would be allowed).
+        """
+        raise NotImplementedError("Please Implement this method")
+
+
+class RedisThrottleEngine(BaseThrottleEngine):
+    """Check-and-set done in one round trip, atomic across every worker sharing the redis instance."""
+
+    SCRIPTS = {
+        ThrottleModes.FIXED_WINDOW: FIXED_WINDOW_SCRIPT,
+        ThrottleModes.SLIDING_WINDOW: SLIDING_WINDOW_SCRIPT,
+        ThrottleModes.TOKEN_BUCKET: TOKEN_BUCKET_SCRIPT,
+    }
+
+    def __init__(self, client):
+        self.client = client
+        self.scripts = {mode: client.register_script(script) for mode, script in self.SCRIPTS.items()}
+
+    def hit(self, key, mode, limit, window_seconds):
+        window_ms = max(1, int(window_seconds * 1000))
+        if mode == ThrottleModes.FIXED_WINDOW and limit == 1:
+            # The most common case (one identical request per window) does not need a script
+            if self.client.set(key, 1, nx=True, px=window_ms):
+                return True, 0
+            return False, max(self.client.pttl(key), 0) / 1000
+        if mode not in self.scripts:
+            raise ValueError(f"Unknown throttle mode {mode}")
+        allowed, wait_ms = self.scripts[mode](keys=[key], args=[limit, window_ms, uuid.uuid4().hex])
+        return bool(allowed), int(wait_ms) / 1000
+
+
+class LocalThrottleEngine(BaseThrottleEngine):
+    """In-memory equivalent of RedisThrottleEngine, only shared by the threads of the current process."""
+
+    PURGE_INTERVAL = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+        self._next_purge = time.monotonic() + self.PURGE_INTERVAL
+
+    def hit(self, key, mode, limit, window_seconds):
+        hit_method = {
+            ThrottleModes.FIXED_WINDOW: self._fixed_window,
+            ThrottleModes.SLIDING_WINDOW: self._sliding_window,
+            ThrottleModes.TOKEN_BUCKET: self._token_bucket,
+        }.get(mode)
+        if hit_method is None:
+            raise ValueError(f"Unknown throttle mode {mode}")
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            return hit_method(key, limit, window_seconds, now)
+
+    def _fixed_window(self, key, limit, window_seconds, now):
+        count, expires_at = self._state.get(key, (0, 0))
+        if expires_at <= now:
+            count, expires_at = 0, now + window_seconds
+        count += 1
+        self._state[key] = (count, expires_at)
+        if count > limit:
+            return False, expires_at - now
+        return True, 0
+
+    def _sliding_window(self, key, limit, window_seconds, now):
+        hits, _ = self._state.get(key, (deque(), 0))
+        while hits and hits[0] <= now - window_seconds:
+            hits.popleft()
+        self._state[key] = (hits, now + window_seconds)
+        if len(hits) < limit:
+            hits.append(now)
+            return True, 0
+        return False, hits[0] + window_seconds - now
+
+    def _token_bucket(self, key, limit, window_seconds, now):
+        (tokens, last), _ = self._state.get(key, ((limit, now), 0))
+        tokens = min(limit, tokens + (now - last) * limit / window_seconds)
+        allowed, wait = True, 0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            allowed, wait = False, (1 - tokens) * window_seconds / limit
+        self._state[key] = ((tokens, now), now + window_seconds)
+        return allowed, wait
+
+    def _purge(self, now):
+        if now < self._next_purge:
+            return
+        self._state = {key: value for key, value in self._state.items() if value[1] > now}
+        self._next_purge = now + self.PURGE_INTERVAL
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_throttle_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RedisThrottleEngine(get_redis_client()) if REDIS_ENABLED else LocalThrottleEngine()
+    return _engine
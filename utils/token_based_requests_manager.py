@@ -1,13 +1,31 @@
 import logging
+import os
+import threading
 import time
 
 import jwt
 import requests
+from django.core.cache import cache
+
+from utils.cache_helper import hash_cache_key
 
 logger = logging.getLogger(__name__)
 
 
 class TokenBasedRequests:
+    """
+    Requests authenticated with a token obtained from `authentication_url`.
+
+    The token is shared by every worker through the django cache, and only one caller at a time authenticates:
+    the threads of a process wait on a lock, the other processes wait for the token the winner stores in the cache.
+    A token entering its last `refresh_ahead` seconds is renewed in a background thread while it is still used.
+    """
+
+    EXPIRATION_MARGIN = 10  # a token is not used anymore this many seconds before its expiration
+    AUTHENTICATION_LOCK_TIMEOUT = 30
+    SHARED_TOKEN_WAIT = 5  # seconds a process waits for the token being fetched by another process
+    BACKGROUND_REFRESH_INTERVAL = 5  # minimum seconds between two background refresh attempts
+
     def __init__(
         self,
         authentication_url,
@@ -15,6 +33,7 @@ class TokenBasedRequests:
         headers=None,
         token_prefix="Bearer ",
         accepted_status_codes=None,
+        refresh_ahead=60,
     ):
         if accepted_status_codes is None:
             accepted_status_codes = [200, 201, 202, 203, 204]
@@ -25,7 +44,20 @@ class TokenBasedRequests:
         self.accepted_status_codes = accepted_status_codes
         self.token_prefix = token_prefix
         self.headers = headers
+        self.refresh_ahead = refresh_ahead
+        self.token = None
         self.token_expiration = None
+        cache_key = hash_cache_key(authentication_url, auth_credentials_dict.get("username"))
+        self.token_cache_key = f"authentication_token_{cache_key}"
+        self.lock_cache_key = f"authentication_lock_{cache_key}"
+        self._lock = threading.Lock()
+        self._next_background_refresh = 0
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # The lock may have been held by a refreshing thread at fork time, that thread does not exist in the child.
+        self._lock = threading.Lock()
 
     def post(self, endpoint_url, data, data_to_log_fields=None, extra_headers=None, timeout=None):
         """
@@ -72,6 +104,9 @@ class TokenBasedRequests:
             extra_headers = {}
         self.check_token()
         headers = dict(self.headers)
+        token = self.token
+        if token:
+            headers["Authorization"] = self.token_prefix + token
         headers.update(extra_headers)
         result = self.__call_requests(endpoint_url, data, method, headers, timeout)
         if result.status_code not in self.accepted_status_codes:
@@ -90,13 +125,14 @@ class TokenBasedRequests:
         return result
 
     def update_token(self):
+        """Authenticate and publish the new token to the other workers."""
         try:
             result = requests.post(self.authentication_url, verify=True, json=self.auth_credentials)
             if result.status_code == 200:
-                self.headers.update({"Authorization": self.token_prefix + str(result.json()["id_token"])})
-                self.token_expiration = jwt.decode(result.json()["id_token"], options={"verify_signature": False})[
-                    "exp"
-                ]
+                token = str(result.json()["id_token"])
+                expiration = jwt.decode(token, options={"verify_signature": False})["exp"]
+                self._set_token(token, expiration)
+                self._store_shared_token(token, expiration)
             else:
                 logger.error("getting Authentication token Failed for %s" % self.authentication_url)
         except Exception as e:
@@ -105,5 +141,82 @@ class TokenBasedRequests:
             )
 
     def check_token(self):
-        if not self.token_expiration or self.token_expiration < int(time.time()) + 10:
-            self.update_token()
+        if self._is_usable():
+            if self.token_expiration < time.time() + self.refresh_ahead:
+                self._refresh_in_background()
+            return
+        with self._lock:
+            # Another thread may have refreshed the token while this one was waiting for the lock
+            if self._is_usable() or self._load_shared_token():
+                return
+            self._refresh_shared_token(refresh_ahead=0)
+
+    def _is_usable(self, expiration=None):
+        expiration = self.token_expiration if expiration is None else expiration
+        return bool(expiration) and expiration > time.time() + self.EXPIRATION_MARGIN
+
+    def _set_token(self, token, expiration):
+        # The token is set before its expiration: a reader never pairs a new expiration with the old token
+        self.token = token
+        self.token_expiration = expiration
+
+    def _load_shared_token(self, refresh_ahead=0):
+        """Adopt the token of the shared cache if it is usable (for at least `refresh_ahead` more seconds)."""
+        try:
+            shared = cache.get(self.token_cache_key)
+        except Exception as e:
+            logger.warning(f"Shared cache unavailable for the authentication token: {e}")
+            return False
+        if not shared or not self._is_usable(shared["exp"] - refresh_ahead):
+            return False
+        self._set_token(shared["token"], shared["exp"])
+        return True
+
+    def _store_shared_token(self, token, expiration):
+        try:
+            cache.set(
+                self.token_cache_key,
+                {"token": token, "exp": expiration},
+                timeout=max(1, int(expiration - time.time()) - self.EXPIRATION_MARGIN),
+            )
+        except Exception as e:
+            logger.warning(f"Failed to share the authentication token: {e}")
+
+    def _refresh_shared_token(self, refresh_ahead):
+        """Authenticate if no other process is doing it, otherwise wait for the token it fetches."""
+        try:
+            acquired = cache.add(self.lock_cache_key, os.getpid(), timeout=self.AUTHENTICATION_LOCK_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Shared cache unavailable for the authentication lock: {e}")
+            acquired = True
+        if acquired:
+            try:
+                self.update_token()
+            finally:
+                try:
+                    cache.delete(self.lock_cache_key)
+                except Exception:
+                    pass
+            return
+        deadline = time.monotonic() + self.SHARED_TOKEN_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(0.1)
+            if self._load_shared_token(refresh_ahead=refresh_ahead):
+                return
+        logger.warning(f"No token shared for {self.authentication_url} in time, authenticating")
+        self.update_token()
+
+    def _refresh_in_background(self):
+        if time.monotonic() < self._next_background_refresh or not self._lock.acquire(blocking=False):
+            return  # already being refreshed, or a refresh just failed
+        self._next_background_refresh = time.monotonic() + self.BACKGROUND_REFRESH_INTERVAL
+
+        def refresh():
+            try:
+                # Another worker may already have renewed it
+                if not self._load_shared_token(refresh_ahead=self.refresh_ahead):
+                    self._refresh_shared_token(refresh_ahead=self.refresh_ahead)
+            finally:
+                self._lock.release()
+
+        threading.Thread(target=refresh, name="token-refresh", daemon=True).start()